@@ -0,0 +1,214 @@
+"""
+Seconds ring animations drawn from precomputed fixed point tables.
+
+The head of an animation sits at second + ms / 1000 on the ring, kept in
+1/SUBSTEPS of an LED. Each effect turns that into palette indexes with table
+lookups only. The palette holds the packed colors from the background to the
+foreground color, so drawing a frame is a handful of array stores without any
+color math.
+
+The effects, cheapest first:
+    tick   one LED per second, like the clock always did, needs one frame a second
+    fade   the LED cross-fades into the next one during the last fade_ms of the second
+    sweep  the head moves continuously, shared between the two LEDs it is between
+    comet  the sweep with a fading tail behind it
+
+Every frame reports how long it took with account(). When frames keep going
+over the budget the effect drops one step towards tick, and it climbs back
+once frames have fit comfortably for recover_ms.
+
+limit() caps the effect and the frame rate from outside, main.py does that
+for the time of day modes of power.py. The budget only ever moves the
+effect between tick and that cap.
+"""
+
+import array
+
+# An LED is split into this many positions, the fraction of a head position is 6 bits.
+# More than the frame rate, so every frame of a sweep moves the head
+SUBSTEPS = 64
+
+EFFECTS = ("tick", "fade", "sweep", "comet")
+TICK = 0
+FADE = 1
+SWEEP = 2
+COMET = 3
+
+
+class RingAnimation:
+    def __init__(
+        self,
+        ring,
+        effect="comet",
+        fps=50,
+        budget_us=None,
+        tail=8,
+        fade_ms=250,
+        levels=64,
+        over_frames=3,
+        recover_ms=5000,
+    ):
+        self.ring = ring
+        self.n = ring.num_leds
+        self.fps = fps
+        self.period_ms = 1000 // fps
+        # Half the frame period by default, the rest is left for the other tasks
+        if budget_us is None:
+            budget_us = self.period_ms * 500
+        self.budget_us = budget_us
+        self.over_frames = over_frames
+        self.recover_ms = recover_ms
+        self.fade_ms = fade_ms
+        self.tail = min(tail, self.n - 2)
+
+        # The configured effect and the one actually drawn, which is lower while over budget
+        self.effect = EFFECTS.index(effect)
+        self.level = self.effect
+        # The highest effect allowed by limit()
+        self.cap = COMET
+        # Frames over budget in a row, and ms of frames comfortably within it
+        self.over = 0
+        self.fit_ms = 0
+        # How often the effect was dropped because of the budget
+        self.drops = 0
+
+        top = levels - 1
+        # ramp[f]: palette index of an LED f substeps into a cross-fade
+        self.ramp = bytearray(
+            (f * top + SUBSTEPS // 2) // SUBSTEPS for f in range(SUBSTEPS + 1)
+        )
+        # tail[x]: palette index of a comet LED x substeps behind the head, falling off quadratically
+        span = (self.tail + 1) * SUBSTEPS
+        self.tail_table = bytearray(
+            (top * (span - x) * (span - x) + span * span // 2) // (span * span)
+            for x in range(span)
+        )
+
+        # Packed colors from the background (0) to the foreground (levels - 1), see colors()
+        self.levels = levels
+        self.palette = array.array("I", [0 for _ in range(levels)])
+        self.palette_key = None
+        # The ring needs a full redraw, otherwise only the LEDs drawn last frame are cleared
+        self.dirty = True
+        self.drawn_from = 0
+        self.drawn_count = 0
+
+    def set_effect(self, effect):
+        self.effect = EFFECTS.index(effect)
+        self.level = min(self.effect, self.cap)
+        self.over = 0
+        self.fit_ms = 0
+
+    # Draw at most effect at fps frames a second, until the next limit()
+    def limit(self, effect, fps):
+        self.cap = EFFECTS.index(effect)
+        self.fps = fps
+        self.period_ms = 1000 // fps
+        self.level = min(self.effect, self.cap)
+        self.over = 0
+        self.fit_ms = 0
+
+    # Something else drew on the ring, redraw all of it on the next frame
+    def invalidate(self):
+        self.dirty = True
+
+    # Set the foreground and background colors, the palette is only rebuilt when they,
+    # the brightness or the gamma change
+    def colors(self, red, green, blue, bg_red, bg_green, bg_blue):
+        ring = self.ring
+        key = (
+            ring.pack(red, green, blue),
+            ring.pack(bg_red, bg_green, bg_blue),
+            ring.brightnessvalue,
+            ring.gammavalue,
+        )
+        if key == self.palette_key:
+            return
+        top = self.levels - 1
+        for i in range(self.levels):
+            self.palette[i] = ring.pack(
+                bg_red + ((red - bg_red) * i + top // 2) // top,
+                bg_green + ((green - bg_green) * i + top // 2) // top,
+                bg_blue + ((blue - bg_blue) * i + top // 2) // top,
+            )
+        self.palette_key = key
+        self.dirty = True
+
+    # How long until the next frame is needed
+    def frame_ms(self):
+        if self.level == TICK:
+            return 1000
+        return self.period_ms
+
+    # Draw the ring for ms into the second
+    def render(self, second, ms):
+        n = self.n
+        pixels = self.ring.pixels
+        palette = self.palette
+        ramp = self.ramp
+
+        background = palette[0]
+        if self.dirty:
+            for i in range(n):
+                pixels[i] = background
+            self.dirty = False
+        else:
+            i = self.drawn_from
+            for _ in range(self.drawn_count):
+                pixels[i] = background
+                i += 1
+                if i == n:
+                    i = 0
+
+        level = self.level
+        if level == TICK:
+            f = 0
+        elif level == FADE:
+            start = 1000 - self.fade_ms
+            f = 0 if ms < start else (ms - start) * SUBSTEPS // self.fade_ms
+        else:
+            f = ms * SUBSTEPS // 1000
+        if f >= SUBSTEPS:
+            f = SUBSTEPS - 1
+
+        head = second % n
+        if level == COMET:
+            tail = self.tail_table
+            i = head
+            x = f
+            for _ in range(self.tail + 1):
+                pixels[i] = palette[tail[x]]
+                x += SUBSTEPS
+                i -= 1
+                if i < 0:
+                    i = n - 1
+            first = i + 1
+            count = self.tail + 2
+        else:
+            pixels[head] = palette[ramp[SUBSTEPS - f]]
+            first = head
+            count = 2
+        if f:
+            pixels[head + 1 if head + 1 < n else 0] = palette[ramp[f]]
+
+        self.drawn_from = first if first < n else 0
+        self.drawn_count = count
+
+    # Report how long the last frame took in us, lowers or raises the effect to fit the budget
+    def account(self, us):
+        if us > self.budget_us:
+            self.fit_ms = 0
+            self.over += 1
+            if self.over >= self.over_frames and self.level > TICK:
+                self.level -= 1
+                self.over = 0
+                self.drops += 1
+            return
+        self.over = 0
+        if us * 2 > self.budget_us:
+            self.fit_ms = 0
+            return
+        self.fit_ms += self.frame_ms()
+        if self.fit_ms >= self.recover_ms and self.level < min(self.effect, self.cap):
+            self.level += 1
+            self.fit_ms = 0
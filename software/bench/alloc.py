@@ -0,0 +1,149 @@
+"""
+Check that the per-frame ws2812b buffer operations, and the font blit,
+don't touch the heap.
+
+Runs on the clock itself, with ws2812b.py and font.py already on the board:
+
+    mpremote run bench/alloc.py
+
+Every operation runs once to warm up, then ROUNDS times with the GC off,
+and gc.mem_alloc() is compared before and after. Anything that allocates
+is reported with the bytes per call and the run ends with FAIL.
+"""
+
+import gc
+import sys
+
+if sys.implementation.name != "micropython":
+    print("This check needs gc.mem_alloc(), run it on the board with mpremote")
+    sys.exit(1)
+
+import font
+import ws2812b
+
+ROUNDS = 20
+
+strip = ws2812b.ws2812b(60, 0, 0, delay=0)
+strips = ws2812b.ws2812b_group((("ring", 60, 1, 2), ("digits", 68, 2, 3)), delay=0)
+ring = strips["ring"]
+
+# Bound up front, looking up a bound method allocates it on every call
+fill = strip.fill
+set_pixel = strip.set_pixel
+set_pixel_line = strip.set_pixel_line
+gradient = strip.set_pixel_line_gradient
+rotate_left = strip.rotate_left
+rotate_right = strip.rotate_right
+show = strip.show
+show_if_changed = strip.show_if_changed
+ring_fill = ring.fill
+group_show = strips.show
+group_show_if_changed = strips.show_if_changed
+
+blit = font.blit
+masks = font.text_masks("12:34")
+color = strip.pack(0, 10, 0)
+# A new position on every call, and never through so it keeps drawing
+text = font.ScrollingText(strip, "CEST 12:34", step_ms=1)
+text_render = text.render
+text.started = 0
+text_steps = len(text.masks) - text.blocks
+text_now = 0
+
+
+def op_fill():
+    fill(10, 0, 0)
+
+
+def op_set_pixel():
+    set_pixel(30, 0, 10, 0)
+
+
+def op_set_pixel_line():
+    set_pixel_line(5, 25, 0, 0, 10)
+
+
+def op_gradient():
+    gradient(0, 59, 255, 0, 0, 0, 0, 255)
+
+
+def op_rotate_left():
+    rotate_left(7)
+
+
+def op_rotate_right():
+    rotate_right(7)
+
+
+def op_show():
+    show()
+
+
+def op_show_if_changed():
+    show_if_changed()
+
+
+def op_blit():
+    blit(strip.pixels, masks, color, 0, 4)
+
+
+def op_scroll():
+    global text_now
+    text_now = (text_now + 1) % text_steps
+    text_render(text_now, color)
+
+
+def op_group_show():
+    ring_fill(0, 10, 0)
+    group_show()
+
+
+def op_group_show_if_changed():
+    group_show_if_changed()
+
+
+ops = (
+    ("fill", op_fill),
+    ("set_pixel", op_set_pixel),
+    ("set_pixel_line", op_set_pixel_line),
+    ("set_pixel_line_gradient", op_gradient),
+    ("rotate_left", op_rotate_left),
+    ("rotate_right", op_rotate_right),
+    ("show", op_show),
+    ("show_if_changed", op_show_if_changed),
+    ("group show", op_group_show),
+    ("group show_if_changed", op_group_show_if_changed),
+    ("font blit", op_blit),
+    ("ScrollingText render", op_scroll),
+)
+
+
+def measure(op):
+    op()
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.mem_alloc()
+        for _ in range(ROUNDS):
+            op()
+        after = gc.mem_alloc()
+    finally:
+        gc.enable()
+    return (after - before) // ROUNDS
+
+
+def main():
+    # The loop and the calls themselves, so it can be taken off every result
+    baseline = measure(lambda: None)
+    failed = 0
+    for name, op in ops:
+        allocated = measure(op) - baseline
+        if allocated > 0:
+            failed += 1
+        print(f"{name:24s} {allocated:6d} bytes per call {'FAIL' if allocated > 0 else 'ok'}")
+    print("FAIL" if failed else "OK, nothing allocates")
+    if failed:
+        sys.exit(1)
+
+
+main()
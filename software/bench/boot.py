@@ -0,0 +1,93 @@
+"""
+Boot cost of posix_tz: the lean module against the one with re and
+namedtuple it replaced, and on the host the time from boot to the first frame.
+
+For each module it reports how long the import took and how much heap it
+kept, then the same after set_tz() and the first localtime(), which is all
+main.py needs before it can render.
+
+The old module is kept as it was in bench/posix_tz_old.py. On the board,
+copy it over next to the new one (run it right after a reset, so re isn't
+imported yet):
+
+    mpremote cp posix_tz.py bench/posix_tz_old.py : + run bench/boot.py
+
+The time to the first frame on the board is part of the "stats" serial command.
+
+On the host, where main.py also boots on the simulator for the first
+frame (host heap and time, so only roughly what the board does):
+
+    python -m bench.boot
+"""
+
+import gc
+import sys
+import time
+
+MICROPYTHON = sys.implementation.name == "micropython"
+if not MICROPYTHON:
+    import os
+    import tracemalloc
+
+    import sim
+
+    sim.install()
+
+TZ = "CEST-1CET,M3.2.0/2:00:00,M11.1.0/2:00:00"
+
+
+def heap():
+    gc.collect()
+    if MICROPYTHON:
+        return gc.mem_alloc()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def measure(name):
+    """(import us, heap after import, import + set_tz + localtime us, heap after that)"""
+    sys.modules.pop(name, None)
+    before = heap()
+    start = time.ticks_us()
+    module = __import__(name)
+    imported_us = time.ticks_diff(time.ticks_us(), start)
+    imported = heap() - before
+    module.set_tz(TZ)
+    module.localtime()
+    ready_us = time.ticks_diff(time.ticks_us(), start)
+    ready = heap() - before
+    return imported_us, imported, ready_us, ready
+
+
+def old_module_path():
+    # posix_tz before the lean rewrite, kept next to this file. Last, so the other
+    # benches don't shadow the modules of the same name
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def first_frame():
+    """(host ms, simulated ms) from power on to the first frame on the strips"""
+    from sim.run import Simulation
+
+    start = time.perf_counter()
+    simulation = Simulation(1767225600)
+    while not simulation.cpu_us:
+        simulation.run(0.005)
+    return (time.perf_counter() - start) * 1000, simulation.clock.us / 1000
+
+
+def main():
+    if not MICROPYTHON:
+        tracemalloc.start()
+        old_module_path()
+    print(f"{'module':14s} {'import':>10s} {'heap':>8s} {'+ first localtime':>18s} {'heap':>8s}")
+    for name in ("posix_tz", "posix_tz_old"):
+        imported_us, imported, ready_us, ready = measure(name)
+        print(f"{name:14s} {imported_us:8d}us {imported:7d}B {ready_us:16d}us {ready:7d}B")
+    if not MICROPYTHON:
+        tracemalloc.stop()
+        host_ms, simulated_ms = first_frame()
+        print(f"Boot to first frame: {simulated_ms:.0f}ms simulated, {host_ms:.0f}ms on the host")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Frame latency with the frames on one core and on two, while the I2C bus and
+the serial console are kept busy.
+
+main.py boots on the simulator in real time, once as it is and once with
+dual_core, where the frames run on a thread like on the second core. The
+RTC sync runs every SYNC_INTERVAL seconds instead of every hour, and every
+sync holds the 4 kHz SoftI2C bus for a few hundred ms. The console gets a
+PING every PING_MS and a "stats" every STATS_MS.
+
+Latency is how long after its deadline a frame was on the strips: how late
+it started plus how long it took. Missed frames were skipped altogether.
+
+    python -m bench.cores
+    python -m bench.cores --seconds 60
+
+On the board, set dual_core in main.py and compare the "stats" output.
+"""
+
+import argparse
+
+import sim.run
+from sim.run import Simulation, percentile
+
+import perf
+import timeset
+
+# Midday, in day mode: the other modes of power.py cap the frame rate
+START = "2026-01-01T12:00:00"
+SYNC_INTERVAL = 2
+PING_MS = 20
+STATS_MS = 500
+
+
+def load(simulation):
+    main = simulation.main
+    main.first_sync_delay = 1
+    main.clock_sync.min_interval = main.clock_sync.max_interval = SYNC_INTERVAL
+    loop = simulation.loop
+    pings = [0]
+
+    def ping():
+        pings[0] += 1
+        simulation.console.feed(timeset.encode("PING", pings[0]))
+        if pings[0] % (STATS_MS // PING_MS) == 0:
+            simulation.console.feed("stats")
+        loop.call_later(PING_MS / 1000, ping)
+
+    loop.call_soon(ping)
+
+
+def run(dual_core, seconds):
+    """(per frame latency in us, the Simulation)"""
+    latencies = []
+    took = [0]
+    record = perf.record
+
+    # run_frame() records FRAME right before LATENESS
+    def record_latency(stage, us):
+        if stage == perf.FRAME:
+            took[0] = us
+        elif stage == perf.LATENESS:
+            latencies.append(us + took[0])
+        record(stage, us)
+
+    perf.record = record_latency
+    simulation = Simulation(sim.run.parse_start(START), dual_core=dual_core, realtime=True)
+    load(simulation)
+    try:
+        simulation.run(seconds)
+    finally:
+        simulation.close()
+        perf.record = record
+    return latencies, simulation
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20)
+    args = parser.parse_args()
+
+    print(f"{'mode':10s} {'frames':>7s} {'missed':>7s} {'late':>6s} {'p50':>8s} {'p99':>8s} {'max':>8s}  retries")
+    for dual_core in (False, True):
+        latencies, simulation = run(dual_core, args.seconds)
+        main = simulation.main
+        p50 = percentile(latencies, 0.5) / 1000
+        p99 = percentile(latencies, 0.99) / 1000
+        high = max(latencies) / 1000
+        print(
+            f"{'dual core' if dual_core else 'one core':10s} {main.frames_rendered:7d} {main.missed_frames:7d} "
+            f"{main.late_frames:6d} {p50:6.1f}ms {p99:6.1f}ms {high:6.1f}ms  {main.frames_in.retries}"
+        )
+    print(f"I2C sync every {SYNC_INTERVAL}s, PING every {PING_MS}ms, stats every {STATS_MS}ms, {args.seconds:.0f}s each")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Golden frames and render throughput over a whole simulated year.
+
+main.py is imported on the simulator and its real render path is driven
+directly, without the event loop: for every ZONES entry the clock jumps
+through YEAR in steps of STEP seconds, plus every second around each DST
+change, and at every stop render_frame() draws the first frame of the
+second and one from the middle of it. digits.pixels and ring.pixels are
+hashed after every frame, one digest per month and one per DST change, and
+compared against golden.txt. A wrong digit_to_led entry, a misplaced colon
+or dot, or a DST change an hour off shows up as the month or change that
+doesn't match. The frames go through the time of day modes of power.py as
+well, so the digests also cover the dimming and the ring of every mode.
+
+STEP isn't a divisor of 60, so the samples go through every second of the
+minute: the date and the time views and both colon states are all covered.
+
+It also reports how many frames a second the host renders, so a speedup
+can be checked for speed and for bit-exact output in one run.
+
+    python -m bench.golden
+    python -m bench.golden --update     # after an intended change of the output
+    python -m bench.golden --step 60    # other steps only measure, golden.txt is for STEP
+"""
+
+import argparse
+import calendar
+import hashlib
+import os
+import sys
+import time
+
+import posix_tz
+from sim.run import Simulation
+
+YEAR = 2026
+STEP = 599
+# Seconds rendered before and after every DST change
+AROUND_CHANGE = 3
+# main.py's default, Europe, North America, the southern hemisphere, half hour offsets, J rules
+ZONES = (
+    "CEST-1CET,M3.2.0/2:00:00,M11.1.0/2:00:00",
+    "CET-1CEST,M3.5.0,M10.5.0/3",
+    "EST5EDT,M3.2.0,M11.1.0",
+    "AEST-10AEDT,M10.1.0,M4.1.0/3",
+    "IST-5:30",
+    "XST3XDT,J60/2,J300/2",
+)
+GOLDEN = os.path.join(os.path.dirname(__file__), "golden.txt")
+
+
+class Renderer:
+    def __init__(self):
+        self.simulation = Simulation(calendar.timegm((YEAR, 1, 1, 0, 0, 0)))
+        self.main = self.simulation.main
+        self.frames = 0
+        # Host seconds spent in render_frame()
+        self.render_s = 0
+
+    def set_zone(self, tz):
+        main = self.main
+        main.tz_string = tz
+        posix_tz.set_tz(tz, YEAR)
+        return posix_tz.global_tzd
+
+    def render(self, t, digest):
+        """Draw the frames of second t and hash them into digest"""
+        main = self.main
+        self.simulation.clock.set_time(t)
+        main.second_edge = time.ticks_ms()
+        main.publish_state()
+        main.frames_in.read()
+        for new_second, ms in ((True, main.frame_margin_ms), (False, 510)):
+            # Frames are a frame time apart, or show() would spin on the virtual clock
+            # until the last one is off the wire
+            self.simulation.clock.advance(main.ring_animation.frame_ms() * 1000)
+            start = time.perf_counter()
+            main.render_frame(new_second, ms)
+            self.render_s += time.perf_counter() - start
+            self.frames += 1
+            digest.update(main.digits.pixels)
+            digest.update(main.ring.pixels)
+
+    def zone(self, tz, step):
+        """(period, digest) of tz over YEAR, a period is a month or a DST change"""
+        tzd = self.set_zone(tz)
+        results = []
+        for month in range(1, 13):
+            start = calendar.timegm((YEAR, month, 1, 0, 0, 0))
+            end = calendar.timegm((YEAR + month // 12, month % 12 + 1, 1, 0, 0, 0))
+            digest = hashlib.sha1()
+            for t in range(start, end, step):
+                self.render(t, digest)
+            results.append((f"{YEAR}-{month:02d}", digest.hexdigest()))
+        if tzd[posix_tz.START] is not None:
+            for change in posix_tz.year_changes(tzd, YEAR):
+                change = int(change)
+                digest = hashlib.sha1()
+                for t in range(change - AROUND_CHANGE, change + AROUND_CHANGE + 1):
+                    self.render(t, digest)
+                results.append((f"change {change}", digest.hexdigest()))
+        return results
+
+
+def load_golden():
+    golden = {}
+    with open(GOLDEN) as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            tz, period, digest = line.rstrip("\n").split("\t")
+            golden[(tz, period)] = digest
+    return golden
+
+
+def save_golden(results):
+    with open(GOLDEN, "w") as f:
+        f.write("# zone, month or DST change, SHA-1 of the frames. Written by python -m bench.golden --update\n")
+        for tz, period, digest in results:
+            f.write(f"{tz}\t{period}\t{digest}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--step", type=int, default=STEP, help="seconds between the rendered seconds")
+    parser.add_argument("--update", action="store_true", help="write golden.txt from this run")
+    args = parser.parse_args()
+    check = args.step == STEP
+    if args.update and not check:
+        parser.error(f"golden.txt is for --step {STEP}")
+
+    renderer = Renderer()
+    golden = load_golden() if check and not args.update else {}
+    results = []
+    mismatches = 0
+    for tz in ZONES:
+        frames = renderer.frames
+        render_s = renderer.render_s
+        for period, digest in renderer.zone(tz, args.step):
+            results.append((tz, period, digest))
+            if check and not args.update and golden.get((tz, period)) != digest:
+                mismatches += 1
+                print(f"MISMATCH {tz} {period}")
+        frames = renderer.frames - frames
+        fps = frames / (renderer.render_s - render_s)
+        print(f"{tz:42s} {frames:7d} frames {fps:8.0f} frames/s")
+    print(f"Total {renderer.frames} frames, {renderer.frames / renderer.render_s:.0f} frames/s in render_frame()")
+
+    if args.update:
+        save_golden(results)
+        print(f"Wrote {len(results)} digests to {GOLDEN}")
+    elif check:
+        print(f"{len(results) - mismatches} of {len(results)} digests match golden.txt")
+        if mismatches:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
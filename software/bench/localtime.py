@@ -0,0 +1,115 @@
+"""
+Batch conversion of ten million timestamps with posix_tz_batch.utc_offsets()
+and localtime_many(), against posix_tz.localtime() one timestamp at a time.
+
+The timestamps are random over 2000-2040, the way a pile of device logs
+looks after it was merged. With NumPy the batch functions get a NumPy
+array, the pure Python path gets an array("q") like on the clock, and is
+timed on fewer timestamps since it runs per value. Every path is checked
+against localtime() on a sample, and localtime() against zoneinfo with
+--zone, the zone --tz is the TZ string of.
+
+    python -m bench.localtime
+    python -m bench.localtime --count 1000000 --pure 100000
+"""
+
+import argparse
+import array
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+# posix_tz has to give the same on any host as on the clock, where there is no local time
+# zone. Run on one that isn't UTC, so anything that depends on it shows up as a mismatch
+os.environ["TZ"] = "America/New_York"
+time.tzset()
+
+import zoneinfo  # noqa: E402
+
+import posix_tz  # noqa: E402
+import posix_tz_batch  # noqa: E402
+
+TZ = "CET-1CEST,M3.5.0,M10.5.0/3"
+ZONE = "Europe/Berlin"
+FIRST = 946684800  # 2000-01-01
+LAST = 2208988800  # 2040-01-01
+# Timestamps compared with localtime()
+CHECK = 10000
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def line(label, count, seconds):
+    print(f"{label:34s} {count:9d} {seconds * 1e9 / count:9.1f}ns {count / seconds / 1e6:8.2f}M/s")
+
+
+def check(label, times, fields, tzd, zone):
+    for k in range(0, len(times), max(1, len(times) // CHECK)):
+        n = int(times[k])
+        expected = tuple(posix_tz.localtime(n, tzd))[:8]
+        got = tuple(int(field[k]) for field in fields)
+        if got != expected:
+            print(f"{label}: {n} gave {got}, localtime() {expected}")
+            return False
+        theirs = tuple(datetime.fromtimestamp(n, zone).timetuple())[:8]
+        if expected != theirs:
+            print(f"{label}: localtime() gave {expected} for {n}, zoneinfo {theirs}")
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10000000, help="timestamps for the NumPy path")
+    parser.add_argument("--pure", type=int, default=1000000, help="timestamps for the pure Python path")
+    parser.add_argument("--tz", default=TZ)
+    parser.add_argument("--zone", default=ZONE, help="zoneinfo zone to check --tz against")
+    args = parser.parse_args()
+    tzd = posix_tz.get_zone(args.tz)
+    zone = zoneinfo.ZoneInfo(args.zone)
+    random.seed(1)
+    ok = True
+
+    print(f"{'':34s} {'count':>9s} {'per value':>11s} {'rate':>10s}")
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        times = numpy.random.default_rng(1).integers(FIRST, LAST, args.count, dtype=numpy.int64)
+        offsets, seconds = timed(posix_tz_batch.utc_offsets, times, tzd)
+        line("utc_offsets, NumPy", args.count, seconds)
+        fields, seconds = timed(posix_tz_batch.localtime_many, times, tzd)
+        line("localtime_many, NumPy", args.count, seconds)
+        ok = check("NumPy", times, fields, tzd, zone) and ok
+    else:
+        print("No NumPy, only the pure Python path")
+
+    times = array.array("q", [random.randrange(FIRST, LAST) for _ in range(args.pure)])
+    offsets, seconds = timed(posix_tz_batch.utc_offsets, times, tzd)
+    line("utc_offsets, array('q')", args.pure, seconds)
+    fields, seconds = timed(posix_tz_batch.localtime_many, times, tzd)
+    line("localtime_many, array('q')", args.pure, seconds)
+    ok = check("array('q')", times, fields, tzd, zone) and ok
+
+    # One at a time, like before the batch functions
+    sample = times[: max(1, args.pure // 10)]
+    localtime = posix_tz.localtime
+    start = time.perf_counter()
+    for n in sample:
+        localtime(n, tzd)
+    line("localtime() per value", len(sample), time.perf_counter() - start)
+
+    print("All paths agree with localtime()" if ok else "MISMATCH")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# https://github.com/clach04/py-posix_tz
+# NOTE short names for space reasons
+"""
+time.time() is int on esp32 Micropython, float in CPython
+time.localtime() is tuple in Micropython, struct/class/namedtuple in CPython (3.x) with different attributes
+"""
+
+from collections import namedtuple
+import re
+import time
+
+
+global_tzd = None  # or UTC
+
+# Transition rules, times are seconds after local midnight and may be negative or past 24h
+m_tuple = namedtuple('m', ('month', 'occur', 'day', 'time'))  # Mm.n.d
+j_tuple = namedtuple('j', ('day', 'leap', 'time'))  # Jn (leap False, 1-365) or n (leap True, 0-365)
+
+
+def parse_hms(s):
+    """[+-]hh[:mm[:ss]] to seconds"""
+    sign = 1
+    if s[0] in '+-':
+        sign = -1 if s[0] == '-' else 1
+        s = s[1:]
+    parts = s.split(':')
+    if not 1 <= len(parts) <= 3:
+        raise ValueError('invalid time %r' % s)
+    secs = 0
+    for part in parts:
+        secs = secs * 60 + int(part)
+    for _ in range(3 - len(parts)):
+        secs *= 60
+    return sign * secs
+
+
+def parse_mstr(s):
+    """Parse a DST start/end rule: Mm.n.d, Jn or n, each with an optional /time (default 2:00:00)"""
+    ss = s.split('/')
+    if len(ss) > 2 or not ss[0]:
+        raise ValueError('invalid rule %r' % s)
+    t = parse_hms(ss[1]) if len(ss) == 2 else 2 * 60 * 60
+    m = ss[0]
+    if m[0] == 'M':
+        month, occur, day = map(int, m[1:].split('.'))
+        if not (1 <= month <= 12 and 1 <= occur <= 5 and 0 <= day <= 6):
+            raise ValueError('invalid rule %r' % s)
+        return m_tuple(month, occur, day, t)
+    if m[0] == 'J':
+        day = int(m[1:])
+        if not 1 <= day <= 365:
+            raise ValueError('invalid rule %r' % s)
+        return j_tuple(day, False, t)
+    day = int(m)
+    if not 0 <= day <= 365:
+        raise ValueError('invalid rule %r' % s)
+    return j_tuple(day, True, t)
+
+
+# std offset [dst [offset]], names are 3+ letters or <quoted> (e.g. <+03>)
+name_re = r"([A-Za-z][A-Za-z][A-Za-z]+|<[^>]+>)"
+offset_re = r"([+-]?\d+(?::\d+)?(?::\d+)?)"
+name_offset_re = re.compile("^" + name_re + offset_re + "(?:" + name_re + offset_re + "?)?$")
+# timezone details tuple
+tzd_tuple = namedtuple('tzd', ('name', 'offset', 'dst_name', 'start', 'end', 'dst_offset'))  # offsets are seconds
+# Used when a DST name is given without rules, same as glibc
+default_rules = 'M3.2.0,M11.1.0'
+
+
+def parse_tz(s):
+    ss = s.split(',')
+    x = re.match(name_offset_re, ss[0])
+    if not x:
+        if len(ss) == 1 and s.isalpha():
+            # just a name, e.g. UTC
+            return tzd_tuple(s, 0, None, None, None, None)
+        raise ValueError('invalid TZ %r' % s)
+    tzname, std_offset, dst_name, dst_offset = x.group(1), x.group(2), x.group(3), x.group(4)  # micropython has no groups()
+    tzname = tzname.strip('<>')
+    # POSIX offsets are hours west of UTC, ours are seconds east
+    timezone = -parse_hms(std_offset)
+    if dst_name is None:
+        if len(ss) != 1:
+            raise ValueError('rules without DST name in TZ %r' % s)
+        # no DST
+        return tzd_tuple(tzname, timezone, None, None, None, None)
+
+    dst_timezone = -parse_hms(dst_offset) if dst_offset else timezone + 1 * 60 * 60
+    if len(ss) == 1:
+        ss = [ss[0]] + default_rules.split(',')
+    if len(ss) != 3:
+        raise ValueError('invalid TZ %r' % s)
+    return tzd_tuple(tzname, timezone, dst_name.strip('<>'), parse_mstr(ss[1]), parse_mstr(ss[2]), dst_timezone)
+
+
+# TZ string -> tzd, so resyncs don't parse the same string again. Cleared when full.
+ZONE_CACHE_SIZE = 8
+_zone_cache = {}
+def get_zone(s):
+    try:
+        return _zone_cache[s]
+    except KeyError:
+        if len(_zone_cache) >= ZONE_CACHE_SIZE:
+            _zone_cache.clear()
+        tzd = _zone_cache[s] = parse_tz(s)
+        return tzd
+
+def determine_change(p, year, offset):
+    """
+    Mm.n.d format, where:
+
+        Mm (1-12) for 12 months
+        n (1-5) 1 for the first week and 5 for the last week in the month
+        d (0-6) 0 for Sunday and 6 for Saturday
+
+    For example:
+        PST8PDT,M3.2.0/2:00:00,M11.1.0/2:00:00
+    
+      * PST8PDT
+      * M3.2.0/2:00:00
+          * 3 - March
+          * 2 - 2nd week
+          * 0 - Sunday
+          * 2:00:00 - 2am
+      * M11.1.0/2:00:00
+
+    Jn (1-365) and n (0-365) Julian day formats, Jn never counts February 29th, n does.
+
+    offset - offsets are seconds
+    """
+    leap = (((year % 4) == 0) and ((year % 100) != 0)) or (year % 400) == 0
+
+    if isinstance(p, j_tuple):
+        yday = p.day if p.leap else p.day - 1
+        if not p.leap and leap and p.day >= 60:
+            yday += 1
+        month, dom = 1, 1 + yday  # mktime normalises the day into the right month
+    else:
+        month, occur, day = p.month, p.occur, p.day
+        month_days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+        if leap:
+            month_days[1] = 29
+
+        # Gauss date algo, determine day of week for first day of the month
+        d = 1
+        x = year - ((14 - month) // 12)
+        y = (x + (x // 4)) - ((x // 100)) + ((x // 400))
+        z = month + 12 * ((((14 - month)) // 12)) - 2;
+        first_dom = (d + y + ((31 * z) // 12)) % 7
+        #print('Gauss first of the %r month %r' % (month, first_dom))
+
+        # determine the day of the month
+        dom = 1 + (occur - 1) * 7 + (day - first_dom) % 7
+
+        if dom > month_days[month - 1]:
+            dom -= 7
+
+    midnight = time.mktime((year, month, dom, 0, 0, 0, 0, 0, 0))  # NOTE 9 params for CPython... 8 for MicroPython - this is the GMT0 time
+    return midnight + p.time - offset  # NOTE for CPython, DST start time could be off an hour... Fine in Micropython
+
+
+# Transition table for global_tzd, see build_table(). _tr_at are sorted UTC instants,
+# _tr_offset[i] is the offset in effect from _tr_at[i] up to _tr_at[i + 1].
+# The first entry is the start of the window, the last one its end.
+TABLE_YEARS_BEFORE = 1
+TABLE_YEARS_AFTER = 10
+_tr_at = []
+_tr_offset = []
+# The current segment of the table: _seg_start <= n < _seg_end has offset _seg_offset
+_seg_i = 0
+_seg_start = 0
+_seg_end = 0
+_seg_offset = 0
+
+
+def year_changes(tzd, year):
+    """(start, end) UTC instants of DST in year"""
+    return determine_change(tzd.start, year, tzd.offset), determine_change(tzd.end, year, tzd.dst_offset)
+
+
+def build_table(tzd, first_year, last_year):
+    """Precompute every transition from the start of first_year to the end of last_year"""
+    global _tr_at, _tr_offset
+    window_start = time.mktime((first_year, 1, 1, 0, 0, 0, 0, 0, 0))
+    window_end = time.mktime((last_year + 1, 1, 1, 0, 0, 0, 0, 0, 0))
+    if tzd.start is None:
+        # no DST, a single segment
+        _tr_at, _tr_offset = [window_start, window_end], [tzd.offset, tzd.offset]
+        _seek(0)
+        return
+
+    changes = []
+    for year in range(first_year, last_year + 1):
+        start_date, end_date = year_changes(tzd, year)
+        changes.append((start_date, tzd.dst_offset))
+        changes.append((end_date, tzd.offset))
+    changes.sort()
+    # The offset at the start of the window is the one the previous year ended with
+    prev_start, prev_end = year_changes(tzd, first_year - 1)
+    first_offset = tzd.dst_offset if prev_start > prev_end else tzd.offset  # southern hemisphere is in DST over new year
+
+    _tr_at, _tr_offset = [window_start], [first_offset]
+    for at, offset in changes:
+        _tr_at.append(at)
+        _tr_offset.append(offset)
+    _tr_at.append(window_end)
+    _tr_offset.append(tzd.offset)
+    _seek(0)
+
+
+def _seek(i):
+    global _seg_i, _seg_start, _seg_end, _seg_offset
+    _seg_i = i
+    _seg_start = _tr_at[i]
+    _seg_end = _tr_at[i + 1]
+    _seg_offset = _tr_offset[i]
+
+
+def table_offset(n):
+    """Offset for n from the transition table, None if n is outside the table window"""
+    if _seg_start <= n < _seg_end:
+        return _seg_offset
+    if not _tr_at[0] <= n < _tr_at[-1]:
+        return None
+    i = _seg_i
+    if n >= _seg_end and n < _tr_at[i + 2]:
+        # the usual case, time moved on into the next segment
+        i += 1
+    else:
+        # time jumped, binary search for the last transition <= n
+        lo, hi = 0, len(_tr_at) - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if _tr_at[mid] <= n:
+                lo = mid
+            else:
+                hi = mid
+        i = lo
+    _seek(i)
+    return _seg_offset
+
+
+def set_tz(tz, year=None):
+    """Set the global timezone and precompute its transitions for the years around year (default: now)"""
+    global global_tzd
+    tzd = get_zone(tz)
+    if year is None:
+        year = time.gmtime()[0]
+    if tzd is global_tzd and _tr_at and _tr_at[0] <= time.mktime((year, 1, 1, 0, 0, 0, 0, 0, 0)) < _tr_at[-1]:
+        # same zone and the table still covers this year, e.g. on a resync
+        return
+    global_tzd = tzd
+    build_table(global_tzd, year - TABLE_YEARS_BEFORE, year + TABLE_YEARS_AFTER)
+
+
+# rather than require functool lru (which is not built into MicroPython), cache manually.
+# Only used outside the transition table window or for a tzd other than global_tzd,
+# cleared when full so it can't grow without bound.
+LOCALTIME_CACHE_SIZE = 8
+_localtime_cache = {}
+def tz_offset(n, tzd):
+    """UTC offset in seconds in effect at n for tzd"""
+    if tzd is global_tzd:
+        offset = table_offset(n)
+        if offset is not None:
+            return offset
+    if tzd.start is None:
+        return tzd.offset
+
+    year = time.gmtime(n)[0]  # FIXME, assume DST never starts/ends on first/last day of a year - probably a safe thing todo
+    key = (tzd, year)
+    try:
+        start_date, end_date = _localtime_cache[key]
+    except KeyError:
+        if len(_localtime_cache) >= LOCALTIME_CACHE_SIZE:
+            _localtime_cache.clear()
+        start_date, end_date = _localtime_cache[key] = year_changes(tzd, year)
+    if start_date < end_date:
+        dst = start_date <= n < end_date
+    else:
+        dst = not (end_date <= n < start_date)
+    return tzd.dst_offset if dst else tzd.offset
+
+
+def localtime(n=None, tzd=None):
+    if n is None:
+        n = time.time()
+    tzd = tzd or global_tzd
+
+    if tzd is global_tzd and _seg_start <= n < _seg_end:
+        # fast path, still in the same segment of the transition table
+        n += _seg_offset
+    elif tzd:
+        n += tz_offset(n, tzd)
+    # else assume UTC/GMT0
+    return time.localtime(n)
+
+def debug_localtime():
+    t = time.time()
+    print(t)
+    print(parse_tz('PST8PDT,M3.2.0,M11.1.0'))
+    print(parse_tz('PST8PDT,M3.2.0/2:00:00,M11.1.0/2:00:00'))
+
+    parsed = parse_tz('PST8PDT,M3.2.0,M11.1.0')
+    start_date = determine_change(parsed.start, 2025, parsed.offset)
+    end_date = determine_change(parsed.end, 2025, parsed.dst_offset)
+    print(time.localtime(start_date), start_date)
+    print(time.localtime(end_date), end_date)
+
+#debug_localtime()
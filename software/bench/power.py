@@ -0,0 +1,185 @@
+"""
+The time of day modes on the simulator, and a check of the current estimate.
+
+main.py boots once in every mode of power.py, in UTC at a time in the middle
+of the mode, and runs for --seconds with a quiet console. The table shows
+the frames rendered a second, the ones of them that changed the ring and
+went out, the brightness, how much of the time the chip spent in
+lightsleep, and the current PowerModel estimated for the LEDs and the core.
+
+The estimate is checked against what really happened: every frame the fake
+state machines sent is turned into a current with power.leds_ua() and
+weighted by how long it was shown, and the core current is worked out from
+the virtual time spent in render_frame() and in machine.lightsleep(). Both
+have to agree with the estimate within TOLERANCE. The first WARMUP seconds,
+boot and the first sync, are left out.
+
+At night the brightness is scaled down the most, so the clock is also
+booted at night with every brightness in LOW_BRIGHTNESS: the digits and the
+ring both still have to light up.
+
+    python -m bench.power
+    python -m bench.power --seconds 600
+"""
+
+import argparse
+import sys
+
+import animation
+import power
+import sim.run
+from sim import machine, rp2
+from sim.run import Simulation
+
+# UTC time in every mode
+TIMES = {power.DAY: "12:00:00", power.EVENING: "22:00:00", power.NIGHT: "03:00:00"}
+WARMUP = 15
+TOLERANCE = 0.05
+# BRIGHT values checked at night
+LOW_BRIGHTNESS = (100, 60, 1)
+
+
+class Wire:
+    """Charge of the frames the state machines sent, in uA us"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        # state machine id -> (us its last frame started, current of that frame)
+        self.shown = {}
+        self.charge = 0
+        self.start_us = None
+        rp2.frame_listeners.append(self.frame)
+
+    def frame(self, sm, us, pixels):
+        self.add(sm.id, us)
+        self.shown[sm.id] = (us, power.leds_ua(pixels))
+
+    def add(self, id, until_us):
+        if id in self.shown and self.start_us is not None:
+            since, ua = self.shown[id]
+            self.charge += ua * (until_us - max(since, self.start_us))
+
+    def start(self):
+        self.charge = 0
+        self.start_us = self.clock.us
+
+    def average_ua(self):
+        now = self.clock.us
+        for id in self.shown:
+            self.add(id, now)
+            self.shown[id] = (now, self.shown[id][1])
+        return self.charge // (now - self.start_us)
+
+    def close(self):
+        rp2.frame_listeners.remove(self.frame)
+
+
+def snapshot(simulation, mode):
+    main = simulation.main
+    model = main.power_model
+    return (
+        simulation.clock.us,
+        model.ms[mode],
+        model.leds_charge[mode],
+        model.core_charge[mode],
+        sum(simulation.busy_us),
+        machine.lightsleep_us,
+        main.frames_rendered,
+        rp2.state_machines[0].frame_count,
+    )
+
+
+def run(mode, seconds):
+    """Everything for the table row of mode, and the mismatches"""
+    simulation = Simulation(sim.run.parse_start(f"2026-01-01T{TIMES[mode]}"))
+    main = simulation.main
+    main.tz_string = "UTC0"
+    main.awake_until = None
+    wire = Wire(simulation.clock)
+    try:
+        simulation.run(WARMUP)
+        wire.start()
+        first = snapshot(simulation, mode)
+        simulation.run(seconds)
+        wire_leds = wire.average_ua()
+        last = snapshot(simulation, mode)
+    finally:
+        wire.close()
+        simulation.close()
+
+    elapsed_us, ms, leds_charge, core_charge, busy_us, sleep_us, frames, sent = (b - a for a, b in zip(first, last))
+    leds = leds_charge // ms
+    core = core_charge // ms
+    idle_us = elapsed_us - busy_us - sleep_us
+    wire_core = (
+        busy_us * power.CORE_RUN_UA + idle_us * power.CORE_IDLE_UA + sleep_us * power.CORE_SLEEP_UA
+    ) // elapsed_us
+    row = (
+        power.MODES[mode],
+        frames / (elapsed_us / 1000000),
+        sent / (elapsed_us / 1000000),
+        main.state_out[main.STATE_BRIGHTNESS],
+        animation.EFFECTS[main.ring_animation.level],
+        sleep_us / elapsed_us,
+        leds,
+        wire_leds,
+        core,
+        wire_core,
+    )
+    errors = []
+    if main.state_out[main.STATE_MODE] != mode:
+        errors.append(f"{power.MODES[mode]}: the clock was in {power.MODES[main.state_out[main.STATE_MODE]]}")
+    for label, estimate, actual in (("LEDs", leds, wire_leds), ("core", core, wire_core)):
+        if abs(estimate - actual) > actual * TOLERANCE:
+            errors.append(f"{power.MODES[mode]}: {label} estimated {estimate}uA, the wire says {actual}uA")
+    return row, errors
+
+
+def lit_at_night(brightness):
+    """Mismatches if the digits or the ring are dark at night with brightness"""
+    simulation = Simulation(sim.run.parse_start(f"2026-01-01T{TIMES[power.NIGHT]}"))
+    main = simulation.main
+    main.tz_string = "UTC0"
+    main.set_brightness(brightness)
+    try:
+        simulation.run(WARMUP)
+    finally:
+        simulation.close()
+    errors = []
+    for id, name in ((0, "ring is"), (1, "digits are")):
+        if not any(rp2.state_machines[id].last_frame()):
+            errors.append(f"night: the {name} dark at BRIGHT {brightness}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=120)
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':8s} {'frames/s':>9s} {'sent/s':>7s} {'bright':>6s} {'ring':>6s} {'sleep':>6s} "
+        f"{'LEDs':>8s} {'wire':>8s} {'core':>7s} {'wire':>7s} {'total':>8s}"
+    )
+    errors = []
+    for mode in range(len(power.MODES)):
+        row, mode_errors = run(mode, args.seconds)
+        name, fps, sent, bright, ring, sleep, leds, wire_leds, core, wire_core = row
+        print(
+            f"{name:8s} {fps:9.1f} {sent:7.1f} {bright:6d} {ring:>6s} {sleep:6.0%} "
+            f"{leds / 1000:6.1f}mA {wire_leds / 1000:6.1f}mA {core / 1000:5.1f}mA {wire_core / 1000:5.1f}mA "
+            f"{(leds + core) * 5 / 1000:6.0f}mW"
+        )
+        errors.extend(mode_errors)
+    print(f"{args.seconds:.0f}s in every mode, estimate against the wire within {TOLERANCE:.0%}")
+    for brightness in LOW_BRIGHTNESS:
+        errors.extend(lit_at_night(brightness))
+    print(f"Night at BRIGHT {', '.join(str(b) for b in LOW_BRIGHTNESS)}: digits and ring lit unless listed below")
+    for error in errors:
+        print(error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+The DS1307 losing its time, on the simulator: the checkpoint has to survive
+it and the clock has to keep running from the last good time.
+
+    at boot     The clock runs, syncs and saves a checkpoint. Then the DS1307
+                battery goes flat across a reset: the chip comes back halted
+                at 2000-01-01, but its RAM with the checkpoint is kept. The
+                clock has to start from the last good time, put that back
+                into the DS1307, and still have it after the first sync and
+                after another reset.
+    running     The DS1307 jumps to 2000-01-01 while the clock runs. The next
+                sync has to refuse that and set the DS1307 from the internal
+                RTC instead.
+
+After every step the internal RTC may not be behind the last good time, the
+DS1307 has to be within MAX_APART seconds of the internal RTC, and frames
+have to be rendered.
+
+    python -m bench.resume
+"""
+
+import sys
+import time
+
+import sim.run
+from sim.run import Simulation
+
+START = "2026-06-01T12:00:00"
+LOST = 946684800  # 2000-01-01, where a DS1307 starts after losing its time
+# Syncs every SYNC_INTERVAL seconds, so a run sees a few of them
+SYNC_INTERVAL = 5
+MAX_APART = 1
+
+
+class Scenario:
+    def __init__(self):
+        self.simulation = Simulation(sim.run.parse_start(START))
+        self.ds1307 = self.simulation.ds1307
+        self.failures = []
+        self.setup()
+
+    def setup(self):
+        main = self.simulation.main
+        main.first_sync_delay = 1
+        main.clock_sync.min_interval = main.clock_sync.max_interval = SYNC_INTERVAL
+
+    def reset(self):
+        self.simulation.boot()
+        self.setup()
+
+    def check(self, label, seconds):
+        """Run for seconds, then check the clock"""
+        main = self.simulation.main
+        frames = len(self.simulation.cpu_us)
+        last_good = main.checkpoint.last_good
+        self.simulation.run(seconds)
+        now = time.time()
+        ds1307 = int(self.ds1307.now())
+        problems = []
+        if now < last_good:
+            problems.append(f"the clock is at {now}, behind the last good time {last_good}")
+        if main.checkpoint.last_good < last_good:
+            problems.append(f"the last good time went back from {last_good} to {main.checkpoint.last_good}")
+        if abs(ds1307 - now) > MAX_APART:
+            problems.append(f"the DS1307 is at {ds1307}, {ds1307 - now}s from the clock")
+        if len(self.simulation.cpu_us) == frames:
+            problems.append("no frames")
+        status = "ok" if not problems else "FAIL " + ", ".join(problems)
+        print(f"{label:44s} {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now))}  {status}")
+        self.failures.extend(f"{label}: {problem}" for problem in problems)
+
+
+def lost_at_boot():
+    scenario = Scenario()
+    scenario.check("running, synced and checkpointed", 20)
+    scenario.ds1307.set_epoch(LOST)
+    scenario.ds1307.halted = True
+    scenario.reset()
+    scenario.check("reset with the DS1307 lost", 20)
+    scenario.reset()
+    scenario.check("another reset", 20)
+    scenario.simulation.close()
+    return scenario.failures
+
+
+def lost_running():
+    scenario = Scenario()
+    scenario.check("running, synced and checkpointed", 20)
+    scenario.ds1307.set_epoch(LOST)
+    scenario.check("DS1307 lost while running, after a sync", 2 * SYNC_INTERVAL)
+    scenario.reset()
+    scenario.check("reset after that", 20)
+    scenario.simulation.close()
+    return scenario.failures
+
+
+def main():
+    failures = lost_at_boot() + lost_running()
+    if failures:
+        print(f"{len(failures)} failures")
+        sys.exit(1)
+    print("The clock kept its time in every step")
+
+
+if __name__ == "__main__":
+    main()
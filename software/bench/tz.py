@@ -0,0 +1,213 @@
+"""
+Conformance and benchmark suite for posix_tz, checked against the system zoneinfo.
+
+For every zone the POSIX TZ string at the end of its TZif file is parsed with
+posix_tz and the UTC offsets it gives are compared with zoneinfo around every
+transition and at regular samples across the years. The footer describes the
+rules from the last listed transition on, so only compare years that are
+covered by it (the default is from now on).
+
+Every MALFORMED string has to be rejected with a ValueError.
+
+    python -m bench.tz
+    python -m bench.tz --zones Europe/Berlin America/Nuuk --first-year 2030
+"""
+
+import argparse
+import os
+import random
+import struct
+import time
+
+# posix_tz has to give the same on any host as on the clock, where there is no local time
+# zone. Run on one that isn't UTC, so anything that depends on it shows up as a mismatch
+os.environ["TZ"] = "America/New_York"
+time.tzset()
+
+from datetime import datetime  # noqa: E402
+import zoneinfo  # noqa: E402
+
+import posix_tz  # noqa: E402
+
+# TZ strings parse_tz() must reject with a ValueError, and nothing else
+MALFORMED = (
+    "",
+    "ABC-1DEF,M3.2.0/,M11.1.0",
+    "ABC-1DEF,M3.2.0,M11.1.0/",
+    "ABC-1DEF,M3.2.0",
+    "ABC-1DEF,,M11.1.0",
+    "ABC-1DEF,M13.2.0,M11.1.0",
+    "ABC-1DEF,Mx.2.0,M11.1.0",
+    "ABC-1:2:3:4",
+    "ABC+",
+    "<ABC-1",
+)
+
+
+def read_tzif(zone):
+    """(POSIX TZ string, last listed transition) of a zone, (None, None) if it has no TZ string"""
+    for base in zoneinfo.TZPATH:
+        path = os.path.join(base, zone)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            break
+    else:
+        return None, None
+    if not data.startswith(b"TZif") or data[4:5] < b"2":
+        return None, None
+
+    # Skip the version 1 block, then read the 64 bit transition times
+    isutcnt, isstdcnt, leapcnt, timecnt, typecnt, charcnt = struct.unpack(">6l", data[20:44])
+    v2 = 44 + timecnt * 5 + typecnt * 6 + charcnt + leapcnt * 8 + isstdcnt + isutcnt
+    timecnt = struct.unpack(">6l", data[v2 + 20 : v2 + 44])[3]
+    last = None
+    if timecnt:
+        last = struct.unpack(">q", data[v2 + 44 + (timecnt - 1) * 8 : v2 + 44 + timecnt * 8])[0]
+
+    tz = data.rstrip(b"\n").rsplit(b"\n", 1)[-1].decode()
+    return tz or None, last
+
+
+def footer(zone):
+    """POSIX TZ string of a zone, None if it has none"""
+    return read_tzif(zone)[0]
+
+
+def check_zone(zone, tzd, first_year, last_year, step, after=None):
+    """Compare the offsets for one zone after the instant after, returns a list of (n, ours, theirs)"""
+    tz = zoneinfo.ZoneInfo(zone)
+    instants = list(range(posix_tz.year_start(first_year), posix_tz.year_start(last_year + 1), step))
+    if tzd[posix_tz.START] is not None:
+        for year in range(first_year, last_year + 1):
+            for at in posix_tz.year_changes(tzd, year):
+                instants.extend((at - 1, at, at + 1))
+    if after is not None:
+        instants = [n for n in instants if n > after]
+
+    mismatches = []
+    for n in instants:
+        ours = posix_tz.tz_offset(n, tzd)
+        theirs = int(datetime.fromtimestamp(n, tz).utcoffset().total_seconds())
+        if ours != theirs:
+            mismatches.append((n, ours, theirs))
+    return mismatches
+
+
+def conformance(zones, first_year, last_year, step):
+    checked = skipped = failed = 0
+    for zone in zones:
+        tz, last = read_tzif(zone)
+        if tz is None:
+            skipped += 1
+            continue
+        try:
+            tzd = posix_tz.parse_tz(tz)
+        except ValueError as e:
+            failed += 1
+            print(f"FAIL {zone}: {tz!r} does not parse: {e}")
+            continue
+        # Transitions listed in the file (e.g. Ramadan rules) take precedence over the TZ string
+        mismatches = check_zone(zone, tzd, first_year, last_year, step, last)
+        checked += 1
+        if mismatches:
+            failed += 1
+            n, ours, theirs = mismatches[0]
+            print(
+                f"FAIL {zone} {tz!r}: {len(mismatches)} mismatches, first at {n} "
+                f"({time.gmtime(n)[:6]} UTC): ours {ours}, zoneinfo {theirs}"
+            )
+    print(f"{checked} zones checked, {skipped} without TZ string, {failed} failed")
+    return failed
+
+
+def malformed():
+    failed = 0
+    for tz in MALFORMED:
+        try:
+            posix_tz.parse_tz(tz)
+        except ValueError:
+            continue
+        except Exception as e:
+            print(f"FAIL {tz!r} raised {type(e).__name__}: {e}")
+        else:
+            print(f"FAIL {tz!r} parsed")
+        failed += 1
+    print(f"{len(MALFORMED) - failed} of {len(MALFORMED)} malformed TZ strings rejected")
+    return failed
+
+
+def timeit(label, func, count):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:40s} {elapsed / count * 1000000:8.3f} us")
+
+
+def benchmark(zones, rounds):
+    strings = [tz for tz in (footer(zone) for zone in zones) if tz]
+
+    def parse():
+        for tz in strings:
+            posix_tz.parse_tz(tz)
+
+    def cached():
+        tz = strings[0]
+        for _ in strings:
+            posix_tz.get_zone(tz)
+
+    print(f"{len(strings)} TZ strings, {rounds} timestamps")
+    timeit("parse_tz", parse, len(strings))
+    cached()
+    timeit("get_zone (cached)", cached, len(strings))
+
+    posix_tz.set_tz("CET-1CEST,M3.5.0,M10.5.0/3", 2026)
+    tzd = posix_tz.global_tzd
+    zone = zoneinfo.ZoneInfo("Europe/Berlin")
+    start = posix_tz.year_start(2026)
+    sequential = range(start, start + rounds)
+    scattered = [start + random.randrange(0, 10 * 365 * 86400) for _ in range(rounds)]
+
+    def run(instants):
+        localtime = posix_tz.localtime
+        for n in instants:
+            localtime(n)
+
+    def run_other(instants):
+        # not the global zone, so the per-year path
+        localtime = posix_tz.localtime
+        other = tuple(list(tzd))
+        for n in instants:
+            localtime(n, other)
+
+    def run_zoneinfo(instants):
+        for n in instants:
+            datetime.fromtimestamp(n, zone).timetuple()
+
+    timeit("localtime, every second", lambda: run(sequential), rounds)
+    timeit("localtime, scattered", lambda: run(scattered), rounds)
+    timeit("localtime, other zone, scattered", lambda: run_other(scattered), rounds)
+    timeit("zoneinfo, every second", lambda: run_zoneinfo(sequential), rounds)
+    timeit("zoneinfo, scattered", lambda: run_zoneinfo(scattered), rounds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zones", nargs="*", help="zones to check (default: all)")
+    parser.add_argument("--first-year", type=int, default=time.gmtime()[0])
+    parser.add_argument("--last-year", type=int, default=2037)
+    parser.add_argument("--step", type=int, default=86400 + 3607, help="seconds between samples")
+    parser.add_argument("--rounds", type=int, default=200000, help="timestamps per benchmark")
+    parser.add_argument("--no-bench", action="store_true")
+    args = parser.parse_args()
+
+    zones = args.zones or sorted(zoneinfo.available_timezones())
+    failed = conformance(zones, args.first_year, args.last_year, args.step)
+    failed += malformed()
+    if not args.no_bench:
+        benchmark(zones, args.rounds)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Lock-free handoff of a small array of integers from one core to the other.
+
+There are two slots. The writer always fills the one the reader isn't
+pointed at, then flips front to it, so a read normally copies a slot nobody
+is writing. A slow reader can still be overtaken: two writes during one
+read and the writer is back in the slot being copied. Every slot has a
+sequence number for that, odd while the slot is being written, and a read
+that saw it odd or changed copies again.
+
+One writer and one reader. Nothing is allocated after the constructor, the
+reader gets its copy in latest, through preallocated memoryviews.
+The RP2040 cores don't reorder their stores and the SRAM isn't cached, so
+plain word stores are enough.
+"""
+
+import array
+
+
+class DoubleBuffer:
+    def __init__(self, size, typecode="q"):
+        self.size = size
+        # Word 0 of every slot is its sequence number, the values follow
+        self.slots = (
+            array.array(typecode, [0 for _ in range(size + 1)]),
+            array.array(typecode, [0 for _ in range(size + 1)]),
+        )
+        self.values = (memoryview(self.slots[0])[1:], memoryview(self.slots[1])[1:])
+        self.front = 0
+        # The reader's copy, see read()
+        self.latest = array.array(typecode, [0 for _ in range(size)])
+        self.latest_view = memoryview(self.latest)
+        # Writes so far, and reads that had to copy again
+        self.writes = 0
+        self.retries = 0
+
+    def write(self, values):
+        """Publish values, an array of size integers with the same typecode. Writer only."""
+        back = 1 - self.front
+        slot = self.slots[back]
+        seq = slot[0] + 1
+        slot[0] = seq
+        self.values[back][:] = values
+        slot[0] = seq + 1
+        self.front = back
+        self.writes += 1
+
+    def read(self):
+        """Copy the latest values into latest, returns their sequence number. Reader only."""
+        while True:
+            front = self.front
+            slot = self.slots[front]
+            seq = slot[0]
+            if not seq & 1:
+                self.latest_view[:] = self.values[front]
+                if slot[0] == seq:
+                    return seq
+            self.retries += 1
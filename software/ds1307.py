@@ -23,21 +23,86 @@ https://en.wikipedia.org/wiki/Binary-coded_decimal
 """
 
 from micropython import const
+import time
 
 DATETIME_REG = const(0)  # 0x00-0x06
 CHIP_HALT = const(128)
 CONTROL_REG = const(7)  # 0x07
 RAM_REG = const(8)  # 0x08-0x3F
+REG_COUNT = const(64)
+
+# BCD byte -> decimal, so decoding a field is one index instead of a method call
+BCD2DEC = bytes(((value >> 4) * 10) + (value & 0x0F) for value in range(256))
 
 
 class DS1307(object):
-    """Driver for the DS1307 RTC."""
+    """Driver for the DS1307 RTC.
+
+    Bus errors (OSError) are retried up to retries times, waiting backoff_ms,
+    then twice as long, and so on, but never more than max_backoff_ms.
+    With burst, datetime() reads the whole register map in one transaction,
+    which also keeps regs, the halt and control state up to date.
+    """
 
-    def __init__(self, i2c, addr=0x68):
+    def __init__(self, i2c, addr=0x68, retries=3, backoff_ms=2, max_backoff_ms=20, burst=False):
         self.i2c = i2c
         self.addr = addr
         self.weekday_start = 1
         self._halt = False
+        # Whether _halt was read from the chip, until then halt() has to read it
+        self._halt_known = False
+        self._control = None
+        self.retries = retries
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.burst = burst
+        # Last copy of the full register map, see read_all()
+        self.regs = bytearray(REG_COUNT)
+        self._time_buf = bytearray(7)
+        # Bus statistics, see stats()
+        self.transactions = 0
+        self.errors = 0
+        self.latency_us = 0
+        self.max_latency_us = 0
+
+    def _transaction(self, func, reg, buf):
+        """Run one bus transaction, retrying transient errors"""
+        backoff = self.backoff_ms
+        attempt = 0
+        while True:
+            start = time.ticks_us()
+            try:
+                func(self.addr, reg, buf)
+            except OSError:
+                # Before the backoff, the latency is the bus's alone
+                self._count(start)
+                self.errors += 1
+                if attempt >= self.retries:
+                    raise
+            else:
+                self._count(start)
+                return
+            attempt += 1
+            time.sleep_ms(backoff)
+            backoff = min(backoff * 2, self.max_backoff_ms)
+
+    def _count(self, start):
+        latency = time.ticks_diff(time.ticks_us(), start)
+        self.transactions += 1
+        self.latency_us += latency
+        if latency > self.max_latency_us:
+            self.max_latency_us = latency
+
+    def _read(self, reg, buf):
+        self._transaction(self.i2c.readfrom_mem_into, reg, buf)
+
+    def _write(self, reg, buf):
+        self._transaction(self.i2c.writeto_mem, reg, buf)
+
+    def stats(self):
+        """(transactions, errors, average latency us, max latency us)"""
+        average = self.latency_us // self.transactions if self.transactions else 0
+        return (self.transactions, self.errors, average, self.max_latency_us)
 
     def _dec2bcd(self, value):
         """Convert decimal to binary coded decimal (BCD) format"""
@@ -45,20 +110,34 @@ class DS1307(object):
 
     def _bcd2dec(self, value):
         """Convert binary coded decimal (BCD) format to decimal"""
-        return ((value >> 4) * 10) + (value & 0x0F)
+        return BCD2DEC[value]
+
+    def read_all(self):
+        """Read the full 0x00-0x3F register map in one burst into regs"""
+        self._read(DATETIME_REG, self.regs)
+        self._halt = bool(self.regs[0] & CHIP_HALT)
+        self._halt_known = True
+        self._control = self.regs[CONTROL_REG]
+        return self.regs
 
     def datetime(self, datetime=None):
         """Get or set datetime"""
         if datetime is None:
-            buf = self.i2c.readfrom_mem(self.addr, DATETIME_REG, 7)
+            if self.burst:
+                buf = self.read_all()
+            else:
+                buf = self._time_buf
+                self._read(DATETIME_REG, buf)
+                self._halt = bool(buf[0] & CHIP_HALT)
+                self._halt_known = True
             return (
-                self._bcd2dec(buf[6]) + 2000,  # year
-                self._bcd2dec(buf[5]),  # month
-                self._bcd2dec(buf[4]),  # day
-                self._bcd2dec(buf[3] - self.weekday_start),  # weekday
-                self._bcd2dec(buf[2]),  # hour
-                self._bcd2dec(buf[1]),  # minute
-                self._bcd2dec(buf[0] & 0x7F),  # second
+                BCD2DEC[buf[6]] + 2000,  # year
+                BCD2DEC[buf[5]],  # month
+                BCD2DEC[buf[4]],  # day
+                BCD2DEC[buf[3] - self.weekday_start],  # weekday
+                BCD2DEC[buf[2]],  # hour
+                BCD2DEC[buf[1]],  # minute
+                BCD2DEC[buf[0] & 0x7F],  # second
                 0,  # subseconds
             )
         buf = bytearray(7)
@@ -71,19 +150,45 @@ class DS1307(object):
         buf[6] = self._dec2bcd(datetime[0] - 2000)  # year
         if self._halt:
             buf[0] |= 1 << 7
-        self.i2c.writeto_mem(self.addr, DATETIME_REG, buf)
+        self._write(DATETIME_REG, buf)
 
     def halt(self, val=None):
         """Power up, power down or check status"""
         if val is None:
             return self._halt
-        reg = self.i2c.readfrom_mem(self.addr, DATETIME_REG, 1)[0]
+        if self._halt_known and bool(val) == self._halt:
+            # nothing to change, save the read-modify-write
+            return
+        buf = bytearray(1)
+        self._read(DATETIME_REG, buf)
+        reg = buf[0]
         if val:
             reg |= CHIP_HALT
         else:
             reg &= ~CHIP_HALT
         self._halt = bool(val)
-        self.i2c.writeto_mem(self.addr, DATETIME_REG, bytearray([reg]))
+        self._halt_known = True
+        self._write(DATETIME_REG, bytearray([reg]))
+
+    def read_ram(self, offset, nbytes):
+        """Read nbytes of the battery backed RAM (0x08-0x3F), offset 0 is RAM_REG"""
+        if offset < 0 or offset + nbytes > REG_COUNT - RAM_REG:
+            raise ValueError("RAM is 56 bytes")
+        buf = bytearray(nbytes)
+        self._read(RAM_REG + offset, buf)
+        return buf
+
+    def write_ram(self, offset, data):
+        """Write data to the battery backed RAM (0x08-0x3F), offset 0 is RAM_REG"""
+        if offset < 0 or offset + len(data) > REG_COUNT - RAM_REG:
+            raise ValueError("RAM is 56 bytes")
+        self._write(RAM_REG + offset, data)
+
+    def seconds(self):
+        """Just the seconds register, the cheapest way to watch the time tick"""
+        buf = self._time_buf
+        self._read(DATETIME_REG, memoryview(buf)[0:1])
+        return BCD2DEC[buf[0] & 0x7F]
 
     def square_wave(self, sqw=0, out=0):
         """Output square wave on pin SQ at 1Hz, 4.096kHz, 8.192kHz or 32.768kHz,
@@ -93,4 +198,7 @@ class DS1307(object):
         out = 1 if out > 0 else 0
         sqw = 1 if sqw > 0 else 0
         reg = rs0 | rs1 << 1 | sqw << 4 | out << 7
-        self.i2c.writeto_mem(self.addr, CONTROL_REG, bytearray([reg]))
+        if reg == self._control:
+            return
+        self._write(CONTROL_REG, bytearray([reg]))
+        self._control = reg
@@ -0,0 +1,185 @@
+"""
+Seven segment font for the digit blocks of the digits strip, and scrolling
+text on them.
+
+Every block is 17 LEDs: two per segment, the colon and the dot. A glyph is
+compiled once into a 17-bit mask, bit i lights LED i of the block, so
+drawing text is one pass over the LEDs with a shift and a test per LED, see
+blit(). The segments are named the usual way:
+
+     aaa
+    f   b
+     ggg
+    e   c
+     ddd
+
+Seven segments can't draw every letter. The letters use the common mixed
+case shapes (A b C d E F ...), enough for TZ names and short messages, a
+few (K M V W X) are only approximations. Lower case text is shown the same
+as upper case, and characters without a glyph are blank.
+"""
+
+import array
+import time
+
+LEDS_PER_BLOCK = 17
+
+# LEDs of every segment within a block
+SEGMENTS = {
+    "a": (0, 10),
+    "b": (11, 12),
+    "c": (14, 15),
+    "d": (6, 16),
+    "e": (4, 5),
+    "f": (1, 2),
+    "g": (3, 13),
+    "colon": (7, 8),
+    "dot": (9,),
+}
+
+CHARACTERS = {
+    "0": "abcdef",
+    "1": "bc",
+    "2": "abdeg",
+    "3": "abcdg",
+    "4": "bcfg",
+    "5": "acdfg",
+    "6": "acdefg",
+    "7": "abc",
+    "8": "abcdefg",
+    "9": "abcdfg",
+    "A": "abcefg",
+    "B": "cdefg",
+    "C": "adef",
+    "D": "bcdeg",
+    "E": "adefg",
+    "F": "aefg",
+    "G": "acdef",
+    "H": "bcefg",
+    "I": "ef",
+    "J": "bcde",
+    "K": "acefg",
+    "L": "def",
+    "M": "aceg",
+    "N": "ceg",
+    "O": "cdeg",
+    "P": "abefg",
+    "Q": "abcfg",
+    "R": "eg",
+    "S": "acdfg",
+    "T": "defg",
+    "U": "bcdef",
+    "V": "cde",
+    "W": "bdf",
+    "X": "bcefg",
+    "Y": "bcdfg",
+    "Z": "abdeg",
+    "-": "g",
+    "_": "d",
+    "=": "dg",
+    "+": "efg",
+    "'": "f",
+    '"': "bf",
+    "*": "abfg",
+    "?": "abeg",
+    "[": "adef",
+    "]": "abcd",
+    " ": "",
+}
+
+
+def compile_mask(segments, names):
+    mask = 0
+    for name in names:
+        for led in segments[name]:
+            mask |= 1 << led
+    return mask
+
+
+def compile_font(segments=SEGMENTS, characters=CHARACTERS):
+    """Masks of every ASCII character, indexed by its code"""
+    font = array.array("I", [0 for _ in range(128)])
+    for char, names in characters.items():
+        mask = compile_mask(segments, names)
+        font[ord(char)] = mask
+        font[ord(char.lower())] = mask
+    return font
+
+
+FONT = compile_font()
+COLON = compile_mask(SEGMENTS, ("colon",))
+DOT = compile_mask(SEGMENTS, ("dot",))
+
+
+def mask(char):
+    code = ord(char)
+    return FONT[code] if code < 128 else 0
+
+
+def text_masks(text):
+    """One mask per block for text, a . or : goes on the block before it, like on a calculator"""
+    masks = array.array("I")
+    for char in text:
+        if char in ".:" and masks and not masks[-1] & (DOT | COLON):
+            masks[-1] |= DOT if char == "." else COLON
+        elif char == ".":
+            masks.append(DOT)
+        elif char == ":":
+            masks.append(COLON)
+        else:
+            masks.append(mask(char))
+    return masks
+
+
+def blit(pixels, masks, color, first=0, count=None, start=0):
+    """
+    Draw count masks from masks[first] on into pixels from LED start, in one pass:
+    color where the bit is set, 0 where it isn't. Nothing is allocated.
+    """
+    if count is None:
+        count = len(masks) - first
+    led = start
+    for i in range(first, first + count):
+        mask = masks[i]
+        for bit in range(LEDS_PER_BLOCK):
+            pixels[led] = color if mask & 1 else 0
+            mask >>= 1
+            led += 1
+
+
+class ScrollingText:
+    """
+    text scrolling from right to left over the blocks of strip, a block every step_ms.
+    The position comes from the time since the first render(), so the text keeps
+    its speed however often render() is called.
+    """
+
+    def __init__(self, strip, text, step_ms=300, blocks=4, start=0):
+        self.strip = strip
+        self.blocks = blocks
+        self.start = start
+        # Comes in from the right and leaves on the left
+        padding = " " * blocks
+        self.masks = text_masks(padding + text + padding)
+        self.step_ms = step_ms
+        self.started = None
+        # Block of masks at the left end, and the color it was drawn with
+        self.position = -1
+        self.color = None
+        self.done = False
+
+    def render(self, now_ms, color):
+        """Draw the text at now_ms, returns False once it has scrolled through"""
+        if self.done:
+            return False
+        if self.started is None:
+            self.started = now_ms
+        position = time.ticks_diff(now_ms, self.started) // self.step_ms
+        if position > len(self.masks) - self.blocks:
+            self.done = True
+            return False
+        if position != self.position or color != self.color:
+            blit(self.strip.pixels, self.masks, color, position, self.blocks, self.start)
+            self.position = position
+            self.color = color
+        return True
@@ -1,31 +1,82 @@
-import ws2812b
 import time
+
+# ticks_ms() when main.py started, the ticks before are the MicroPython boot
+boot_ms = time.ticks_ms()
+
+import _thread
+import array
+import asyncio
+import sys
+import ws2812b
 import machine
 from ds1307 import DS1307
 import posix_tz
-
-# LED Mapping
-digit_to_led = {
-    "1": [11, 12, 14, 15],
-    "2": [0, 10, 11, 12, 3, 13, 4, 5, 6, 16],
-    "3": [0, 10, 11, 12, 3, 13, 14, 15, 6, 16],
-    "4": [1, 2, 3, 13, 11, 12, 14, 15],
-    "5": [0, 10, 1, 2, 3, 13, 14, 15, 6, 16],
-    "6": [0, 10, 1, 2, 3, 13, 4, 5, 6, 16, 14, 15],
-    "7": [0, 10, 11, 12, 14, 15],
-    "8": [0, 10, 1, 2, 11, 12, 3, 13, 4, 5, 14, 15, 6, 16],
-    "9": [0, 10, 1, 2, 11, 12, 3, 13, 14, 15, 6, 16],
-    "0": [0, 10, 1, 2, 11, 12, 4, 5, 14, 15, 6, 16],
-    "dot": [9],
-    "colon": [7, 8],
-}
-
-# Time Zone
-posix_tz.set_tz('CEST-1CET,M3.2.0/2:00:00,M11.1.0/2:00:00')
+import rtc_sync
+import animation
+import font
+import doublebuf
+import timeset
+import telemetry
+import resume
+import power
+from micropython import const
+
+# Every digit block on the digits strip is 17 LEDs wide, see font.py for the segments
+leds_per_digit = font.LEDS_PER_BLOCK
+
+# Compiled glyphs for the current color: (digit, colon, dot) -> one 17 LED block.
+# A block is the same for every offset, so a frame is just 4 slice copies.
+glyphs = {}
+glyphs_key = None
+
+
+def compile_glyphs(strip, color_r, color_g, color_b):
+    global glyphs, glyphs_key
+    # The packed color already has brightness and gamma applied, so it is the cache key
+    color = strip.pack(color_r, color_g, color_b)
+    if color == glyphs_key:
+        return glyphs
+
+    compiled = {}
+    for digit in "0123456789":
+        for colon in (False, True):
+            for dot in (False, True):
+                mask = font.mask(digit)
+                if colon:
+                    mask |= font.COLON
+                if dot:
+                    mask |= font.DOT
+                block = array.array("I", [0 for _ in range(leds_per_digit)])
+                font.blit(block, (mask,), color)
+                compiled[(digit, colon, dot)] = block
+
+    glyphs = compiled
+    glyphs_key = color
+    return glyphs
+
+# Time Zone, it can be changed over the serial console, see handle_frame().
+# It is set once the RTC has the time, see copy_rtc_to_internal_rtc_with_tz()
+tz_string = 'CEST-1CET,M3.2.0/2:00:00,M11.1.0/2:00:00'
 
 # Set up the ws2812 PIO engines
-ring = ws2812b.ws2812b(60, 0, 0)
-digits = ws2812b.ws2812b(68, 1, 1)
+# Both chains share one frame buffer and are committed together once per render
+strips = ws2812b.ws2812b_group((("ring", 60, 0, 0), ("digits", 68, 1, 1)))
+ring = strips["ring"]
+digits = strips["digits"]
+
+# The seconds ring is animated at up to 50 fps, it falls back to simpler effects when
+# frames don't fit the budget, down to one frame a second. See animation.py
+ring_animation = animation.RingAnimation(ring, effect="comet", fps=50)
+# The second shown on the ring, read from the internal RTC once a second
+ring_second = 0
+
+# The message scrolling over the digits instead of the time, see show_text(). Core 0 only
+# ever replaces it, the renderer only reads it, so it needs no lock.
+scroll = None
+# The digits show a message, not the time
+text_shown = False
+# How long every character stays on a block while it scrolls through
+scroll_step_ms = 300
 
 # Color definition
 
@@ -37,17 +88,119 @@ ring_color_r = 10
 ring_color_g = 0
 ring_color_b = 0
 
+# Brightness of both strips, 1-255. The time of day mode scales it, see power.py
+brightness = 255
+
+# Time of day mode the renderer last applied to the ring animation, see render_frame()
+display_mode = None
+# Estimated current per mode, see power.py and the "stats" serial command
+power_model = power.PowerModel()
+# With one frame a second and nothing else to do, sleep the chip between the frames with
+# machine.lightsleep(), see idle_sleep(). Only with the frames on core 0.
+lightsleep_idle = True
+# Only sleep this long or longer, and wake up this long before the frame
+lightsleep_min_ms = 50
+lightsleep_wake_ms = 5
+# Stay awake after a line on the serial console, a line that comes in during a lightsleep
+# waits for the end of it, too late for a SET. The first minute after boot too.
+console_awake_ms = 60000
+awake_until = time.ticks_add(boot_ms, console_awake_ms)
+# The RTC sync watches the DS1307 for its second edge, it needs the chip awake
+syncing = False
+
 # Init the external RTC Module and stuff
-i2c_bus_rtc = machine.SoftI2C(scl=machine.Pin(18), sda=machine.Pin(19), freq=4000)
+i2c_freq = 4000
+i2c_bus_rtc = machine.SoftI2C(scl=machine.Pin(18), sda=machine.Pin(19), freq=i2c_freq)
 i2c_rtc = DS1307(i2c_bus_rtc)
 
 # Init the internal RTC
 rtc = machine.RTC()
 
-def copy_rtc_to_internal_rtc_with_tz():
-    print("RTC Sync initiated")
+# Keeps the internal RTC in line with the DS1307, see sync_task()
+clock_sync = rtc_sync.RTCSync(i2c_rtc, rtc)
+# The first aligned sync after boot, it also starts the drift measurement
+first_sync_delay = 10
+
+# Settings, last good time and faults, kept in the DS1307 RAM across resets, see resume.py
+checkpoint = resume.Checkpoint(i2c_rtc)
+
+# The DS1307 restarts its second on the ack of the seconds byte, which is the third byte
+# of a time write (address, register, seconds), 9 clocks each
+ds1307_latch_us = 3 * 9 * 1000000 // i2c_freq
+# Spin on ticks_us() for the last bit of the wait for a time-set edge, sleeping isn't that exact
+set_spin_us = 3000
+
+# ticks_ms at the last second boundary of the internal RTC, see lock_second()
+second_edge = None
+
+# Frame statistics of render_task()
+frames_rendered = 0
+# Frames that started more than late_frame_ms after they were due
+late_frames = 0
+late_frame_ms = 5
+# Frames that were skipped because the loop was blocked for longer than a frame
+missed_frames = 0
+# ticks_ms() of the first frame, ticks start at 0 on power on so it is the boot time
+first_frame_ms = None
+# Render this long after the second boundary, so time.time() has surely moved on
+frame_margin_ms = 10
+# Slowest frame and latest start since telemetry_task() last looked
+frame_max_us = 0
+late_max_ms = 0
+
+# Frame timings, syncs, time sets and resets as binary records, see telemetry.py.
+# With telemetry on, they replace the prints of the syncs.
+telemetry_log = telemetry.Telemetry()
+
+# Run the frames on the second core: render_core1() composes and shows them while core 0 keeps
+# the serial console, the RTC sync and everything else on the I2C bus. See run()
+dual_core = False
+# Cleared to stop render_core1()
+render_running = True
+# Set by render_core1() when a frame failed, core 0 resets the clock for it, see publish_task()
+render_fault = 0
+
+# Everything a frame needs from the settings and the time keeping. Core 0 publishes it with
+# publish_state(), the renderer picks it up without a lock, see doublebuf.py
+STATE_EDGE = const(0)
+STATE_SEG_END = const(1)
+STATE_OFFSET = const(2)
+STATE_NEXT_OFFSET = const(3)
+STATE_COLOR = const(4)  # r, g, b, ring r, ring g, ring b
+STATE_BRIGHTNESS = const(10)  # with the mode applied
+STATE_MODE = const(11)
+STATE_SIZE = const(12)
+frames_in = doublebuf.DoubleBuffer(STATE_SIZE)
+# The state the renderer last read
+frame_state = frames_in.latest
+# Filled by publish_state() before it is handed over
+state_out = array.array("q", [0 for _ in range(STATE_SIZE)])
+
+# Time every render stage, see perf.py and the "stats" serial command.
+# With 0 all the profiling below is compiled out.
+_PROFILE = const(1)
+if _PROFILE:
+    import perf
+
+# not_before is a UTC time the DS1307 can't be behind of, unless it lost its time
+def copy_rtc_to_internal_rtc_with_tz(not_before=0):
+    if not telemetry_log.enabled:
+        print("RTC Sync initiated")
     current_datetime = i2c_rtc.datetime()
 
+    ds_seconds = time.mktime(
+        (current_datetime[0], current_datetime[1], current_datetime[2],
+         current_datetime[4], current_datetime[5], current_datetime[6], 0, 0, 0)
+    )
+    if ds_seconds < not_before:
+        print("DS1307 is behind the last good time, starting from that")
+        t = time.gmtime(not_before)
+        current_datetime = (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+        # Back into the DS1307 as well, or the next sync takes the lost time again.
+        # A DS1307 that lost its time usually has its oscillator halted too.
+        i2c_rtc.halt(False)
+        i2c_rtc.datetime(current_datetime)
+
     tuple_for_onboard_rtc = (
         current_datetime[0],
         current_datetime[1],
@@ -59,25 +212,100 @@ def copy_rtc_to_internal_rtc_with_tz():
         0,
     )
     rtc.datetime(tuple_for_onboard_rtc)
-    posix_tz.set_tz('CEST-1CET,M3.2.0/2:00:00,M11.1.0/2:00:00')
-    local_datetime = posix_tz.localtime()
-    print(posix_tz.localtime())
-    print(f"New UTC Date: {local_datetime[0]}-{local_datetime[1]}-{local_datetime[2]} {local_datetime[3]}:{local_datetime[4]}:{local_datetime[5]}")
-
-def render_single_digit(digits, digit, offset, colon, dot, color_r, color_g, color_b):
-    for led in digit_to_led[digit]:
-        digits.set_pixel(led + offset * 17, color_r, color_g, color_b)
-        if colon:
-            for led in digit_to_led["colon"]:
-                digits.set_pixel(led + offset * 17, color_r, color_g, color_b)
-        if dot:
-            for led in digit_to_led["dot"]:
-                digits.set_pixel(led + offset * 17, color_r, color_g, color_b)
+    # Setting the RTC restarts its current second
+    global second_edge
+    second_edge = time.ticks_ms()
+    clock_sync.invalidate()
+    posix_tz.set_tz(tz_string)
+    publish_state()
+    if not telemetry_log.enabled:
+        local_datetime = posix_tz.localtime()
+        print(local_datetime)
+        print(f"New UTC Date: {local_datetime[0]}-{local_datetime[1]}-{local_datetime[2]} {local_datetime[3]}:{local_datetime[4]}:{local_datetime[5]}")
+
+def publish_state():
+    # Hand the renderer the current settings, second boundary and zone offset. Core 0 only,
+    # it owns posix_tz. The offset comes with the next change, so a frame on the other side
+    # of a DST change is right before the next publish_state()
+    n = time.time()
+    offset, seg_end, next_offset = posix_tz.segment(n)
+    mode = power.mode_at((n + offset) % 86400 // 60)
+    state_out[STATE_EDGE] = second_edge
+    state_out[STATE_SEG_END] = seg_end
+    state_out[STATE_OFFSET] = offset
+    state_out[STATE_NEXT_OFFSET] = next_offset
+    state_out[STATE_COLOR] = color_r
+    state_out[STATE_COLOR + 1] = color_g
+    state_out[STATE_COLOR + 2] = color_b
+    state_out[STATE_COLOR + 3] = ring_color_r
+    state_out[STATE_COLOR + 4] = ring_color_g
+    state_out[STATE_COLOR + 5] = ring_color_b
+    # Dim, but not so far that the brightest channel of the digit or ring color goes dark
+    lowest = max(
+        power.lit_brightness(max(color_r, color_g, color_b)),
+        power.lit_brightness(max(ring_color_r, ring_color_g, ring_color_b)),
+    )
+    state_out[STATE_BRIGHTNESS] = power.scale_brightness(brightness, mode, lowest)
+    state_out[STATE_MODE] = mode
+    frames_in.write(state_out)
+
+
+def state_localtime(state):
+    # posix_tz.localtime() from the published state, the renderer doesn't touch posix_tz
+    n = time.time()
+    if n < state[STATE_SEG_END]:
+        return time.localtime(n + state[STATE_OFFSET])
+    return time.localtime(n + state[STATE_NEXT_OFFSET])
+
+
+def restore_checkpoint():
+    # Take the settings from before the reset, returns False if there was no checkpoint
+    global tz_string, color_r, color_g, color_b, ring_color_r, ring_color_g, ring_color_b
+    try:
+        if not checkpoint.load():
+            return False
+    except OSError:
+        return False
+    color_r, color_g, color_b, ring_color_r, ring_color_g, ring_color_b = checkpoint.colors
+    set_brightness(checkpoint.brightness)
+    if checkpoint.zone is not None:
+        # Already parsed, the TZ string is only made up for the GET command
+        tz_string = posix_tz.format_tz(checkpoint.zone)
+        posix_tz.add_zone(tz_string, checkpoint.zone)
+    return True
+
+
+# last_good when the time was just set or synced, so it is known to be right
+def save_checkpoint(last_good=False):
+    checkpoint.colors = (color_r, color_g, color_b, ring_color_r, ring_color_g, ring_color_b)
+    checkpoint.brightness = brightness
+    checkpoint.zone = posix_tz.global_tzd
+    if last_good:
+        checkpoint.last_good = time.time()
+    try:
+        checkpoint.save()
+    except OSError:
+        print("Could not save the checkpoint")
+
+
+# Remember the fault across the reset, with everything else in the checkpoint
+def fail(code):
+    checkpoint.fault(code)
+    try:
+        save_checkpoint()
+    except:
+        pass
+    machine.reset()
+
+
+def render_single_digit(digits, glyphs, digit, offset, colon, dot):
+    # The compiled block covers all 17 LEDs, so this also clears the unused ones
+    start = offset * leds_per_digit
+    digits.pixels[start:start + leds_per_digit] = glyphs[(digit, colon, dot)]
 
 
 def render_and_display_time(digits, hour, minutes, seconds, color_r, color_g, color_b):
-    # Clear the digit buffer
-    digits.fill(0, 0, 0)
+    glyphs = compile_glyphs(digits, color_r, color_g, color_b)
 
     # We want the colon only blink every second second
     display_colon = False
@@ -88,105 +316,300 @@ def render_and_display_time(digits, hour, minutes, seconds, color_r, color_g, co
     hour_string = f"{hour:02d}"
     minute_string = f"{minutes:02d}"
 
-    render_single_digit(
-        digits, hour_string[0], 0, False, False, color_r, color_g, color_b
-    )
-    render_single_digit(
-        digits, hour_string[1], 1, display_colon, False, color_r, color_g, color_b
-    )
-    render_single_digit(
-        digits, minute_string[0], 2, False, False, color_r, color_g, color_b
-    )
-    render_single_digit(
-        digits, minute_string[1], 3, False, False, color_r, color_g, color_b
-    )
-
-    # Show the digits
-    digits.show()
+    render_single_digit(digits, glyphs, hour_string[0], 0, False, False)
+    render_single_digit(digits, glyphs, hour_string[1], 1, display_colon, False)
+    render_single_digit(digits, glyphs, minute_string[0], 2, False, False)
+    render_single_digit(digits, glyphs, minute_string[1], 3, False, False)
 
 
 def render_and_display_date(digits, day, month, color_r, color_g, color_b):
-    # Clear the digit buffer
-    digits.fill(0, 0, 0)
+    glyphs = compile_glyphs(digits, color_r, color_g, color_b)
 
     # We need always 2 digits per field, and to have them easily accesible we use strings
     day_string = f"{day:02d}"
     month_string = f"{month:02d}"
 
-    render_single_digit(
-        digits, day_string[0], 0, False, False, color_r, color_g, color_b
-    )
-    render_single_digit(
-        digits, day_string[1], 1, False, True, color_r, color_g, color_b
-    )
-    render_single_digit(
-        digits, month_string[0], 2, False, False, color_r, color_g, color_b
+    render_single_digit(digits, glyphs, day_string[0], 0, False, False)
+    render_single_digit(digits, glyphs, day_string[1], 1, False, True)
+    render_single_digit(digits, glyphs, month_string[0], 2, False, False)
+    render_single_digit(digits, glyphs, month_string[1], 3, False, True)
+
+
+def render_and_display_seconds_ring(ring, seconds, ms, color_r, color_g, color_b):
+    # Only the LEDs the animation touched are redrawn, the rest keep the ring color
+    state = frame_state
+    ring_animation.colors(
+        color_r, color_g, color_b, state[STATE_COLOR + 3], state[STATE_COLOR + 4], state[STATE_COLOR + 5]
     )
-    render_single_digit(
-        digits, month_string[1], 3, False, True, color_r, color_g, color_b
+    ring_animation.render(seconds, ms)
+
+
+# new_second is True for the first frame of a second, ms is how far into the second the frame is
+# Everything comes from frame_state, so it can run on either core
+def render_frame(new_second=True, ms=0):
+    global ring_second, text_shown, display_mode
+    state = frame_state
+    if _PROFILE:
+        t = time.ticks_us()
+    if state[STATE_MODE] != display_mode:
+        display_mode = state[STATE_MODE]
+        ring_animation.limit(power.EFFECT[display_mode], power.FPS[display_mode])
+    if state[STATE_BRIGHTNESS] != ring.brightness():
+        # Applied here, so only the rendering core touches the strips
+        for strip in strips.order:
+            strip.brightness(state[STATE_BRIGHTNESS])
+    if new_second:
+        ring_second = rtc.datetime()[6]
+    text = scroll
+    if text is not None and text.render(
+        time.ticks_ms(), digits.pack(state[STATE_COLOR], state[STATE_COLOR + 1], state[STATE_COLOR + 2])
+    ):
+        # A message has the digits until it has scrolled through
+        text_shown = True
+        if _PROFILE:
+            t = perf.lap(perf.DIGITS, t)
+    elif new_second or text_shown:
+        # The digits only change once a second, or right after a message
+        text_shown = False
+        local_datetime = state_localtime(state)
+        if _PROFILE:
+            t = perf.lap(perf.LOCALTIME, t)
+        render_digits(local_datetime, state[STATE_COLOR], state[STATE_COLOR + 1], state[STATE_COLOR + 2])
+        if _PROFILE:
+            t = perf.lap(perf.DIGITS, t)
+    render_and_display_seconds_ring(
+        ring, ring_second, ms, state[STATE_COLOR], state[STATE_COLOR + 1], state[STATE_COLOR + 2]
     )
+    if _PROFILE:
+        t = perf.lap(perf.RING, t)
+
+    # Show the ring and the digits, unless the frame is the same as the last one sent
+    strips.show_if_changed()
+    if _PROFILE:
+        perf.lap(perf.SHOW, t)
+
+
+def render_digits(local_datetime, color_r, color_g, color_b):
+    # We want to display the time for 15s, then 5s with the date
+    if (
+        # Block 0: 0s up to 15s
+        0 <= local_datetime[5] <= 15 or
+        # Block 1: 21s to 35s
+        21 <= local_datetime[5] <= 35 or
+        # Block 2: 40s to 55s
+        40 <= local_datetime[5] <= 55
+    ):
+        render_and_display_time(
+            digits,
+            local_datetime[3],
+            local_datetime[4],
+            local_datetime[5],
+            color_r,
+            color_g,
+            color_b,
+        )
+    else:
+        render_and_display_date(
+            digits, local_datetime[2], local_datetime[1], color_r, color_g, color_b
+        )
 
-    # Show the digits
-    digits.show()
 
+async def lock_second():
+    # time.time() only has whole seconds, so find the boundary by watching it change
+    global second_edge
+    start = time.time()
+    while time.time() == start:
+        await asyncio.sleep(0.005)
+    second_edge = time.ticks_ms()
+    publish_state()
+
+
+class FrameSchedule:
+    # When the frames are due: the first frame of every second comes right after the second
+    # boundary, the animation frames follow every ring_animation.frame_ms() until the next one
+    def __init__(self, edge):
+        # second_at of the last frame rendered
+        self.rendered_second = None
+        self.move(edge)
+
+    def move(self, edge):
+        # New second boundaries, the RTC was set
+        self.edge = edge
+        # Second boundary the next frame belongs to, and how far after it the frame is due
+        self.second_at = edge
+        self.frame_at = frame_margin_ms
+        while time.ticks_diff(self.deadline(), time.ticks_ms()) <= 0:
+            self.second_at = time.ticks_add(self.second_at, 1000)
+
+    def deadline(self):
+        return time.ticks_add(self.second_at, self.frame_at)
+
+    def advance(self, frame_ms):
+        self.frame_at += frame_ms
+        if self.frame_at >= 1000:
+            self.second_at = time.ticks_add(self.second_at, 1000)
+            self.frame_at = frame_margin_ms
+
+
+# The ring animation sets the frame rate. A scrolling message needs four frames a step, the
+# frames restart at every second boundary so they don't line up with the steps.
+def frame_period():
+    frame_ms = ring_animation.frame_ms()
+    text = scroll
+    if text is not None and not text.done and text.step_ms // 4 < frame_ms:
+        return text.step_ms // 4
+    return frame_ms
+
+
+def show_text(text):
+    # Scroll text over the digits once, then go back to the time
+    global scroll
+    scroll = font.ScrollingText(digits, text, scroll_step_ms)
+
+
+# ms until the next frame is due, after picking up the latest frame state
+def frame_delay(schedule):
+    frames_in.read()
+    if frame_state[STATE_EDGE] != schedule.edge:
+        schedule.move(frame_state[STATE_EDGE])
+    return time.ticks_diff(schedule.deadline(), time.ticks_ms())
+
+
+# Render the frame that is due, or the one after it when the loop was blocked for too long
+def run_frame(schedule):
+    global frames_rendered, late_frames, missed_frames, first_frame_ms, frame_max_us, late_max_ms
+    # A sleep can end a hair before the deadline, that frame is on time
+    late = max(0, time.ticks_diff(time.ticks_ms(), schedule.deadline()))
+    # Skip the frames that are already over
+    frame_ms = frame_period()
+    while late >= frame_ms:
+        missed_frames += 1
+        if _PROFILE:
+            perf.count(perf.MISSED)
+        late -= frame_ms
+        schedule.advance(frame_ms)
+    if late > late_frame_ms:
+        late_frames += 1
+        if _PROFILE:
+            perf.count(perf.LATE)
+
+    start = time.ticks_us()
+    render_frame(schedule.second_at != schedule.rendered_second, schedule.frame_at)
+    schedule.rendered_second = schedule.second_at
+    frames_rendered += 1
+    if first_frame_ms is None:
+        first_frame_ms = time.ticks_ms()
+    took = time.ticks_diff(time.ticks_us(), start)
+    power_model.frame(took)
+    if took > frame_max_us:
+        frame_max_us = took
+    if late > late_max_ms:
+        late_max_ms = late
+    if _PROFILE:
+        perf.record(perf.FRAME, took)
+        perf.record(perf.LATENESS, late * 1000)
+        perf.gc_check()
+    # Being late eats into the budget just like rendering slowly
+    ring_animation.account(took + late * 1000)
+    schedule.advance(frame_period())
+
+
+# True if the chip can sleep for the delay ms until the next frame
+def can_lightsleep(delay):
+    global awake_until
+    if awake_until is not None:
+        if time.ticks_diff(awake_until, time.ticks_ms()) > 0:
+            return False
+        # Forget it, or the ticks wrap around and it is in the future again
+        awake_until = None
+    # Nothing animates: the ring ticks and no message scrolls
+    return lightsleep_idle and not syncing and delay >= lightsleep_min_ms and frame_period() >= 1000
+
+
+# Sleep the chip until shortly before the next frame, returns the ms left until it
+async def idle_sleep(schedule, delay):
+    # The strips stop with the clocks, let the frame go out first
+    await strips.wait()
+    start = time.ticks_us()
+    machine.lightsleep(delay - lightsleep_wake_ms)
+    power_model.slept(time.ticks_diff(time.ticks_us(), start))
+    return frame_delay(schedule)
+
+
+async def render_task():
+    # The frames on core 0, between the other tasks
+    await lock_second()
+    schedule = FrameSchedule(second_edge)
+    while True:
+        delay = frame_delay(schedule)
+        if delay > 0 and can_lightsleep(delay):
+            delay = await idle_sleep(schedule, delay)
+        if delay > 0:
+            # sleep_ms, a float delay / 1000 in single precision can wake a ms early
+            await asyncio.sleep_ms(delay)
+        try:
+            run_frame(schedule)
+        except:
+            fail(resume.FAULT_RENDER)
 
-def render_and_display_seconds_ring(ring, seconds, color_r, color_g, color_b):
-    # Clear the digit buffer
-    ring.fill(ring_color_r, ring_color_g, ring_color_b)
-    ring.set_pixel(seconds, color_r, color_g, color_b)
 
-    # Show the digits
-    ring.show()
+def render_core1():
+    # The frames on core 1, nothing else runs there so it can just sleep until they are due
+    global render_fault
+    frames_in.read()
+    schedule = FrameSchedule(frame_state[STATE_EDGE])
+    try:
+        while render_running:
+            delay = frame_delay(schedule)
+            if delay > 0:
+                time.sleep_ms(delay)
+            run_frame(schedule)
+    except:
+        # Saving the fault needs the I2C bus, which belongs to core 0
+        render_fault = resume.FAULT_RENDER
 
 
-def render(_):
-    local_datetime = posix_tz.localtime()
+async def publish_task():
+    # Keep the zone offset in the frame state current, and reset the clock when core 1 failed
+    while True:
+        if render_fault:
+            fail(render_fault)
+        publish_state()
+        await asyncio.sleep(1)
+
+
+async def sync_task():
+    # Resync the internal RTC from the DS1307, as often as the measured drift needs it
+    global second_edge, syncing
     try:
-        # At every hour at minute 0, we resync the external RTC to the internal RTC
-        if local_datetime[4] == 0:
-            try:
-                copy_rtc_to_internal_rtc_with_tz()
-            except:
-                machine.reset()
-
-        # We want to display the time for 15s, then 5s with the date
-        if (
-            # Block 0: 0s up to 15s
-            0 <= local_datetime[5] <= 15 or
-            # Block 1: 21s to 35s
-            21 <= local_datetime[5] <= 35 or
-            # Block 2: 40s to 55s
-            40 <= local_datetime[5] <= 55
-        ):
-            render_and_display_time(
-                digits,
-                local_datetime[3],
-                local_datetime[4],
-                local_datetime[5],
-                color_r,
-                color_g,
-                color_b,
-            )
-        else:
-            render_and_display_date(
-                digits, local_datetime[2], local_datetime[1], color_r, color_g, color_b
-            )
-        render_and_display_seconds_ring(
-            ring, rtc.datetime()[6], color_r, color_g, color_b
+        clock_sync.load()
+    except OSError:
+        pass
+    interval = first_sync_delay
+    while True:
+        await asyncio.sleep(interval)
+        syncing = True
+        try:
+            if await clock_sync.sync(checkpoint.last_good) is None:
+                print("DS1307 is behind the last good time, setting it from the internal RTC")
+                await restore_ds1307()
+            posix_tz.set_tz(tz_string)
+        except:
+            fail(resume.FAULT_SYNC)
+        syncing = False
+        second_edge = clock_sync.edge
+        publish_state()
+        interval = clock_sync.interval
+        save_checkpoint(last_good=True)
+        telemetry_log.record(
+            telemetry.SYNC, interval // 60, time.time(), clock_sync.last_offset_ms or 0, clock_sync.drift_ppb
         )
-        time.sleep(0.1)
-    except:
-        machine.reset()
+        if not telemetry_log.enabled:
+            print("RTC Sync done, offset", clock_sync.last_offset_ms, "ms, drift", clock_sync.drift_ppb, "ppb, next in", interval, "s")
 
 
-def get_new_time():
-    print(
-        'To set the clock, run TZ=UTC date +"%Y, %m, %d, 0, %H, %M, %S" > /dev/$yourserialport\n'
-    )
-    timeinput = input().split(",")
-
-    if timeinput[0] == "x":
-        raise Exception()
+def set_time(line):
+    timeinput = line.split(",")
 
     timetuple = tuple(
         [
@@ -211,20 +634,283 @@ def get_new_time():
     )
 
     copy_rtc_to_internal_rtc_with_tz()
+    save_checkpoint(last_good=True)
+    telemetry_log.record(telemetry.TIMESET, 0, time.time(), 0, 0)
+
+
+async def wait_until_us(at):
+    delay = time.ticks_diff(at, time.ticks_us())
+    if delay > set_spin_us:
+        await asyncio.sleep((delay - set_spin_us) / 1000000)
+    while time.ticks_diff(at, time.ticks_us()) > 0:
+        pass
+
+
+# Set the DS1307 to epoch exactly at ticks_us at, and the internal RTC on the second boundary
+# after it. Returns how many us after at the DS1307 was set, or None if at was too close.
+async def set_time_on_edge(epoch, at):
+    global second_edge
+    write_at = time.ticks_add(at, -ds1307_latch_us)
+    if time.ticks_diff(write_at, time.ticks_us()) < 0:
+        return None
+    t = time.gmtime(epoch)
+    await wait_until_us(write_at)
+    error = time.ticks_diff(time.ticks_us(), write_at)
+    i2c_rtc.datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+
+    # Setting the internal RTC restarts its second as well, so wait for the next DS1307 edge
+    await wait_until_us(time.ticks_add(at, 1000000))
+    t = time.gmtime(epoch + 1)
+    rtc.datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+    second_edge = time.ticks_ms()
+    clock_sync.aligned(epoch + 1, second_edge)
+    posix_tz.set_tz(tz_string)
+    publish_state()
+    save_checkpoint(last_good=True)
+    telemetry_log.record(telemetry.TIMESET, 1, epoch, error, 0)
+    return error
+
+
+# The DS1307 lost its time while the clock ran, the internal RTC still has it: write it back
+# on one of its second boundaries
+async def restore_ds1307():
+    i2c_rtc.halt(False)
+    into = time.ticks_diff(time.ticks_ms(), second_edge) % 1000
+    # The next boundary, or the one after it when the next is too close for the write
+    seconds = 1 if (1000 - into) * 1000 > ds1307_latch_us + set_spin_us else 2
+    epoch = time.time() + seconds
+    await set_time_on_edge(epoch, time.ticks_add(time.ticks_us(), (seconds * 1000 - into) * 1000))
+
+
+# Answer a timeset frame, received_us is ticks_us when the line was read
+async def handle_frame(line, received_us):
+    try:
+        fields = timeset.decode(line)
+    except ValueError as e:
+        print(timeset.encode("NAK", 0, e))
+        return
+    command, seq = fields[0], fields[1]
+    try:
+        await handle_command(command, seq, fields[2:], received_us)
+    except (ValueError, IndexError):
+        print(timeset.encode("NAK", seq, "format"))
+    except OSError:
+        # The DS1307 didn't answer, the host can try again
+        print(timeset.encode("NAK", seq, "i2c"))
+
+
+def set_brightness(value):
+    # The renderer applies it to the strips, see render_frame()
+    global brightness
+    brightness = min(max(value, 1), 255)
+
+
+async def handle_command(command, seq, args, received_us):
+    global tz_string, color_r, color_g, color_b, ring_color_r, ring_color_g, ring_color_b
+    if command == "PING":
+        print(timeset.encode("PONG", seq, time.ticks_diff(time.ticks_us(), received_us)))
+    elif command == "SET" and len(args) == 2:
+        epoch = int(args[0])
+        error = await set_time_on_edge(epoch, time.ticks_add(received_us, int(args[1])))
+        if error is None:
+            print(timeset.encode("NAK", seq, "late"))
+        else:
+            print(timeset.encode("ACK", seq, epoch, error))
+    elif command == "TZ":
+        # The TZ string has commas of its own, it is the rest of the frame
+        tz = ",".join(args)
+        try:
+            posix_tz.set_tz(tz)
+        except ValueError:
+            posix_tz.set_tz(tz_string)
+            print(timeset.encode("NAK", seq, "tz"))
+            return
+        tz_string = tz
+        publish_state()
+        save_checkpoint()
+        print(timeset.encode("ACK", seq))
+        # Show which zone the clock is in now
+        tzd = posix_tz.global_tzd
+        dst = tzd[posix_tz.START] is not None and posix_tz.segment(time.time())[0] == tzd[posix_tz.DST_OFFSET]
+        name = tzd[posix_tz.DST_NAME] if dst else tzd[posix_tz.NAME]
+        if name is None:
+            # A zone resumed from the checkpoint has no names, show the offset the TZ string has
+            name = posix_tz._format_name(None, tzd[posix_tz.DST_OFFSET] if dst else tzd[posix_tz.OFFSET])
+        show_text(name.strip("<>"))
+    elif command == "COLOR" and len(args) == 6:
+        values = [int(value) for value in args]
+        for value in values:
+            if not 0 <= value <= 255:
+                raise ValueError()
+        color_r, color_g, color_b, ring_color_r, ring_color_g, ring_color_b = values
+        publish_state()
+        save_checkpoint()
+        print(timeset.encode("ACK", seq))
+    elif command == "BRIGHT" and len(args) == 1:
+        set_brightness(int(args[0]))
+        publish_state()
+        save_checkpoint()
+        print(timeset.encode("ACK", seq))
+    elif command == "TEXT":
+        # The message may have commas of its own, it is the rest of the frame
+        show_text(",".join(args))
+        print(timeset.encode("ACK", seq))
+    elif command == "GET":
+        print(
+            timeset.encode(
+                "CONF", seq, brightness,
+                color_r, color_g, color_b, ring_color_r, ring_color_g, ring_color_b,
+                time.time(), tz_string,
+            )
+        )
+    else:
+        print(timeset.encode("NAK", seq, "unknown"))
+
+
+def print_stats():
+    print(f"Frames: {frames_rendered} rendered, {late_frames} late, {missed_frames} missed")
+    print(f"Boot to first frame: {first_frame_ms}ms, {time.ticks_diff(first_frame_ms, boot_ms)}ms after main.py started")
+    print(f"Faults: {checkpoint.faults}, last: {', '.join(checkpoint.fault_history()) or 'none'}")
+    transactions, errors, latency, max_latency = i2c_rtc.stats()
+    print(f"DS1307: {transactions} transactions, {errors} errors, {latency}us average, {max_latency}us max")
+    print(f"Ring animation: {animation.EFFECTS[ring_animation.level]}, dropped {ring_animation.drops} times")
+    print(f"Telemetry {'on' if telemetry_log.enabled else 'off'}, {telemetry_log.written} records, {telemetry_log.dropped} dropped")
+    print(f"Frames on core {1 if dual_core else 0}, frame state published {frames_in.writes} times, {frames_in.retries} reads retried")
+    print(f"Display mode: {power.MODES[state_out[STATE_MODE]]}, brightness {state_out[STATE_BRIGHTNESS]}")
+    print(power_model.report())
+    if _PROFILE:
+        print(perf.report())
+    else:
+        print("Profiling is compiled out, set _PROFILE in main.py")
+
+
+def open_serial():
+    # Non-blocking line reader for the USB serial console
+    return asyncio.StreamReader(sys.stdin)
+
+
+def telemetry_output():
+    # The USB serial console, for bytes
+    return sys.stdout.buffer
+
+
+async def telemetry_task():
+    # Frames and power records every second, then out with everything recorded since, in one packet
+    global frame_max_us, late_max_ms
+    frames = frames_rendered
+    missed = missed_frames
+    last = time.ticks_ms()
+    while True:
+        await asyncio.sleep(1)
+        now = time.ticks_ms()
+        mode = state_out[STATE_MODE]
+        power_model.update(mode, strips.shown, time.ticks_diff(now, last))
+        last = now
+        telemetry_log.record(telemetry.POWER, mode, now, power_model.leds_ua, power_model.core_ua)
+        telemetry_log.record(
+            telemetry.FRAMES,
+            min(frames_rendered - frames, 0xFFFF),
+            time.ticks_ms(),
+            frame_max_us,
+            min(late_max_ms, 0xFFFF),
+            min(missed_frames - missed, 0xFFFF),
+        )
+        frames = frames_rendered
+        missed = missed_frames
+        frame_max_us = 0
+        late_max_ms = 0
+        telemetry_log.flush(telemetry_output())
 
 
-if __name__ == "__main__":
+class Quit(Exception):
+    # Raised by serial_task() on x, run() stops the clock and returns to the REPL
+    pass
 
-    try:
-        copy_rtc_to_internal_rtc_with_tz()
-    except:
-        machine.reset()
-    timer1 = machine.Timer()
-    timer1.init(period=100, callback=render)
+
+async def serial_task():
+    global awake_until
+    serial = open_serial()
+    # Frames are answered without the help text, it would only get in the way of update_time.py
+    prompt = True
     while True:
+        if prompt:
+            print(
+                'To set the clock, run python update_time.py /dev/$yourserialport\n'
+                'or TZ=UTC date +"%Y, %m, %d, 0, %H, %M, %S" > /dev/$yourserialport\n'
+            )
+        prompt = True
+        line = await serial.readline()
+        received_us = time.ticks_us()
+        awake_until = time.ticks_add(time.ticks_ms(), console_awake_ms)
+        if isinstance(line, bytes):
+            line = line.decode()
+        if timeset.is_frame(line):
+            prompt = False
+            await handle_frame(line, received_us)
+            continue
+        if line.strip() == "stats":
+            print_stats()
+            continue
+        if line.strip() == "stats reset":
+            if _PROFILE:
+                perf.reset()
+            continue
+        if line.strip() in ("telemetry on", "telemetry off"):
+            telemetry_log.enabled = line.strip() == "telemetry on"
+            continue
+        if line.startswith("say "):
+            show_text(line[4:].strip())
+            continue
+        if line.strip() == "x":
+            raise Quit()
         try:
-            get_new_time()
-        except ValueError as e:
+            set_time(line)
+        except (ValueError, IndexError) as e:
             print("Got wrong time format, try again")
             print(e)
+        except OSError as e:
+            print("Could not reach the DS1307, try again")
+            print(e)
+
 
+async def run():
+    # Sync the time once, then render, resync and listen for commands side by side
+    global first_frame_ms, render_running
+    try:
+        resumed = restore_checkpoint()
+        copy_rtc_to_internal_rtc_with_tz(checkpoint.last_good)
+        # Show the time right away, render_task() takes over from the next second boundary
+        frames_in.read()
+        render_frame()
+        first_frame_ms = time.ticks_ms()
+    except:
+        fail(resume.FAULT_BOOT)
+    if resumed:
+        print(f"Resumed from the checkpoint, {checkpoint.faults} faults so far, last: {', '.join(checkpoint.fault_history()) or 'none'}")
+    history = checkpoint.history
+    telemetry_log.record(
+        telemetry.RESET, checkpoint.faults, checkpoint.last_good, time.ticks_diff(first_frame_ms, boot_ms),
+        history[0], history[1], history[2], 0,
+    )
+    tasks = [asyncio.create_task(task()) for task in (publish_task, sync_task, serial_task, telemetry_task)]
+    # A task that dies would leave the display frozen, reset the clock instead
+    try:
+        if dual_core:
+            # Core 1 takes over the frames from the next second boundary
+            await lock_second()
+            _thread.start_new_thread(render_core1, ())
+        else:
+            tasks.append(asyncio.create_task(render_task()))
+        await asyncio.gather(*tasks)
+    except Quit:
+        # x on the console: stop everything and end main.py, to get to the REPL
+        render_running = False
+        for task in tasks:
+            task.cancel()
+        print("Stopped the clock")
+    except Exception:
+        fail(resume.FAULT_TASK)
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
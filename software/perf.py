@@ -0,0 +1,127 @@
+"""
+Lightweight per-stage timing on time.ticks_us().
+
+Every stage keeps its last WINDOW samples in one preallocated array, so
+recording a sample is a subtraction and two array stores, nothing is
+allocated. Statistics are only worked out when report() is asked for them:
+min/avg/max/p99 over the window, plus the total number of samples.
+
+    t = time.ticks_us()
+    ...
+    t = perf.lap(perf.DIGITS, t)
+
+Besides the stages there are counters for missed deadlines, late frames and
+garbage collections. MicroPython has no hook for collections, so
+gc_check() counts the times the free heap grew since the last check.
+
+main.py only calls into this module behind a const() flag, so with the flag
+off the calls are compiled out and cost nothing.
+"""
+
+import array
+import gc
+import time
+
+# Samples kept per stage, a power of two. 10 s of frames at 50 fps, and enough that the
+# p99 leaves out the 5 slowest instead of being the max. 2 KB a stage
+WINDOW = 512
+
+# Stages
+LOCALTIME = 0
+DIGITS = 1
+RING = 2
+SHOW = 3
+FRAME = 4
+LATENESS = 5
+STAGES = ("localtime", "digits", "ring", "show", "frame", "lateness")
+
+# Counters
+MISSED = 0
+LATE = 1
+GC = 2
+COUNTERS = ("missed", "late", "gc")
+
+samples = array.array("I", [0 for _ in range(len(STAGES) * WINDOW)])
+counts = array.array("I", [0 for _ in range(len(STAGES))])
+counters = array.array("I", [0 for _ in range(len(COUNTERS))])
+
+# Free heap at the last gc_check(), or collections so far on a port without gc.mem_free()
+last_free = 0
+
+
+def record(stage, us):
+    n = counts[stage]
+    samples[stage * WINDOW + (n & (WINDOW - 1))] = us
+    counts[stage] = n + 1
+
+
+# Record the time since start for stage, returns now so the next stage can start from it
+def lap(stage, start):
+    now = time.ticks_us()
+    record(stage, time.ticks_diff(now, start))
+    return now
+
+
+def count(counter, n=1):
+    counters[counter] += n
+
+
+def collections():
+    # CPython, for the host simulator
+    total = 0
+    for generation in gc.get_stats():
+        total += generation["collections"]
+    return total
+
+
+def gc_check():
+    global last_free
+    if hasattr(gc, "mem_free"):
+        free = gc.mem_free()
+        if free > last_free:
+            counters[GC] += 1
+        last_free = free
+    else:
+        total = collections()
+        counters[GC] += total - last_free
+        last_free = total
+
+
+def reset():
+    global last_free
+    for i in range(len(counts)):
+        counts[i] = 0
+    for i in range(len(counters)):
+        counters[i] = 0
+    last_free = gc.mem_free() if hasattr(gc, "mem_free") else collections()
+
+
+# (samples so far, min, avg, max, p99) of the last WINDOW samples of stage, or None without samples
+def stats(stage):
+    n = counts[stage]
+    if n == 0:
+        return None
+    window = sorted(samples[stage * WINDOW : stage * WINDOW + min(n, WINDOW)])
+    return (
+        n,
+        window[0],
+        sum(window) // len(window),
+        window[-1],
+        window[len(window) * 99 // 100],
+    )
+
+
+def report():
+    lines = []
+    for stage in range(len(STAGES)):
+        result = stats(stage)
+        if result is None:
+            lines.append(f"{STAGES[stage]:10s} no samples")
+            continue
+        n, low, avg, high, p99 = result
+        lines.append(f"{STAGES[stage]:10s} n={n} min={low}us avg={avg}us max={high}us p99={p99}us")
+    lines.append(" ".join(f"{COUNTERS[i]}={counters[i]}" for i in range(len(COUNTERS))))
+    return "\n".join(lines)
+
+
+reset()
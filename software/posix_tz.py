@@ -5,56 +5,212 @@ time.time() is int on esp32 Micropython, float in CPython
 time.localtime() is tuple in Micropython, struct/class/namedtuple in CPython (3.x) with different attributes
 """
 
-from collections import namedtuple
-import re
 import time
 
 
 global_tzd = None  # or UTC
 
-m_tuple = namedtuple('m', ('month', 'occur', 'day', 'hour', 'min', 'sec'))
+# A zone is a plain tuple, index it with these:
+# (name, offset, dst_name, start, end, dst_offset), offsets are seconds east of UTC.
+# Without DST the last four are None.
+NAME = 0
+OFFSET = 1
+DST_NAME = 2
+START = 3
+END = 4
+DST_OFFSET = 5
+
+# Transition rules are plain tuples too, the time is seconds after local midnight and may be
+# negative or past 24h:
+#   Mm.n.d -> (month, occur, day, time)
+#   Jn     -> (day, False, time), 1-365, never counting February 29th
+#   n      -> (day, True, time), 0-365
+
+
+def parse_hms(s):
+    """[+-]hh[:mm[:ss]] to seconds"""
+    if not s:
+        raise ValueError('empty time')
+    sign = 1
+    if s[0] in '+-':
+        sign = -1 if s[0] == '-' else 1
+        s = s[1:]
+    parts = s.split(':')
+    if not 1 <= len(parts) <= 3:
+        raise ValueError('invalid time %r' % s)
+    secs = 0
+    for part in parts:
+        secs = secs * 60 + int(part)
+    for _ in range(3 - len(parts)):
+        secs *= 60
+    return sign * secs
+
+
 def parse_mstr(s):
-    if s[0] != 'M':
-        raise NotImplemented('non-M %s not supported' % s[0])  # e.g. Julian
+    """Parse a DST start/end rule: Mm.n.d, Jn or n, each with an optional /time (default 2:00:00)"""
     ss = s.split('/')
+    if len(ss) > 2 or not ss[0]:
+        raise ValueError('invalid rule %r' % s)
+    t = parse_hms(ss[1]) if len(ss) == 2 else 2 * 60 * 60
     m = ss[0]
-    if len(ss) == 2:
-        t = ss[1]
-    else:
-        t = '2:00:00'
-    month, occur, day = map(int, m[1:].split('.'))  # TODO catch non-int errors
-    h, min, sec = map(int, t.split(':'))  # TODO catch non-int errors
-    return m_tuple(month, occur, day, h, min, sec)
-
-name_offset_re = re.compile(r"^([A-Z]+)([+-]?)(\d+)(?::(\d+))?(?::(\d+))?")  # TODO revisit this
-# timezone details tuple
-tzd_tuple = namedtuple('tzd', ('name', 'offset', 'dst_name', 'start', 'end', 'dst_offset'))  # offsets are seconds
+    if m[0] == 'M':
+        month, occur, day = map(int, m[1:].split('.'))
+        if not (1 <= month <= 12 and 1 <= occur <= 5 and 0 <= day <= 6):
+            raise ValueError('invalid rule %r' % s)
+        return (month, occur, day, t)
+    if m[0] == 'J':
+        day = int(m[1:])
+        if not 1 <= day <= 365:
+            raise ValueError('invalid rule %r' % s)
+        return (day, False, t)
+    day = int(m)
+    if not 0 <= day <= 365:
+        raise ValueError('invalid rule %r' % s)
+    return (day, True, t)
+
+
+# The part before the rules is: std offset [dst [offset]]
+# Names are 3+ letters or <quoted> (e.g. <+03>), offsets [+-]hh[:mm[:ss]].
+# These scan s from i and return (value, index after it), or (None, i) if there is none.
+def _scan_name(s, i):
+    if i < len(s) and s[i] == '<':
+        j = s.find('>', i)
+        if j <= i + 1:
+            return None, i
+        return s[i + 1:j], j + 1
+    j = i
+    while j < len(s) and s[j].isalpha():
+        j += 1
+    if j - i < 3:
+        return None, i
+    return s[i:j], j
+
+
+def _scan_offset(s, i):
+    j = i
+    if j < len(s) and s[j] in '+-':
+        j += 1
+    if j == len(s) or not s[j].isdigit():
+        return None, i
+    while j < len(s) and (s[j].isdigit() or s[j] == ':'):
+        j += 1
+    return parse_hms(s[i:j]), j
+
+
+# Used when a DST name is given without rules, same as glibc
+default_rules = 'M3.2.0,M11.1.0'
+
+
 def parse_tz(s):
-    #import pdb; pdb.set_trace()
-    ss = s.split(',')
-    if len(ss) == 1:
+    comma = s.find(',')
+    if comma < 0 and s.isalpha():
+        # just a name, e.g. UTC
+        return (s, 0, None, None, None, None)
+    head = s if comma < 0 else s[:comma]
+    tzname, i = _scan_name(head, 0)
+    std_offset, i = _scan_offset(head, i) if tzname is not None else (None, i)
+    if std_offset is None:
+        raise ValueError('invalid TZ %r' % s)
+    # POSIX offsets are hours west of UTC, ours are seconds east
+    timezone = -std_offset
+    if i == len(head):
+        if comma >= 0:
+            raise ValueError('rules without DST name in TZ %r' % s)
         # no DST
-        #import pdb; pdb.set_trace()
-        x = re.match(name_offset_re, s)
-        if x:
-            #tzname, sign, d_hour, d_min, d_sec = re.match(name_offset_re, s).groups(default=0)  # Cpython
-            tzname, sign, d_hour, d_min, d_sec = x.group(1), x.group(2), x.group(3) or 0, x.group(4) or 0, x.group(5) or 0  # micropython
-            offset = (int(d_hour) * 60 + int(d_min)) * 60 + int(d_sec)
-            timezone = offset * (1 if sign == "-" else -1)
-        else:
-            tzname = s
-            timezone = 0
-        return tzd_tuple(tzname, timezone, None, None, None, None)
-    if len(ss) == 3:
-        # FIXME refactor, remove duplication
-        x = re.match(name_offset_re, ss[0])
-        tzname, sign, d_hour, d_min, d_sec = x.group(1), x.group(2), x.group(3) or 0, x.group(4) or 0, x.group(5) or 0  # micropython
-        offset = (int(d_hour) * 60 + int(d_min)) * 60 + int(d_sec)
-        timezone = offset * (1 if sign == "-" else -1)
-        # TODO parse DST name and offset, for now default
-        return tzd_tuple(tzname, timezone, '?DST?', parse_mstr(ss[1]), parse_mstr(ss[2]), timezone + 1 * 60 * 60)
+        return (tzname, timezone, None, None, None, None)
+
+    dst_name, i = _scan_name(head, i)
+    if dst_name is None:
+        raise ValueError('invalid TZ %r' % s)
+    dst_timezone = timezone + 1 * 60 * 60
+    if i < len(head):
+        dst_offset, i = _scan_offset(head, i)
+        if dst_offset is None or i != len(head):
+            raise ValueError('invalid TZ %r' % s)
+        dst_timezone = -dst_offset
+
+    rules = (default_rules if comma < 0 else s[comma + 1:]).split(',')
+    if len(rules) != 2:
+        raise ValueError('invalid TZ %r' % s)
+    return (tzname, timezone, dst_name, parse_mstr(rules[0]), parse_mstr(rules[1]), dst_timezone)
+
+
+# TZ string -> zone, so resyncs don't parse the same string again. Cleared when full.
+ZONE_CACHE_SIZE = 8
+_zone_cache = {}
+def get_zone(s):
+    try:
+        return _zone_cache[s]
+    except KeyError:
+        if len(_zone_cache) >= ZONE_CACHE_SIZE:
+            _zone_cache.clear()
+        tzd = _zone_cache[s] = parse_tz(s)
+        return tzd
+
+def _format_hms(secs):
+    sign = '-' if secs < 0 else ''
+    secs = abs(secs)
+    out = sign + str(secs // 3600)
+    if secs % 3600:
+        out += ':%02d' % (secs // 60 % 60)
+    if secs % 60:
+        out += ':%02d' % (secs % 60)
+    return out
+
+
+def _format_name(name, offset):
+    if name is None:
+        # Named after the offset, like tzdata does for zones without an abbreviation
+        secs = abs(offset)
+        name = ('+' if offset >= 0 else '-') + '%02d' % (secs // 3600)
+        if secs % 3600:
+            name += '%02d' % (secs // 60 % 60)
+    if len(name) >= 3 and name.isalpha():
+        return name
+    return '<' + name + '>'
+
+
+def _format_rule(p):
+    if len(p) == 3:
+        rule = str(p[0]) if p[1] else 'J%d' % p[0]
     else:
-        NotImplementedError('FIXME for %r)' %s)
+        rule = 'M%d.%d.%d' % (p[0], p[1], p[2])
+    return rule + '/' + _format_hms(p[-1])
+
+
+def format_tz(tzd):
+    """The POSIX TZ string of a zone, names that are None are made up from the offsets"""
+    s = _format_name(tzd[NAME], tzd[OFFSET]) + _format_hms(-tzd[OFFSET])
+    if tzd[START] is None:
+        return s
+    s += _format_name(tzd[DST_NAME], tzd[DST_OFFSET])
+    if tzd[DST_OFFSET] != tzd[OFFSET] + 60 * 60:
+        s += _format_hms(-tzd[DST_OFFSET])
+    return s + ',' + _format_rule(tzd[START]) + ',' + _format_rule(tzd[END])
+
+
+def add_zone(s, tzd):
+    """Put an already parsed zone in the cache, so get_zone(s) and set_tz(s) don't parse s"""
+    if len(_zone_cache) >= ZONE_CACHE_SIZE:
+        _zone_cache.clear()
+    _zone_cache[s] = tzd
+
+
+def days_from_civil(year, month, mday):
+    """Days since 1970-01-01 of a date, without time.mktime(), which is local time on CPython"""
+    # Howard Hinnant's days_from_civil, the year starts in March so February comes last
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (9 if month <= 2 else -3)) + 2) // 5 + mday - 1
+    return era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+
+
+def year_start(year):
+    """UTC instant of January 1st of year"""
+    return days_from_civil(year, 1, 1) * 86400
+
 
 def determine_change(p, year, offset):
     """
@@ -75,59 +231,210 @@ def determine_change(p, year, offset):
           * 2:00:00 - 2am
       * M11.1.0/2:00:00
 
+    Jn (1-365) and n (0-365) Julian day formats, Jn never counts February 29th, n does.
+
     offset - offsets are seconds
     """
-    month, occur, day, h, min, sec = p
-    min_offset = offset // 60
-    h, min = (h - (min_offset // 60)), (min - (min_offset % 60))
-
-    month_days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-    if ((((year % 4) == 0) and ((year % 100) != 0)) or (year % 400) == 0):
-        month_days[1] = 29
-
-    # Gauss date algo, determine day of week for first day of the month
-    d = 1
-    x = year - ((14 - month) // 12)
-    y = (x + (x // 4)) - ((x // 100)) + ((x // 400))
-    z = month + 12 * ((((14 - month)) // 12)) - 2;
-    first_dom = (d + y + ((31 * z) // 12)) % 7
-    #print('Gauss first of the %r month %r' % (month, first_dom))
-
-    # determine the day of the month
-    dom = 1 + (occur - 1) * 7 + (day - first_dom) % 7
-
-    if dom > month_days[month - 1]:
-        dom -= 7
-    
-    tr = time.mktime((year, month, dom, h, min, sec, 0, 0, 0))  # NOTE 9 params for CPython... 8 for MicroPython - this is the GMT0 time
-    return tr  # NOTE for CPython, DST start time could be off an hour... Fine in Micropython
+    leap = (((year % 4) == 0) and ((year % 100) != 0)) or (year % 400) == 0
 
+    if len(p) == 3:
+        # Jn or n
+        day, counts_leap = p[0], p[1]
+        yday = day if counts_leap else day - 1
+        if not counts_leap and leap and day >= 60:
+            yday += 1
+        midnight = year_start(year) + yday * 86400
+    else:
+        month, occur, day = p[0], p[1], p[2]
+        month_days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+        if leap:
+            month_days[1] = 29
+
+        # Gauss date algo, determine day of week for first day of the month
+        d = 1
+        x = year - ((14 - month) // 12)
+        y = (x + (x // 4)) - ((x // 100)) + ((x // 400))
+        z = month + 12 * ((((14 - month)) // 12)) - 2;
+        first_dom = (d + y + ((31 * z) // 12)) % 7
+        #print('Gauss first of the %r month %r' % (month, first_dom))
+
+        # determine the day of the month
+        dom = 1 + (occur - 1) * 7 + (day - first_dom) % 7
+
+        if dom > month_days[month - 1]:
+            dom -= 7
+        midnight = days_from_civil(year, month, dom) * 86400
+
+    return midnight + p[-1] - offset
+
+
+# Transition table for global_tzd, see build_table(). _tr_at are sorted UTC instants,
+# _tr_offset[i] is the offset in effect from _tr_at[i] up to _tr_at[i + 1].
+# The first entry is the start of the window, the last one its end.
+# Only a few years are built up front so set_tz() stays cheap at boot, the table moves on
+# by itself when the time runs past its end, see tz_offset()
+TABLE_YEARS_BEFORE = 1
+TABLE_YEARS_AFTER = 1
+_tr_at = []
+_tr_offset = []
+# The current segment of the table: _seg_start <= n < _seg_end has offset _seg_offset
+_seg_i = 0
+_seg_start = 0
+_seg_end = 0
+_seg_offset = 0
+
+
+def year_changes(tzd, year):
+    """(start, end) UTC instants of DST in year"""
+    return determine_change(tzd[START], year, tzd[OFFSET]), determine_change(tzd[END], year, tzd[DST_OFFSET])
+
+
+def build_table(tzd, first_year, last_year):
+    """Precompute every transition from the start of first_year to the end of last_year"""
+    global _tr_at, _tr_offset
+    _tr_at, _tr_offset = transition_table(tzd, first_year, last_year)
+    _seek(0)
+
+
+def transition_table(tzd, first_year, last_year):
+    """(at, offset) lists like _tr_at and _tr_offset, for any zone"""
+    window_start = year_start(first_year)
+    window_end = year_start(last_year + 1)
+    if tzd[START] is None:
+        # no DST, a single segment
+        return [window_start, window_end], [tzd[OFFSET], tzd[OFFSET]]
+
+    changes = []
+    for year in range(first_year, last_year + 1):
+        start_date, end_date = year_changes(tzd, year)
+        changes.append((start_date, tzd[DST_OFFSET]))
+        changes.append((end_date, tzd[OFFSET]))
+    changes.sort()
+    # The offset at the start of the window is the one the previous year ended with
+    prev_start, prev_end = year_changes(tzd, first_year - 1)
+    first_offset = tzd[DST_OFFSET] if prev_start > prev_end else tzd[OFFSET]  # southern hemisphere is in DST over new year
+
+    at_list, offset_list = [window_start], [first_offset]
+    for at, offset in changes:
+        at_list.append(at)
+        offset_list.append(offset)
+    at_list.append(window_end)
+    offset_list.append(tzd[OFFSET])
+    return at_list, offset_list
+
+
+def _seek(i):
+    global _seg_i, _seg_start, _seg_end, _seg_offset
+    _seg_i = i
+    _seg_start = _tr_at[i]
+    _seg_end = _tr_at[i + 1]
+    _seg_offset = _tr_offset[i]
 
-def set_tz(tz):
+
+def table_offset(n):
+    """Offset for n from the transition table, None if n is outside the table window"""
+    if _seg_start <= n < _seg_end:
+        return _seg_offset
+    if not _tr_at[0] <= n < _tr_at[-1]:
+        return None
+    i = _seg_i
+    if n >= _seg_end and n < _tr_at[i + 2]:
+        # the usual case, time moved on into the next segment
+        i += 1
+    else:
+        # time jumped
+        i = search(_tr_at, n)
+    _seek(i)
+    return _seg_offset
+
+
+def search(at, n):
+    """Binary search for the last transition in at that is <= n, at[0] <= n < at[-1]"""
+    lo, hi = 0, len(at) - 1
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if at[mid] <= n:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def set_tz(tz, year=None):
+    """Set the global timezone and precompute its transitions for the years around year (default: now)"""
+    set_zone(get_zone(tz), year)
+
+
+def set_zone(tzd, year=None):
+    """set_tz() for an already parsed zone"""
     global global_tzd
-    global_tzd = parse_tz(tz)
+    if year is None:
+        year = time.gmtime()[0]
+    if tzd is global_tzd and _tr_at and _tr_at[0] <= year_start(year) < _tr_at[-1]:
+        # same zone and the table still covers this year, e.g. on a resync
+        return
+    global_tzd = tzd
+    build_table(global_tzd, year - TABLE_YEARS_BEFORE, year + TABLE_YEARS_AFTER)
+
+
+def segment(n):
+    """(offset at n, UTC instant the offset changes next, offset after that) for global_tzd"""
+    if global_tzd is None:
+        return 0, n + 86400, 0
+    offset = tz_offset(n, global_tzd)
+    if _seg_start <= n < _seg_end:
+        return offset, _seg_end, _tr_offset[_seg_i + 1]
+    # outside the transition table nothing is known about the next change, ask again in a day
+    return offset, n + 86400, offset
+
+
+# rather than require functool lru (which is not built into MicroPython), cache manually.
+# Only used outside the transition table window or for a tzd other than global_tzd,
+# cleared when full so it can't grow without bound.
+LOCALTIME_CACHE_SIZE = 8
+_localtime_cache = {}
+def tz_offset(n, tzd):
+    """UTC offset in seconds in effect at n for tzd"""
+    if tzd is global_tzd:
+        offset = table_offset(n)
+        if offset is not None:
+            return offset
+        if _tr_at and _tr_at[-1] <= n < _tr_at[-1] + 366 * 86400:
+            # The clock ran into the year after the table, build the table around it
+            year = time.gmtime(n)[0]
+            build_table(tzd, year - TABLE_YEARS_BEFORE, year + TABLE_YEARS_AFTER)
+            return table_offset(n)
+    if tzd[START] is None:
+        return tzd[OFFSET]
+
+    year = time.gmtime(n)[0]  # FIXME, assume DST never starts/ends on first/last day of a year - probably a safe thing todo
+    key = (tzd, year)
+    try:
+        start_date, end_date = _localtime_cache[key]
+    except KeyError:
+        if len(_localtime_cache) >= LOCALTIME_CACHE_SIZE:
+            _localtime_cache.clear()
+        start_date, end_date = _localtime_cache[key] = year_changes(tzd, year)
+    if start_date < end_date:
+        dst = start_date <= n < end_date
+    else:
+        dst = not (end_date <= n < start_date)
+    return tzd[DST_OFFSET] if dst else tzd[OFFSET]
+
 
-_localtime_cache = {}  # rather than require functool lru (which is not built into MicroPython), cache manually with no clean up. Assume use case doesn't span hundreds of years
 def localtime(n=None, tzd=None):
     if n is None:
         n = time.time()
     tzd = tzd or global_tzd
 
-    if tzd:
-        time_tuple = time.gmtime(n)
-        year = time_tuple[0]  # FIXME, assume DST never starts/ends on first/last day of a year - probably a safe thing todo
-        #start_date, end_date = _localtime_cache.get((tzd.start, year), determine_change(tzd.start, year)), _localtime_cache.get((tzd.end, year), determine_change(tzd.end, year)
-        try:
-            start_date, end_date = _localtime_cache[(tzd.start, year)], _localtime_cache[(tzd.end, year)]
-        except KeyError:
-            start_date, end_date = determine_change(tzd.start, year, tzd.offset), determine_change(tzd.end, year, tzd.dst_offset)
-            _localtime_cache[(tzd.start, year)], _localtime_cache[(tzd.end, year)] = start_date, end_date
-        if start_date < n < end_date:
-            n += tzd.dst_offset
-        else:
-            n += tzd.offset
+    if tzd is global_tzd and _seg_start <= n < _seg_end:
+        # fast path, still in the same segment of the transition table
+        n += _seg_offset
+    elif tzd:
+        n += tz_offset(n, tzd)
     # else assume UTC/GMT0
-    return time.localtime(n)
+    # gmtime(), on CPython localtime() would add the host's zone on top, on MicroPython they are the same
+    return time.gmtime(n)
 
 def debug_localtime():
     t = time.time()
@@ -136,8 +443,8 @@ def debug_localtime():
     print(parse_tz('PST8PDT,M3.2.0/2:00:00,M11.1.0/2:00:00'))
 
     parsed = parse_tz('PST8PDT,M3.2.0,M11.1.0')
-    start_date = determine_change(parsed.start, 2025)
-    end_date = determine_change(parsed.end, 2025)
+    start_date = determine_change(parsed[START], 2025, parsed[OFFSET])
+    end_date = determine_change(parsed[END], 2025, parsed[DST_OFFSET])
     print(time.localtime(start_date), start_date)
     print(time.localtime(end_date), end_date)
 
@@ -0,0 +1,104 @@
+"""
+Batch conversion with posix_tz, for logs and telemetry on the host. The times are a NumPy
+array, or an array("q") (or any sequence) where there is no NumPy, like on the clock. Every
+call builds its own transition table for the years the times span, the global one isn't
+touched.
+
+Kept out of posix_tz, so the clock doesn't load it at boot.
+"""
+
+import array
+import sys
+import time
+
+import posix_tz
+
+
+def _numpy_for(times):
+    # numpy if times is a NumPy array, else None. A caller with NumPy arrays has imported it
+    # already, so there is no import to try on the clock
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(times, numpy.ndarray):
+        return numpy
+    return None
+
+
+def _table_for(tzd, lowest, highest):
+    return posix_tz.transition_table(tzd, time.gmtime(int(lowest))[0], time.gmtime(int(highest))[0])
+
+
+def utc_offsets(times, tzd=None):
+    """UTC offsets in seconds of every UTC time in times, as an array like times"""
+    tzd = tzd or posix_tz.global_tzd
+    numpy = _numpy_for(times)
+    if numpy is not None:
+        if not len(times) or not tzd:
+            return numpy.full(len(times), tzd[posix_tz.OFFSET] if tzd else 0, dtype=numpy.int64)
+        at, offsets = _table_for(tzd, times.min(), times.max())
+        i = numpy.searchsorted(numpy.array(at, dtype=numpy.int64), times, side="right") - 1
+        return numpy.array(offsets, dtype=numpy.int64)[i]
+
+    result = array.array("i")
+    if not len(times) or not tzd:
+        for n in times:
+            result.append(tzd[posix_tz.OFFSET] if tzd else 0)
+        return result
+    at, offsets = _table_for(tzd, min(times), max(times))
+    # Logs are mostly in order, so try the segment of the last time first
+    i = 0
+    start, end = at[0], at[1]
+    for n in times:
+        if not start <= n < end:
+            i = posix_tz.search(at, n)
+            start, end = at[i], at[i + 1]
+        result.append(offsets[i])
+    return result
+
+
+def _civil(days):
+    """(year, month, mday, yday) of days since 1970, for ints and NumPy arrays alike"""
+    # Howard Hinnant's civil_from_days, the year starts in March so February comes last
+    days = days + 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    mday = doy - (153 * mp + 2) // 5 + 1
+    january = (mp >= 10) * 1
+    month = mp + 3 - 12 * january
+    year = yoe + era * 400 + january
+    leap = (((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)) * 1
+    yday = doy - 305 + (1 - january) * (365 + leap)
+    return year, month, mday, yday
+
+
+def localtime_many(times, tzd=None):
+    """
+    The local time of every UTC time in times, as the arrays
+    (year, month, mday, hour, minute, second, weekday, yday), the fields of localtime().
+    """
+    if _numpy_for(times) is not None:
+        local = times + utc_offsets(times, tzd)
+        days = local // 86400
+        secs = local - days * 86400
+        year, month, mday, yday = _civil(days)
+        # 1970-01-01 was a Thursday, weekday 3 with Monday 0
+        return year, month, mday, secs // 3600, secs // 60 % 60, secs % 60, (days + 3) % 7, yday
+
+    fields = [array.array("i") for _ in range(8)]
+    year_a, month_a, mday_a, hour_a, minute_a, second_a, weekday_a, yday_a = fields
+    for n, offset in zip(times, utc_offsets(times, tzd)):
+        n += offset
+        days = n // 86400
+        secs = n - days * 86400
+        year, month, mday, yday = _civil(days)
+        year_a.append(year)
+        month_a.append(month)
+        mday_a.append(mday)
+        hour_a.append(secs // 3600)
+        minute_a.append(secs // 60 % 60)
+        second_a.append(secs % 60)
+        weekday_a.append((days + 3) % 7)
+        yday_a.append(yday)
+    return tuple(fields)
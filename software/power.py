@@ -0,0 +1,131 @@
+"""
+Display modes by the time of day, and an estimate of the current the clock
+draws in each of them.
+
+The local day is split into modes, see SCHEDULE. Every mode scales the
+brightness and caps the ring animation: in the evening the ring sweeps at
+half the frame rate and half the brightness, at night it only ticks, at an
+eighth of the brightness, but never so dim that the colors go dark. With
+the ring ticking and no message scrolling the digits only change once a
+second, so there is one frame a second and main.py puts the chip in
+lightsleep between the frames.
+
+PowerModel estimates the current from what the strips show and how the
+core spent its time: rendering frames, waiting in the event loop or in
+lightsleep. The figures below are estimates from the datasheets, not
+measurements of this clock, change them once it was measured on USB.
+"""
+
+DAY = 0
+EVENING = 1
+NIGHT = 2
+MODES = ("day", "evening", "night")
+
+# (local time in minutes after midnight, mode) from then on, in order of the time
+SCHEDULE = ((6 * 60 + 30, DAY), (21 * 60, EVENING), (23 * 60, NIGHT))
+# Brightness of every mode, in 1/256 of the brightness set with BRIGHT
+SCALE = (256, 128, 32)
+# The fastest ring effect of every mode, and its frames a second
+EFFECT = ("comet", "sweep", "tick")
+FPS = (50, 25, 1)
+
+# Current estimates in uA
+# A WS2812B with all channels off, its controller still draws this
+LED_IDLE_UA = 700
+# One color channel of a WS2812B at 255
+CHANNEL_UA = 12000
+# The RP2040 and the board: running at 125 MHz, waiting in the event loop and in lightsleep
+CORE_RUN_UA = 25000
+CORE_IDLE_UA = 15000
+CORE_SLEEP_UA = 2000
+
+
+def mode_at(minute, schedule=SCHEDULE):
+    """Mode at minute after local midnight, before the first entry the day's last mode goes on"""
+    mode = schedule[-1][1]
+    for start, entry in schedule:
+        if minute < start:
+            break
+        mode = entry
+    return mode
+
+
+def lit_brightness(level):
+    """The lowest brightness that still lights a channel at level, ws2812b rounds to the nearest"""
+    if not level:
+        return 1
+    return (128 + level - 1) // level
+
+
+def scale_brightness(brightness, mode, lowest=1):
+    """brightness dimmed for mode, but never below lowest, see lit_brightness()"""
+    return max(lowest, brightness * SCALE[mode] >> 8)
+
+
+def leds_ua(pixels):
+    """Current of LEDs showing pixels, packed colors with brightness and gamma applied"""
+    total = 0
+    for pixel in pixels:
+        total += (pixel & 0xFF) + (pixel >> 8 & 0xFF) + (pixel >> 16 & 0xFF)
+    return len(pixels) * LED_IDLE_UA + total * CHANNEL_UA // 255
+
+
+class PowerModel:
+    """
+    frame() and slept() count where the time went, update() turns that and the
+    LEDs into the current, once a second. Anything that isn't a frame or a
+    lightsleep counts as waiting, the other tasks are short next to the frames.
+    The counters aren't locked, with the frames on core 1 an update can lose a frame.
+    """
+
+    def __init__(self, modes=len(MODES)):
+        # Per mode: ms spent in it, and the charge the LEDs and the core drew in uA ms
+        self.ms = [0 for _ in range(modes)]
+        self.leds_charge = [0 for _ in range(modes)]
+        self.core_charge = [0 for _ in range(modes)]
+        # us spent on frames and in lightsleep since the last update()
+        self.run_us = 0
+        self.sleep_us = 0
+        # The last estimate
+        self.leds_ua = 0
+        self.core_ua = 0
+
+    def frame(self, us):
+        self.run_us += us
+
+    def slept(self, us):
+        self.sleep_us += us
+
+    def update(self, mode, pixels, elapsed_ms):
+        """The last elapsed_ms were spent in mode, pixels is what the strips show now"""
+        if elapsed_ms <= 0:
+            return
+        elapsed_us = elapsed_ms * 1000
+        run_us = min(self.run_us, elapsed_us)
+        sleep_us = min(self.sleep_us, elapsed_us - run_us)
+        idle_us = elapsed_us - run_us - sleep_us
+        self.run_us = 0
+        self.sleep_us = 0
+        self.core_ua = (run_us * CORE_RUN_UA + idle_us * CORE_IDLE_UA + sleep_us * CORE_SLEEP_UA) // elapsed_us
+        self.leds_ua = leds_ua(pixels)
+        self.ms[mode] += elapsed_ms
+        self.leds_charge[mode] += self.leds_ua * elapsed_ms
+        self.core_charge[mode] += self.core_ua * elapsed_ms
+
+    def average_ua(self, mode):
+        """(LEDs, core) average current in mode so far"""
+        ms = self.ms[mode]
+        if not ms:
+            return 0, 0
+        return self.leds_charge[mode] // ms, self.core_charge[mode] // ms
+
+    def report(self):
+        lines = [f"Power now: LEDs {self.leds_ua / 1000:.1f}mA, core {self.core_ua / 1000:.1f}mA"]
+        for mode, name in enumerate(MODES):
+            if self.ms[mode]:
+                leds, core = self.average_ua(mode)
+                lines.append(
+                    f"{name}: {self.ms[mode] // 1000}s, LEDs {leds / 1000:.1f}mA, core {core / 1000:.1f}mA, "
+                    f"{(leds + core) * 5 / 1000:.0f}mW at 5V"
+                )
+        return "\n".join(lines)
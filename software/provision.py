@@ -0,0 +1,146 @@
+"""
+Provision every attached clock at once: set the time, push the time zone,
+colors and brightness, then read it all back to verify it.
+
+    python provision.py
+    python provision.py --tz 'GMT0BST,M3.5.0/1,M10.5.0' --color 0,10,0,10,0,0 --brightness 128
+    python provision.py --ports /dev/pts/3 /dev/pts/4
+
+Without --ports every USB serial port of a Raspberry Pi RP2040 is tried,
+anything that doesn't answer a PING is reported as failed. Every clock gets
+its own thread: the serial I/O blocks and every time set needs its own
+timing, see update_time.py. The protocol is described in timeset.py.
+
+To try it without hardware, python -m sim.fleet runs simulated clocks on ptys.
+"""
+
+import argparse
+import concurrent.futures
+import sys
+import time
+
+import serial
+import serial.tools.list_ports
+
+import update_time
+
+# USB vendor id of the Raspberry Pi RP2040, which MicroPython uses
+RP2040_VID = 0x2E8A
+
+# Sequence numbers of the setting frames, the PINGs and the SET use their own
+TZ_SEQ = 200
+COLOR_SEQ = 201
+BRIGHT_SEQ = 202
+GET_SEQ = 203
+
+
+def discover():
+    return sorted(port.device for port in serial.tools.list_ports.comports() if port.vid == RP2040_VID)
+
+
+class Result:
+    def __init__(self, port):
+        self.port = port
+        self.ok = False
+        self.message = ""
+        # One way link delay, and how late the DS1307 was set, in us
+        self.link_us = None
+        self.error_us = None
+        self.elapsed_ms = None
+
+
+def command(port, seq, name, *fields):
+    update_time.send(port, name, seq, *fields)
+    answer = update_time.read_frame(port, seq, 2)
+    if answer[0] == "NAK":
+        raise update_time.TimeSetError(f"{name} refused: {','.join(answer[2:])}")
+    return answer
+
+
+# Differences between what was pushed and the CONF read back, empty if everything matches
+def verify(conf, args):
+    problems = []
+    if args.brightness is not None and int(conf[2]) != min(max(args.brightness, 1), 255):
+        problems.append(f"brightness {conf[2]}")
+    if args.color is not None and [int(value) for value in conf[3:9]] != args.color:
+        problems.append(f"color {','.join(conf[3:9])}")
+    if args.tz is not None and ",".join(conf[10:]) != args.tz:
+        problems.append(f"tz {','.join(conf[10:])}")
+    if not args.no_time and abs(int(conf[9]) - time.time()) > 1:
+        problems.append(f"time {conf[9]}")
+    return problems
+
+
+def provision(path, args):
+    result = Result(path)
+    start = time.monotonic()
+    try:
+        port = serial.Serial(path, args.baud, timeout=0.2)
+    except OSError as e:
+        result.message = str(e)
+        return result
+    try:
+        port.reset_input_buffer()
+        result.link_us = update_time.measure(port, args.pings)
+        if args.tz is not None:
+            command(port, TZ_SEQ, "TZ", args.tz)
+        if args.color is not None:
+            command(port, COLOR_SEQ, "COLOR", *args.color)
+        if args.brightness is not None:
+            command(port, BRIGHT_SEQ, "BRIGHT", args.brightness)
+        if not args.no_time:
+            epoch, result.error_us = update_time.set_clock(port, result.link_us, args.lead_ms)
+        problems = verify(command(port, GET_SEQ, "GET"), args)
+        if problems:
+            result.message = "read back " + ", ".join(problems)
+        else:
+            result.ok = True
+            result.message = "ok"
+    except (OSError, ValueError, IndexError, update_time.TimeSetError) as e:
+        result.message = str(e) or type(e).__name__
+    finally:
+        port.close()
+        result.elapsed_ms = int((time.monotonic() - start) * 1000)
+    return result
+
+
+def parse_color(value):
+    color = [int(part) for part in value.split(",")]
+    if len(color) != 6 or not all(0 <= part <= 255 for part in color):
+        raise argparse.ArgumentTypeError("needs r,g,b,ring r,ring g,ring b, each 0-255")
+    return color
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ports", nargs="+", help="serial ports of the clocks, instead of looking for them")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--pings", type=int, default=8, help="round trips to measure the link delay")
+    parser.add_argument("--lead-ms", type=int, default=300, help="send the SET this long before the second")
+    parser.add_argument("--tz", help="POSIX TZ string")
+    parser.add_argument("--color", type=parse_color, help="digit and ring color, r,g,b,ring r,ring g,ring b")
+    parser.add_argument("--brightness", type=int, help="1-255")
+    parser.add_argument("--no-time", action="store_true", help="leave the time alone")
+    args = parser.parse_args()
+
+    ports = args.ports or discover()
+    if not ports:
+        print("No clocks found")
+        sys.exit(1)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(ports)) as pool:
+        results = list(pool.map(lambda path: provision(path, args), ports))
+
+    print(f"{'PORT':24s} {'LINK':>8s} {'SET ERR':>8s} {'TOOK':>8s}  RESULT")
+    for result in results:
+        link = "-" if result.link_us is None else f"{result.link_us}us"
+        error = "-" if result.error_us is None else f"{result.error_us}us"
+        print(f"{result.port:24s} {link:>8s} {error:>8s} {result.elapsed_ms:>6d}ms  {result.message}")
+    failed = sum(1 for result in results if not result.ok)
+    print(f"{len(results) - failed} of {len(results)} clocks provisioned")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Fast resume after machine.reset() or a power cut.
+
+The runtime state the clock needs for its first frame is checkpointed to the
+DS1307 battery backed RAM, right after the rtc_sync calibration: the colors,
+the brightness, the parsed time zone, the last time the clock was known to
+be right, and a count and short history of the faults that reset it. On boot
+it is read back in one transaction, so the first frame doesn't have to wait
+for a TZ string to be parsed or for the defaults to be overridden.
+
+32 bytes is all the RAM left, so the zone is kept in compact form: offsets
+and rule times in minutes, without the names. Zones that need seconds aren't
+checkpointed, they fall back to the TZ string in main.py.
+"""
+
+import struct
+
+import rtc_sync
+
+CHECKPOINT_MAGIC = b"R1"
+CHECKPOINT_OFFSET = rtc_sync.CAL_OFFSET + rtc_sync.CAL_SIZE
+# magic, checksum, fault count, last faults (newest first), last good time,
+# digit and ring colors, brightness, std and dst offset in minutes, start and end rule
+CHECKPOINT_FORMAT = "<2sBH3sI7BhhBBhBBh"
+HISTORY = 3
+
+# Fault codes, what was running when the clock had to reset
+FAULT_BOOT = 1
+FAULT_RENDER = 2
+FAULT_SYNC = 3
+FAULT_TASK = 4
+FAULT_NAMES = {FAULT_BOOT: "boot", FAULT_RENDER: "render", FAULT_SYNC: "sync", FAULT_TASK: "task"}
+
+# Offset stored when there is no zone in the checkpoint
+NO_ZONE = -32768
+
+
+def minutes(secs):
+    """secs in minutes, None if that loses precision or doesn't fit a short"""
+    if secs % 60 or not -32767 <= secs // 60 <= 32767:
+        return None
+    return secs // 60
+
+
+def pack_rule(rule):
+    """(flags | month or day high bits, occur << 4 | day or day low bits, time in minutes)"""
+    t = minutes(rule[-1])
+    if t is None:
+        return None
+    if len(rule) == 3:
+        day, counts_leap = rule[0], rule[1]
+        return (0x80 | (0x40 if counts_leap else 0) | day >> 8, day & 0xFF, t)
+    return (rule[0], rule[1] << 4 | rule[2], t)
+
+
+def unpack_rule(a, b, t):
+    if a & 0x80:
+        return ((a & 0x01) << 8 | b, bool(a & 0x40), t * 60)
+    return (a, b >> 4, b & 0x0F, t * 60)
+
+
+def pack_zone(tzd):
+    """(std minutes, dst minutes, start rule, end rule), None if the zone doesn't fit"""
+    if tzd is None:
+        return None
+    std = minutes(tzd[1])
+    if std is None:
+        return None
+    if tzd[3] is None:
+        return (std, std, (0, 0, 0), (0, 0, 0))
+    dst = minutes(tzd[5])
+    start = pack_rule(tzd[3])
+    end = pack_rule(tzd[4])
+    if dst is None or start is None or end is None:
+        return None
+    return (std, dst, start, end)
+
+
+def unpack_zone(std, dst, start, end):
+    if std == NO_ZONE:
+        return None
+    if start[0] == 0:
+        return (None, std * 60, None, None, None, None)
+    return (None, std * 60, None, unpack_rule(*start), unpack_rule(*end), dst * 60)
+
+
+def checksum(data):
+    value = 0xA5
+    for byte in data:
+        value ^= byte
+    return value
+
+
+class Checkpoint:
+    def __init__(self, ds1307, offset=CHECKPOINT_OFFSET):
+        self.ds1307 = ds1307
+        self.offset = offset
+        self.faults = 0
+        # Fault codes, newest first, 0 for none
+        self.history = bytearray(HISTORY)
+        # UTC time the clock was last known to be right, 0 if never
+        self.last_good = 0
+        # (r, g, b, ring r, ring g, ring b), brightness and the zone tuple, see posix_tz
+        self.colors = None
+        self.brightness = None
+        self.zone = None
+
+    def load(self):
+        """Read the checkpoint, returns False if there is none or it is damaged"""
+        data = self.ds1307.read_ram(self.offset, struct.calcsize(CHECKPOINT_FORMAT))
+        fields = struct.unpack(CHECKPOINT_FORMAT, data)
+        if fields[0] != CHECKPOINT_MAGIC or checksum(data[3:]) != fields[1]:
+            return False
+        self.faults = fields[2]
+        self.history = bytearray(fields[3])
+        self.last_good = fields[4]
+        self.colors = fields[5:11]
+        self.brightness = fields[11]
+        self.zone = unpack_zone(fields[12], fields[13], fields[14:17], fields[17:20])
+        return True
+
+    def save(self):
+        zone = pack_zone(self.zone)
+        if zone is None:
+            zone = (NO_ZONE, 0, (0, 0, 0), (0, 0, 0))
+        std, dst, start, end = zone
+        colors = self.colors or (0, 0, 0, 0, 0, 0)
+        data = bytearray(
+            struct.pack(
+                CHECKPOINT_FORMAT,
+                CHECKPOINT_MAGIC,
+                0,
+                self.faults,
+                bytes(self.history),
+                self.last_good,
+                colors[0], colors[1], colors[2], colors[3], colors[4], colors[5],
+                self.brightness or 255,
+                std,
+                dst,
+                start[0], start[1], start[2],
+                end[0], end[1], end[2],
+            )
+        )
+        data[2] = checksum(data[3:])
+        self.ds1307.write_ram(self.offset, data)
+
+    def fault(self, code):
+        """Count a fault and put it in the history, call save() to keep it"""
+        self.faults = min(self.faults + 1, 0xFFFF)
+        self.history[1:] = self.history[:-1]
+        self.history[0] = code
+
+    def fault_history(self):
+        return [FAULT_NAMES.get(code, str(code)) for code in self.history if code]
@@ -0,0 +1,168 @@
+"""
+Drift aware synchronisation of the internal RTC from the DS1307.
+
+Every sync waits for a second boundary of the DS1307, measures how far the
+internal RTC is off at that moment, sets the internal RTC exactly on the
+next DS1307 boundary and folds the measured offset into a drift estimate.
+The internal RTC and ticks_ms run off the same crystal, so the internal
+time is known to the ms from the ticks since the last aligned set. That
+only works while ticks_diff() can span the interval, so max_interval has
+to stay under 6 days.
+
+The time until the next sync is chosen so the predicted drift stays below
+max_error_ms. It starts at min_interval and at most doubles per sync as
+the estimate settles. The estimate is kept in the DS1307 battery backed
+RAM, so it survives resets and power cuts.
+"""
+
+import asyncio
+import struct
+import time
+
+# Layout of the calibration record at the start of the DS1307 RAM:
+# magic, drift in ppb, weight of the estimate in seconds, samples, next interval in seconds
+CAL_MAGIC = b"TC1"
+CAL_FORMAT = "<3siIHI"
+CAL_OFFSET = 0
+CAL_SIZE = 24  # RAM reserved for the record, it needs struct.calcsize(CAL_FORMAT)
+
+# Give up waiting for the DS1307 to tick after this long, it is probably halted
+EDGE_TIMEOUT_MS = 1500
+
+
+class RTCSync:
+    def __init__(
+        self,
+        ds1307,
+        rtc,
+        min_interval=3600,
+        max_interval=5 * 86400,
+        max_error_ms=250,
+        max_weight=30 * 86400,
+    ):
+        self.ds1307 = ds1307
+        self.rtc = rtc
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_error_ms = max_error_ms
+        # Older measurements count for at most this many seconds, so the estimate follows temperature
+        self.max_weight = max_weight
+
+        # Drift of the internal RTC against the DS1307, positive when the internal RTC runs fast
+        self.drift_ppb = 0
+        self.weight = 0
+        self.samples = 0
+        self.interval = min_interval
+
+        # ticks_ms at a second boundary of the internal RTC, and its time then, from the last
+        # aligned set. None until the first sync, or after the internal RTC was set some other way.
+        self.edge = None
+        self.aligned_at = None
+        # Offset of the internal RTC in ms measured by the last sync
+        self.last_offset_ms = None
+
+    def load(self):
+        """Restore the calibration from the DS1307 RAM, returns False if there was none"""
+        data = self.ds1307.read_ram(CAL_OFFSET, struct.calcsize(CAL_FORMAT))
+        magic, drift_ppb, weight, samples, interval = struct.unpack(CAL_FORMAT, data)
+        if magic != CAL_MAGIC:
+            return False
+        self.drift_ppb = drift_ppb
+        self.weight = weight
+        self.samples = samples
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        return True
+
+    def save(self):
+        self.ds1307.write_ram(
+            CAL_OFFSET,
+            struct.pack(CAL_FORMAT, CAL_MAGIC, self.drift_ppb, self.weight, self.samples, self.interval),
+        )
+
+    def invalidate(self):
+        """The internal RTC was set without aligning it, the next sync can't measure drift"""
+        self.edge = None
+        self.aligned_at = None
+
+    def aligned(self, seconds, edge):
+        """The internal RTC was set to seconds at ticks_ms edge, on a second boundary of the DS1307"""
+        self.edge = edge
+        self.aligned_at = seconds
+
+    def internal_ms(self, ticks):
+        """Internal RTC time in ms at ticks_ms ticks, needs the last aligned set"""
+        return self.aligned_at * 1000 + time.ticks_diff(ticks, self.edge)
+
+    async def ds1307_edge(self):
+        """Wait for the DS1307 seconds to change, returns ticks_ms right after it did"""
+        start = time.ticks_ms()
+        first = self.ds1307.seconds()
+        while self.ds1307.seconds() == first:
+            if time.ticks_diff(time.ticks_ms(), start) > EDGE_TIMEOUT_MS:
+                raise OSError("DS1307 is not ticking")
+            # Let the frames render between reads
+            await asyncio.sleep(0)
+        return time.ticks_ms()
+
+    def estimate(self, offset_ms, elapsed):
+        """Fold an offset built up over elapsed seconds into the drift estimate"""
+        sample_ppb = offset_ms * 1000000 // elapsed
+        weight = min(self.weight, self.max_weight)
+        self.drift_ppb = (self.drift_ppb * weight + sample_ppb * elapsed) // (weight + elapsed)
+        self.weight = weight + elapsed
+        self.samples += 1
+
+    def next_interval(self):
+        if self.samples < 2 or self.drift_ppb == 0:
+            interval = self.min_interval if self.samples < 2 else self.max_interval
+        else:
+            # max_error_ms / drift, in seconds
+            interval = self.max_error_ms * 1000000 // abs(self.drift_ppb)
+        interval = min(interval, self.interval * 2)
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    async def sync(self, not_before=0):
+        """
+        Align the internal RTC to the DS1307 and update the drift estimate, returns the time set.
+        A DS1307 behind not_before lost its time, then nothing is set and it returns None.
+        """
+        edge = await self.ds1307_edge()
+        current_datetime = self.ds1307.datetime()
+        ds_seconds = int(
+            time.mktime(
+                (
+                    current_datetime[0],
+                    current_datetime[1],
+                    current_datetime[2],
+                    current_datetime[4],
+                    current_datetime[5],
+                    current_datetime[6],
+                    0,
+                    0,
+                    0,
+                )
+            )
+        )
+        if ds_seconds < not_before:
+            return None
+
+        if self.edge is not None:
+            # The DS1307 was at ds_seconds exactly at edge, see where the internal RTC was
+            self.last_offset_ms = self.internal_ms(edge) - ds_seconds * 1000
+            elapsed = ds_seconds - self.aligned_at
+            if elapsed > 0:
+                self.estimate(self.last_offset_ms, elapsed)
+
+        # Set the internal RTC on the next DS1307 second boundary, setting it restarts its second
+        delay = time.ticks_diff(time.ticks_add(edge, 1000), time.ticks_ms())
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        ds_seconds += 1
+        t = time.gmtime(ds_seconds)
+        self.rtc.datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+        self.edge = time.ticks_ms()
+        self.aligned_at = ds_seconds
+
+        self.interval = self.next_interval()
+        self.save()
+        return ds_seconds
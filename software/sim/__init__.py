@@ -0,0 +1,124 @@
+"""
+Host-side stand-ins for the MicroPython modules the clock firmware imports,
+so the firmware modules can be imported, exercised and timed under CPython.
+
+    import sim
+    sim.install()
+    import ws2812b
+
+install() gives asyncio the sleep_ms() of MicroPython's asyncio too.
+
+install(virtual=True) also replaces time with a virtual clock (see
+sim.clock), which is what sim.run uses to run main.py faster than real time.
+With realtime as well that clock follows the host's clock instead.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+from sim import machine, micropython, rp2
+from sim.clock import Clock, RealClock
+
+# MicroPython ticks wrap around at 2**30
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+# The virtual clock, None when running on host time
+clock = None
+
+_gmtime = time.gmtime
+_localtime = time.localtime
+
+
+def ticks_us():
+    if clock is not None:
+        # Every poll costs a microsecond, so busy waits on ticks still end
+        clock.advance(1)
+        return clock.us & TICKS_MAX
+    return int(time.perf_counter() * 1000000) & TICKS_MAX
+
+
+def ticks_ms():
+    if clock is not None:
+        return (clock.us // 1000) & TICKS_MAX
+    return int(time.perf_counter() * 1000) & TICKS_MAX
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+def sleep_ms(ms):
+    sleep_us(ms * 1000)
+
+
+def sleep_us(us):
+    if clock is not None:
+        clock.advance(us)
+    else:
+        _sleep(us / 1000000)
+
+
+_sleep = time.sleep
+
+
+def virtual_sleep(seconds):
+    sleep_us(seconds * 1000000)
+
+
+def virtual_time():
+    # MicroPython's time.time() on the rp2 is whole seconds
+    return clock.time_us() // 1000000
+
+
+def virtual_time_ns():
+    return clock.time_us() * 1000
+
+
+def virtual_gmtime(secs=None):
+    return _gmtime(virtual_time() if secs is None else secs)
+
+
+def virtual_localtime(secs=None):
+    return _localtime(virtual_time() if secs is None else secs)
+
+
+def asyncio_sleep_ms(ms):
+    # MicroPython's asyncio has it, CPython's doesn't
+    return asyncio.sleep(ms / 1000)
+
+
+def install(virtual=False, epoch=0, realtime=False):
+    """
+    Register the fake modules and add the MicroPython extensions to time.
+    With virtual, time runs on a virtual clock starting at epoch seconds,
+    with realtime that clock runs at the speed of the host's clock.
+    """
+    global clock
+    sys.modules["machine"] = machine
+    sys.modules["micropython"] = micropython
+    sys.modules["rp2"] = rp2
+    for func in (ticks_us, ticks_ms, ticks_add, ticks_diff, sleep_ms, sleep_us):
+        setattr(time, func.__name__, func)
+    if not hasattr(asyncio, "sleep_ms"):
+        asyncio.sleep_ms = asyncio_sleep_ms
+
+    # The firmware treats time.localtime() and time.mktime() as UTC, like MicroPython
+    os.environ["TZ"] = "UTC"
+    time.tzset()
+
+    if virtual:
+        clock = RealClock(epoch) if realtime else Clock(epoch)
+        time.time = virtual_time
+        time.time_ns = virtual_time_ns
+        time.sleep = virtual_sleep
+        time.gmtime = virtual_gmtime
+        time.localtime = virtual_localtime
+    return clock
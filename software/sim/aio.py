@@ -0,0 +1,127 @@
+"""
+asyncio on the virtual clock: the event loop reads its time from sim.clock
+and, instead of blocking in select(), jumps the clock to the next timer.
+RealTimeLoop is the same on a sim.clock.RealClock, it really sleeps.
+"""
+
+import asyncio
+import collections
+import io
+import math
+import os
+import selectors
+import tty
+
+import sim
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    def __init__(self):
+        super().__init__()
+        # Every time the loop would have gone to sleep
+        self.wakeups = 0
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events and timeout:
+            self.wakeups += 1
+            # Round up, or the loop can wake a hair early forever
+            sim.clock.advance(math.ceil(timeout * 1000000))
+        return events
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self.selector = VirtualSelector()
+        super().__init__(self.selector)
+
+    def time(self):
+        return sim.clock.us / 1000000
+
+
+class RealSelector(selectors.DefaultSelector):
+    def __init__(self):
+        super().__init__()
+        self.wakeups = 0
+
+    def select(self, timeout=None):
+        if timeout != 0:
+            self.wakeups += 1
+        return super().select(timeout)
+
+
+class RealTimeLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self.selector = RealSelector()
+        super().__init__(self.selector)
+
+    def time(self):
+        return sim.clock.us / 1000000
+
+
+class Console:
+    """
+    Stands in for the asyncio.StreamReader on the USB serial console, feed() it lines.
+    What main.py writes as bytes, the telemetry, ends up in buffer.
+    """
+
+    def __init__(self):
+        self.lines = collections.deque()
+        self.event = None
+        self.buffer = io.BytesIO()
+
+    def feed(self, line):
+        self.lines.append(line if line.endswith("\n") else line + "\n")
+        if self.event is not None:
+            self.event.set()
+
+    async def readline(self):
+        while not self.lines:
+            self.event = asyncio.Event()
+            await self.event.wait()
+        return self.lines.popleft()
+
+    def attach(self, loop):
+        pass
+
+
+class PtyConsole(Console):
+    """
+    The serial console on a pseudo terminal, so host tools like update_time.py
+    can talk to the simulated clock. Whatever main.py prints goes there too.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.master, self.slave = os.openpty()
+        # No echo and no line editing, like the USB serial of the clock
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.partial = b""
+        self.buffer = PtyBuffer(self.master)
+
+    def attach(self, loop):
+        loop.add_reader(self.master, self.readable)
+
+    def readable(self):
+        self.partial += os.read(self.master, 4096)
+        *lines, self.partial = self.partial.split(b"\n")
+        for line in lines:
+            self.feed(line.rstrip(b"\r").decode(errors="replace"))
+
+    def write(self, text):
+        os.write(self.master, text.replace("\n", "\r\n").encode())
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class PtyBuffer:
+    """Bytes to the pty as they are, the binary side of PtyConsole"""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def write(self, data):
+        return os.write(self.fd, data)
@@ -0,0 +1,59 @@
+"""
+Virtual time for the simulator.
+
+The clock only moves when the firmware sleeps, waits on a bus or polls
+ticks_us() (every poll costs a microsecond, so busy waits still finish).
+Time spent computing on the host does not count, which keeps runs
+deterministic and lets a simulated day pass in seconds.
+
+RealClock runs in real time instead, for talking to host tools over a pty.
+"""
+
+import time
+
+# time.sleep before sim.install() points it at the virtual clock
+_sleep = time.sleep
+
+
+class Clock:
+    def __init__(self, epoch=0):
+        # Microseconds since the clock was created
+        self.us = 0
+        # Wall clock time, in microseconds since 1970, when us was 0
+        self.epoch_us = int(epoch * 1000000)
+
+    def advance(self, us):
+        self.us += int(us)
+
+    def advance_to(self, us):
+        if us > self.us:
+            self.us = int(us)
+
+    def time_us(self):
+        """Wall clock time in microseconds since 1970"""
+        return self.epoch_us + self.us
+
+    def set_time(self, epoch):
+        """Set the wall clock to epoch seconds"""
+        self.epoch_us = int(epoch * 1000000) - self.us
+
+
+class RealClock(Clock):
+    def __init__(self, epoch=0):
+        self.start_ns = time.monotonic_ns()
+        self.epoch_us = int(epoch * 1000000)
+
+    @property
+    def us(self):
+        return (time.monotonic_ns() - self.start_ns) // 1000
+
+    def advance(self, us):
+        # Busy waits and bus transfers take real time here
+        end = self.us + int(us)
+        if us > 1000:
+            _sleep((us - 1000) / 1000000)
+        while self.us < end:
+            pass
+
+    def advance_to(self, us):
+        self.advance(us - self.us)
@@ -0,0 +1,73 @@
+"""Virtual DS1307: the 64 byte register file, with the time registers running off the simulator clock"""
+
+import calendar
+import time
+
+
+def bcd(value):
+    return (value // 10) << 4 | (value % 10)
+
+
+def unbcd(value):
+    return ((value >> 4) * 10) + (value & 0x0F)
+
+
+class VirtualDS1307:
+    addr = 0x68
+
+    def __init__(self, clock, epoch=0, drift_ppm=0):
+        self.clock = clock
+        # 0x00-0x06 time, 0x07 control, 0x08-0x3F battery backed RAM
+        self.regs = bytearray(64)
+        self.drift_ppm = drift_ppm
+        self.halted = False
+        self.set_epoch(epoch)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        self.at_us = self.clock.us
+
+    def now(self):
+        """Seconds since 1970 the chip currently counts"""
+        if self.halted:
+            return self.epoch
+        elapsed = (self.clock.us - self.at_us) / 1000000
+        return self.epoch + elapsed * (1 + self.drift_ppm / 1000000)
+
+    def _time_regs(self):
+        t = time.gmtime(int(self.now()))
+        return bytes(
+            (
+                bcd(t[5]) | (0x80 if self.halted else 0),
+                bcd(t[4]),
+                bcd(t[3]),
+                t[6] + 1,
+                bcd(t[2]),
+                bcd(t[1]),
+                bcd(t[0] - 2000),
+            )
+        )
+
+    def read(self, reg, nbytes):
+        self.regs[0:7] = self._time_regs()
+        return bytes(self.regs[(reg + i) % 64] for i in range(nbytes))
+
+    def write(self, reg, data):
+        self.regs[0:7] = self._time_regs()
+        for i, value in enumerate(data):
+            self.regs[(reg + i) % 64] = value
+        if reg < 7:
+            regs = self.regs
+            self.halted = bool(regs[0] & 0x80)
+            self.set_epoch(
+                calendar.timegm(
+                    (
+                        unbcd(regs[6]) + 2000,
+                        unbcd(regs[5]),
+                        unbcd(regs[4]),
+                        unbcd(regs[2]),
+                        unbcd(regs[1]),
+                        unbcd(regs[0] & 0x7F),
+                    )
+                )
+            )
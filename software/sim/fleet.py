@@ -0,0 +1,45 @@
+"""
+Run several simulated clocks at once, each in real time with its serial
+console on its own pty, to try provision.py without hardware:
+
+    python -m sim.fleet 8 --seconds 300
+
+The pty paths are printed on one line as soon as every clock is up. Every
+clock's DS1307 starts at a different wrong time, so a time set shows.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clocks", type=int)
+    parser.add_argument("--seconds", type=float, default=300)
+    args = parser.parse_args()
+
+    processes = []
+    paths = []
+    try:
+        for i in range(args.clocks):
+            start = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - 3600 * (i + 1) - 17 * i))
+            process = subprocess.Popen(
+                [sys.executable, "-m", "sim.run", "--pty", "--seconds", str(args.seconds), "--start", start],
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            processes.append(process)
+            # The first line is "Serial console on <path>"
+            paths.append(process.stdout.readline().split()[-1])
+        print(" ".join(paths), flush=True)
+        for process in processes:
+            process.wait()
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Fake machine module"""
+
+import calendar
+import time
+
+import sim
+
+
+class Reset(BaseException):
+    """Raised by reset(), so the simulator can reboot the firmware"""
+
+
+def reset():
+    raise Reset()
+
+
+def freq(hz=None):
+    return 125000000
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+
+    def __init__(self, id, mode=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = value or 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+
+# addr -> device on the I2C bus, a device has read(reg, nbytes) and write(reg, data)
+i2c_devices = {}
+# Number of upcoming I2C transactions that fail with EIO, to test error handling
+i2c_faults = 0
+# Totals over every bus, they survive a reset
+i2c_transactions = 0
+i2c_bytes = 0
+
+
+class SoftI2C:
+    def __init__(self, scl=None, sda=None, freq=400000, timeout=50000):
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+        self.transactions = 0
+        self.bytes = 0
+
+    def _clock_bytes(self, nbytes):
+        global i2c_bytes
+        # Every byte is 9 clocks with the ack, this is what makes a 4kHz bus slow
+        self.bytes += nbytes
+        i2c_bytes += nbytes
+        if sim.clock is not None:
+            sim.clock.advance(nbytes * 9 * 1000000 // self.freq)
+
+    def _transfer(self, addr, nbytes):
+        global i2c_faults, i2c_transactions
+        self.transactions += 1
+        i2c_transactions += 1
+        self._clock_bytes(nbytes)
+        if i2c_faults:
+            i2c_faults -= 1
+            raise OSError(5)
+        if addr not in i2c_devices:
+            raise OSError(19)
+        return i2c_devices[addr]
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        # address + register, repeated start + address, data
+        device = self._transfer(addr, 3 + nbytes)
+        return device.read(memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        buf[:] = self.readfrom_mem(addr, memaddr, len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        # Address, register and the first data byte. A DS1307 takes the write on that
+        # byte's ack, which is where a write of the seconds restarts its second.
+        device = self._transfer(addr, 2 + min(len(buf), 1))
+        device.write(memaddr, bytes(buf))
+        if len(buf) > 1:
+            self._clock_bytes(len(buf) - 1)
+
+    def scan(self):
+        return sorted(i2c_devices)
+
+
+I2C = SoftI2C
+
+
+class RTC:
+    """The internal RTC, it is what time.time() reads"""
+
+    def datetime(self, datetimetuple=None):
+        if datetimetuple is None:
+            t = time.gmtime()
+            return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+        year, month, day, weekday, hour, minute, second = datetimetuple[:7]
+        sim.clock.set_time(calendar.timegm((year, month, day, hour, minute, second)))
+
+
+# Every Timer that was init()ed, the simulator fires their callbacks
+timers = []
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.callback = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=-1):
+        if freq > 0:
+            period = 1000 // freq
+        self.mode = mode
+        self.period_us = period * 1000
+        self.callback = callback
+        self.next_us = sim.clock.us + self.period_us
+        if self not in timers:
+            timers.append(self)
+
+    def deinit(self):
+        if self in timers:
+            timers.remove(self)
+
+
+# Every lightsleep() so far and how long they were, they survive a reset
+lightsleeps = 0
+lightsleep_us = 0
+
+
+def lightsleep(time_ms=None):
+    # Only the timer wakes the simulated chip, the clock jumps ahead like in a sleep
+    global lightsleeps, lightsleep_us
+    if time_ms is None or time_ms <= 0:
+        return
+    lightsleeps += 1
+    lightsleep_us += time_ms * 1000
+    sim.clock.advance(time_ms * 1000)
@@ -0,0 +1,142 @@
+"""
+Fake rp2 module: state machines record the frames written to their TX FIFO,
+DMA channels copy a buffer into a state machine and stay active for as long
+as the real transfer would take.
+"""
+
+import collections
+import time
+
+import sim
+
+# Time on the wire for one 24 bit WS2812 pixel
+WORD_US = 30
+# A pause this long latches the strip, the next word starts a new frame
+RESET_US = 50
+# Frames each state machine keeps in frames
+KEEP_FRAMES = 16
+
+# Called with (state machine, us the frame started, frame) for every finished frame,
+# a frame is a tuple of 0xGGRRBB pixel values
+frame_listeners = []
+
+PIO_BASE = (0x50200000, 0x50300000)
+PIO_TXF0 = 0x10
+
+# id -> StateMachine, so DMA writes to a TXF address land in the right one
+state_machines = {}
+
+
+class PIO:
+    OUT_LOW = 0
+    OUT_HIGH = 1
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+    JOIN_NONE = 0
+    JOIN_TX = 1
+    JOIN_RX = 2
+
+
+def asm_pio(**kwargs):
+    # The program body uses the PIO assembler names, so it is never run here
+    def decorator(program):
+        program.asm_pio_options = kwargs
+        return program
+
+    return decorator
+
+
+class StateMachine:
+    def __init__(self, id, program=None, freq=-1, **kwargs):
+        self.id = id
+        self.program = program
+        self.freq = freq
+        self.kwargs = kwargs
+        self._active = 0
+        # The last KEEP_FRAMES finished frames as (us, frame), see flush()
+        self.frames = collections.deque(maxlen=KEEP_FRAMES)
+        self.frame_count = 0
+        self.frame = []
+        self.frame_us = 0
+        # When the words put so far are out on the wire
+        self.wire_free_us = 0
+        state_machines[id] = self
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = value
+
+    def put(self, value, shift=0):
+        if isinstance(value, int):
+            value = (value,)
+        now = _now_us()
+        if now >= self.wire_free_us + RESET_US:
+            self.flush()
+            self.frame_us = now
+        start = max(now, self.wire_free_us)
+        for word in value:
+            self.frame.append(((word << shift) & 0xFFFFFFFF) >> 8)
+        self.wire_free_us = start + len(value) * WORD_US
+
+    def flush(self):
+        """Finish the frame being sent, called by put() once the strip latched it"""
+        if not self.frame:
+            return
+        frame = tuple(self.frame)
+        self.frame = []
+        self.frames.append((self.frame_us, frame))
+        self.frame_count += 1
+        for listener in frame_listeners:
+            listener(self, self.frame_us, frame)
+
+    def last_frame(self):
+        self.flush()
+        return self.frames[-1][1] if self.frames else None
+
+
+def _now_us():
+    if sim.clock is not None:
+        return sim.clock.us
+    return int(time.perf_counter() * 1000000)
+
+
+def _bswap(word):
+    return int.from_bytes(word.to_bytes(4, "little"), "big")
+
+
+class DMA:
+    def __init__(self):
+        self.busy_until = None
+
+    def pack_ctrl(self, **kwargs):
+        return kwargs
+
+    def active(self, value=None):
+        if value is not None:
+            if not value:
+                self.busy_until = None
+            return None
+        if self.busy_until is None:
+            return False
+        return time.ticks_diff(self.busy_until, time.ticks_us()) > 0
+
+    def config(self, read=None, write=None, count=None, ctrl=None, trigger=False):
+        self.read = read
+        self.write = write
+        self.count = count
+        self.ctrl = ctrl or {}
+        if trigger:
+            self._transfer()
+
+    def _transfer(self):
+        pio = 0 if self.write < PIO_BASE[1] else 1
+        sm = state_machines[pio * 4 + (self.write - PIO_BASE[pio] - PIO_TXF0) // 4]
+        words = self.read[: self.count]
+        if self.ctrl.get("bswap"):
+            words = [_bswap(word) for word in words]
+        sm.put(words)
+        self.busy_until = time.ticks_add(time.ticks_us(), self.count * WORD_US)
+
+    def close(self):
+        pass
@@ -0,0 +1,220 @@
+"""
+Run main.py on the simulated hardware, faster than real time.
+
+The DS1307 starts at --start (UTC), main.py boots, syncs its internal RTC
+from it and runs its asyncio tasks on an event loop driven by the virtual
+clock. Every frame pushed to a strip is recorded by the fake state
+machines, and the host CPU time of every rendered frame is measured.
+Lines for the serial console can be fed with Simulation.console.feed().
+
+With --pty it runs in real time and the serial console is a pseudo
+terminal instead, for host tools like update_time.py.
+
+With --dual-core the frames run on a thread of their own, like on the
+second core of the RP2040, see main.render_core1(). A thread can't share the
+virtual clock, so that runs in real time too.
+
+    python -m sim.run --start 2026-03-29T00:58:00 --seconds 7200
+    python -m sim.run --seconds 600 --profile
+    python -m sim.run --pty --seconds 300
+    python -m sim.run --dual-core --seconds 60
+"""
+
+import argparse
+import asyncio
+import calendar
+import contextlib
+import importlib
+import io
+import sys
+import time
+
+import animation
+import sim
+from sim import machine, rp2
+from sim.aio import Console, PtyConsole, RealTimeLoop, VirtualTimeLoop
+from sim.ds1307 import VirtualDS1307
+
+# The RP2040 RTC starts counting from here after a reset
+BOOT_EPOCH = 1609459200  # 2021-01-01
+# Give up when the firmware resets this many times in a row without rendering a frame
+MAX_BOOT_LOOPS = 10
+# With dual_core, how often the GIL changes hands, in seconds. The CPython default
+# of 5ms would have the two "cores" take turns in slices longer than a frame.
+SWITCH_INTERVAL = 0.0002
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Simulation:
+    def __init__(self, start, drift_ppm=0, verbose=False, pty=False, dual_core=False, realtime=False):
+        self.realtime = realtime or pty or dual_core
+        self.clock = sim.install(virtual=True, epoch=BOOT_EPOCH, realtime=self.realtime)
+        self.ds1307 = VirtualDS1307(self.clock, start, drift_ppm)
+        machine.i2c_devices[self.ds1307.addr] = self.ds1307
+        self.pty = pty
+        self.dual_core = dual_core
+        if dual_core:
+            sys.setswitchinterval(SWITCH_INTERVAL)
+        self.console = PtyConsole() if pty else Console()
+        self.verbose = verbose
+
+        # Per rendered frame: host CPU time and virtual time it kept the core busy
+        self.cpu_us = []
+        self.busy_us = []
+        self.wakeups = 0
+        self.resets = 0
+        self.main = None
+        self.loop = None
+        self.task = None
+        self.boot()
+
+    def output(self):
+        if self.pty:
+            return contextlib.redirect_stdout(self.console)
+        if self.verbose:
+            return contextlib.nullcontext()
+        return contextlib.redirect_stdout(io.StringIO())
+
+    def boot(self):
+        """Cold boot main.py, like after power on or machine.reset()"""
+        if self.loop is not None:
+            self.close()
+        machine.timers.clear()
+        rp2.state_machines.clear()
+        self.clock.set_time(BOOT_EPOCH)
+        sys.modules.pop("main", None)
+
+        self.loop = RealTimeLoop() if self.realtime else VirtualTimeLoop()
+        self.console.attach(self.loop)
+        asyncio.set_event_loop(self.loop)
+        with self.output():
+            self.main = importlib.import_module("main")
+        self.main.open_serial = lambda: self.console
+        self.main.telemetry_output = lambda: self.console.buffer
+        self.main.dual_core = self.dual_core
+        self.instrument()
+        self.task = self.loop.create_task(self.main.run())
+        self.task.add_done_callback(lambda task: self.loop.stop())
+
+    def close(self):
+        """Stop the running main.py where it is, like a reset or a power cut"""
+        self.wakeups += self.loop.selector.wakeups
+        if not self.task.done():
+            # Let the tasks see the cancel, or they are left pending
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError), self.output():
+                self.loop.run_until_complete(self.task)
+        self.loop.close()
+        self.stop_core1()
+
+    def instrument(self):
+        render_frame = self.main.render_frame
+
+        def timed_render_frame(*args):
+            busy_start = self.clock.us
+            cpu_start = time.perf_counter()
+            try:
+                render_frame(*args)
+            finally:
+                self.cpu_us.append((time.perf_counter() - cpu_start) * 1000000)
+                self.busy_us.append(self.clock.us - busy_start)
+
+        self.main.render_frame = timed_render_frame
+
+    def stop_core1(self):
+        """Stop the render thread of the running main.py, a reset stops core 1 too"""
+        self.main.render_running = False
+
+    def strips(self):
+        """State machine id -> fake StateMachine"""
+        return dict(rp2.state_machines)
+
+    def run(self, seconds):
+        end_us = self.clock.us + int(seconds * 1000000)
+        boot_loops = 0
+        while self.clock.us < end_us:
+            frames = len(self.cpu_us)
+            stop = self.loop.call_at(end_us / 1000000, self.loop.stop)
+            with self.output():
+                self.loop.run_forever()
+            stop.cancel()
+            if not self.task.done():
+                break
+
+            error = None if self.task.cancelled() else self.task.exception()
+            if not isinstance(error, machine.Reset):
+                if error is not None:
+                    raise error
+                # main.run() returned, the firmware is done
+                break
+            self.resets += 1
+            boot_loops = 0 if len(self.cpu_us) > frames else boot_loops + 1
+            if boot_loops >= MAX_BOOT_LOOPS:
+                raise RuntimeError("main.py keeps resetting")
+            self.boot()
+        for sm in rp2.state_machines.values():
+            sm.flush()
+
+    def report(self):
+        main = self.main
+        wakeups = self.wakeups + self.loop.selector.wakeups
+        lines = [
+            f"Simulated {self.clock.us / 1000000:.1f}s, {len(self.cpu_us)} frames rendered, "
+            f"{self.resets} resets, {wakeups} loop wakeups",
+            f"Frames since last boot: {main.frames_rendered} rendered, "
+            f"{main.late_frames} late, {main.missed_frames} missed",
+            f"Ring animation: {animation.EFFECTS[main.ring_animation.level]}, "
+            f"dropped {main.ring_animation.drops} times",
+            f"I2C: {machine.i2c_transactions} transactions, {machine.i2c_bytes} bytes",
+            f"Lightsleep: {machine.lightsleeps} times, {machine.lightsleep_us / 1000000:.1f}s",
+        ]
+        for id, sm in sorted(rp2.state_machines.items()):
+            lines.append(f"SM{id}: {sm.frame_count} frames")
+        for label, values in (("host CPU", self.cpu_us), ("virtual busy", self.busy_us)):
+            if values:
+                lines.append(
+                    f"{label} per frame: min {min(values):.0f}us, avg {sum(values) / len(values):.0f}us, "
+                    f"p99 {percentile(values, 0.99):.0f}us, max {max(values):.0f}us"
+                )
+        return "\n".join(lines)
+
+
+def parse_start(value):
+    return calendar.timegm(time.strptime(value, "%Y-%m-%dT%H:%M:%S"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", default="2026-01-01T00:00:00", help="DS1307 time at power on, UTC")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--drift-ppm", type=float, default=0, help="how fast the DS1307 runs")
+    parser.add_argument("--verbose", action="store_true", help="show what main.py prints")
+    parser.add_argument("--profile", action="store_true", help="cProfile the run")
+    parser.add_argument("--pty", action="store_true", help="run in real time with the console on a pty")
+    parser.add_argument("--dual-core", action="store_true", help="render on a thread of its own, in real time")
+    args = parser.parse_args()
+
+    simulation = Simulation(parse_start(args.start), args.drift_ppm, args.verbose, args.pty, args.dual_core)
+    if args.pty:
+        print(f"Serial console on {simulation.console.path}", flush=True)
+    if args.profile:
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.runcall(simulation.run, args.seconds)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    else:
+        simulation.run(args.seconds)
+    simulation.stop_core1()
+    print(simulation.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Binary telemetry over the USB serial console, used by main.py on the clock
+and by telemetry_dump.py on the host.
+
+Every record is RECORD_SIZE bytes, packed with struct: the record type, a
+sequence number that wraps at 256 so the host can count lost records, and
+fields that depend on the type, see FORMATS and FIELDS. Records go into a
+preallocated ring buffer and are written out in batches, as a packet:
+
+    A5 5A <count> <checksum> <count records>
+
+The checksum is the XOR of the record bytes. The packets share the
+console with the text lines, the host finds them by their magic and
+checks them by their checksum, everything else is text.
+
+Telemetry is off after a reset, "telemetry on" on the console starts it.
+The buffer keeps the last CAPACITY records meanwhile, the oldest are
+dropped first.
+"""
+
+import struct
+
+MAGIC = b"\xa5\x5a"
+HEADER_SIZE = 4
+RECORD_SIZE = 16
+CAPACITY = 64
+
+# Record types
+FRAMES = 1
+SYNC = 2
+TIMESET = 3
+RESET = 4
+POWER = 5
+NAMES = {FRAMES: "frames", SYNC: "sync", TIMESET: "timeset", RESET: "reset", POWER: "power"}
+
+# Type and sequence number, then the fields, RECORD_SIZE bytes each
+FORMATS = {
+    FRAMES: "<BBHIIHH",
+    SYNC: "<BBHIii",
+    TIMESET: "<BBHIiI",
+    RESET: "<BBHIIBBBB",
+    POWER: "<BBHIII",
+}
+FIELDS = {
+    # One a second: frames rendered, ticks_ms, slowest frame, latest frame and frames missed
+    FRAMES: ("frames", "ticks_ms", "max_frame_us", "max_late_ms", "missed"),
+    # After every resync: next interval in minutes, UTC time, offset found and drift estimate
+    SYNC: ("interval_min", "epoch", "offset_ms", "drift_ppb"),
+    # After every time set: how it was set, the time set and how late the DS1307 was set
+    TIMESET: ("framed", "epoch", "error_us", "reserved"),
+    # After boot: faults so far, last good time, boot to first frame and the last faults
+    RESET: ("faults", "last_good", "first_frame_ms", "fault0", "fault1", "fault2", "reserved"),
+    # One a second: time of day mode, ticks_ms and the estimated current, see power.py
+    POWER: ("mode", "ticks_ms", "leds_ua", "core_ua"),
+}
+
+
+class Telemetry:
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD_SIZE)
+        self.header = bytearray(HEADER_SIZE)
+        self.header[0:2] = MAGIC
+        # Records written and flushed so far, the ones in between are pending
+        self.written = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.enabled = False
+
+    def record(self, kind, *fields):
+        if self.written - self.flushed == self.capacity:
+            # Full, make room by dropping the oldest
+            self.flushed += 1
+            self.dropped += 1
+        offset = (self.written % self.capacity) * RECORD_SIZE
+        struct.pack_into(FORMATS[kind], self.buffer, offset, kind, self.written & 0xFF, *fields)
+        self.written += 1
+
+    def flush(self, out):
+        """Write the pending records to out as one packet, returns how many. Only when enabled."""
+        pending = min(self.written - self.flushed, 255)
+        if not self.enabled or not pending:
+            return 0
+        first = self.flushed % self.capacity
+        # The pending records wrap around the end of the buffer at most once
+        head = min(pending, self.capacity - first)
+        view = memoryview(self.buffer)
+        chunks = (view[first * RECORD_SIZE : (first + head) * RECORD_SIZE], view[: (pending - head) * RECORD_SIZE])
+        checksum = 0
+        for chunk in chunks:
+            for byte in chunk:
+                checksum ^= byte
+        self.header[2] = pending
+        self.header[3] = checksum
+        out.write(self.header)
+        for chunk in chunks:
+            if len(chunk):
+                out.write(chunk)
+        self.flushed += pending
+        return pending
+
+
+class Decoder:
+    """Host side: feed() it what came over the serial port, it splits off the records"""
+
+    def __init__(self):
+        self.pending = b""
+        self.next_seq = None
+        # Records missing from the sequence, and packets with a bad checksum
+        self.lost = 0
+        self.bad = 0
+
+    def feed(self, data):
+        """(text, records) in data, records are (type name, dict of fields)"""
+        data = self.pending + data
+        text = []
+        records = []
+        while True:
+            start = data.find(MAGIC)
+            if start < 0:
+                # Keep a byte that might be the start of the magic
+                keep = 1 if data.endswith(MAGIC[:1]) else 0
+                text.append(data[: len(data) - keep])
+                data = data[len(data) - keep :]
+                break
+            text.append(data[:start])
+            data = data[start:]
+            if len(data) < HEADER_SIZE:
+                break
+            count = data[2]
+            end = HEADER_SIZE + count * RECORD_SIZE
+            if len(data) < end:
+                break
+            body = data[HEADER_SIZE:end]
+            checksum = 0
+            for byte in body:
+                checksum ^= byte
+            if count == 0 or checksum != data[3] or body[0] not in FORMATS:
+                # Not a packet after all, it is text
+                self.bad += 1
+                text.append(data[:1])
+                data = data[1:]
+                continue
+            for offset in range(0, len(body), RECORD_SIZE):
+                records.append(self.unpack(body, offset))
+            data = data[end:]
+        self.pending = data
+        return b"".join(text), records
+
+    def unpack(self, body, offset):
+        kind = body[offset]
+        values = struct.unpack_from(FORMATS[kind], body, offset)
+        seq = values[1]
+        if self.next_seq is not None:
+            self.lost += (seq - self.next_seq) & 0xFF
+        self.next_seq = (seq + 1) & 0xFF
+        return NAMES[kind], dict(zip(FIELDS[kind], values[2:]))
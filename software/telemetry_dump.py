@@ -0,0 +1,167 @@
+"""
+Stream the binary telemetry of a clock into CSV or Parquet files.
+
+    python telemetry_dump.py /dev/ttyACM0 --csv logs/
+    python telemetry_dump.py /dev/ttyACM0 --parquet logs/ --seconds 3600
+    python telemetry_dump.py /dev/ttyACM0 --raw capture.bin
+    python telemetry_dump.py --input capture.bin --csv logs/
+
+It turns telemetry on with "telemetry on" on the console and keeps writing
+until it is stopped with Ctrl-C or --seconds ran out, then turns it off
+again. Every record type gets its own file in the output directory,
+frames.csv, sync.csv and so on, with the host time the record arrived as
+the first column. Parquet needs pyarrow, the rows are written in row groups
+of ROW_GROUP. The text the clock prints in between is shown with --text.
+
+The records and the packets are described in telemetry.py.
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+import telemetry
+
+ROW_GROUP = 1024
+READ_SIZE = 4096
+
+
+class CsvSink:
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        self.writers = {}
+
+    def write(self, name, rows):
+        if name not in self.writers:
+            f = open(os.path.join(self.directory, f"{name}.csv"), "w", newline="")
+            self.files[name] = f
+            self.writers[name] = csv.DictWriter(f, fieldnames=list(rows[0]))
+            self.writers[name].writeheader()
+        self.writers[name].writerows(rows)
+        self.files[name].flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+class ParquetSink:
+    def __init__(self, directory):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.directory = directory
+        self.writers = {}
+        self.rows = {}
+
+    def write(self, name, rows):
+        self.rows.setdefault(name, []).extend(rows)
+        if len(self.rows[name]) >= ROW_GROUP:
+            self.write_group(name)
+
+    def write_group(self, name):
+        rows = self.rows[name]
+        if not rows:
+            return
+        table = self.pyarrow.Table.from_pylist(rows)
+        if name not in self.writers:
+            path = os.path.join(self.directory, f"{name}.parquet")
+            self.writers[name] = self.parquet.ParquetWriter(path, table.schema)
+        self.writers[name].write_table(table)
+        self.rows[name] = []
+
+    def close(self):
+        for name in list(self.rows):
+            self.write_group(name)
+        for writer in self.writers.values():
+            writer.close()
+
+
+# Decode what read() returns into the sinks, until it returns None or --seconds ran out.
+# counts is records per type so far.
+def dump(read, decoder, counts, sinks, args):
+    end = time.monotonic() + args.seconds if args.seconds else None
+    while end is None or time.monotonic() < end:
+        data = read()
+        if data is None:
+            break
+        if not data:
+            continue
+        text, records = decoder.feed(data)
+        if args.text and text:
+            sys.stderr.write(text.decode(errors="replace"))
+        batches = {}
+        now = time.time()
+        for name, fields in records:
+            batches.setdefault(name, []).append({"host_time": now, **fields})
+        for name, rows in batches.items():
+            counts[name] = counts.get(name, 0) + len(rows)
+            for sink in sinks:
+                sink.write(name, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("port", nargs="?", help="serial port of the clock")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--input", help="decode a capture made with --raw instead of a port")
+    parser.add_argument("--csv", help="directory for the CSV files")
+    parser.add_argument("--parquet", help="directory for the Parquet files")
+    parser.add_argument("--raw", help="also keep everything that came in, for --input")
+    parser.add_argument("--seconds", type=float, help="stop after this long")
+    parser.add_argument("--text", action="store_true", help="show the text the clock prints")
+    args = parser.parse_args()
+    if (args.port is None) == (args.input is None):
+        parser.error("needs a port or --input")
+
+    sinks = []
+    for directory, sink in ((args.csv, CsvSink), (args.parquet, ParquetSink)):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            sinks.append(sink(directory))
+    raw = open(args.raw, "wb") if args.raw else None
+
+    port = None
+    if args.input:
+        source = open(args.input, "rb")
+
+        def read():
+            return source.read(READ_SIZE) or None
+
+    else:
+        import serial
+
+        port = serial.Serial(args.port, args.baud, timeout=0.2)
+        port.write(b"telemetry on\r\n")
+
+        def read():
+            data = port.read(READ_SIZE)
+            if raw is not None:
+                raw.write(data)
+            return data
+
+    decoder = telemetry.Decoder()
+    counts = {}
+    try:
+        dump(read, decoder, counts, sinks, args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if port is not None:
+            port.write(b"telemetry off\r\n")
+            port.close()
+        if raw is not None:
+            raw.close()
+        for sink in sinks:
+            sink.close()
+    summary = ", ".join(f"{count} {name}" for name, count in sorted(counts.items())) or "no records"
+    print(f"{summary}, {decoder.lost} lost, {decoder.bad} damaged packets")
+
+
+if __name__ == "__main__":
+    main()
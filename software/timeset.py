@@ -0,0 +1,74 @@
+"""
+Framed time-set protocol for the serial console, used by main.py on the clock
+and by update_time.py on the host.
+
+A frame is one line, so frames share the console with the plain text
+commands and everything else the clock prints:
+
+    $TC,<command>,<seq>[,<field>...]*<checksum>
+
+The checksum is the XOR of every character between $ and *, as two hex
+digits, like NMEA 0183.
+
+    host    $TC,PING,<seq>
+    clock   $TC,PONG,<seq>,<hold_us>
+        hold_us is the time between reading the PING and answering it. The host
+        repeats this and keeps the fastest round trip, minus hold_us, as the
+        link delay, the one way delay is half of it.
+    host    $TC,SET,<seq>,<epoch>,<in_us>
+        Set the clock to epoch (UTC seconds) in_us after the frame was read,
+        that is the moment epoch starts on the host.
+    clock   $TC,ACK,<seq>,<epoch>,<error_us>
+        The DS1307 was set error_us after the moment asked for.
+    clock   $TC,NAK,<seq>,<reason>
+
+Settings, each answered with $TC,ACK,<seq> or a NAK:
+
+    host    $TC,TZ,<seq>,<POSIX TZ string>
+    host    $TC,COLOR,<seq>,<r>,<g>,<b>,<ring r>,<ring g>,<ring b>
+    host    $TC,BRIGHT,<seq>,<1-255>
+    host    $TC,TEXT,<seq>,<message>
+        Scroll the message over the digits once, see font.py
+    host    $TC,GET,<seq>
+    clock   $TC,CONF,<seq>,<brightness>,<r>,<g>,<b>,<ring r>,<ring g>,<ring b>,<UTC epoch>,<TZ string>
+
+A TZ string or a message can have commas of its own, so it always comes
+last and is the rest of the frame.
+"""
+
+START = "$TC,"
+
+
+def checksum(body):
+    value = 0
+    for c in body:
+        value ^= ord(c)
+    return value
+
+
+def encode(*fields):
+    body = "TC," + ",".join([str(field) for field in fields])
+    return f"${body}*{checksum(body):02X}"
+
+
+def is_frame(line):
+    return line.lstrip().startswith(START)
+
+
+# The fields after TC of a frame line, raises ValueError for a broken frame
+def decode(line):
+    line = line.strip()
+    star = line.rfind("*")
+    if not line.startswith(START) or star < 0:
+        raise ValueError("not a frame")
+    body = line[1:star]
+    try:
+        expected = int(line[star + 1 :], 16)
+    except ValueError:
+        raise ValueError("bad checksum")
+    if checksum(body) != expected:
+        raise ValueError("bad checksum")
+    fields = body.split(",")[1:]
+    if len(fields) < 2:
+        raise ValueError("short frame")
+    return fields
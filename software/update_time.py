@@ -1,13 +1,115 @@
+"""
+Set the clock to the host's UTC time over its USB serial console.
+
+    python update_time.py /dev/tty.usbmodem2111301
+    python update_time.py --pings 16 /dev/ttyACM0
+
+A few PING/PONG round trips measure the link delay first, the fastest one is
+kept like NTP does. Then the SET for an upcoming whole second is sent
+lead_ms before that second starts, telling the clock how long after reading
+the frame the second starts. The clock waits for that moment and writes the
+DS1307 right on it, so the result is only off by the asymmetry of the link.
+The host clock should be NTP synced, it is the reference.
+
+The protocol is described in timeset.py.
+"""
+
+import argparse
+import time
+
 import serial
-import datetime
 
-current_utc = datetime.datetime.utcnow()
-ser = serial.Serial("/dev/tty.usbmodem2111301", 115200, timeout=1)
+import timeset
+
+
+class TimeSetError(Exception):
+    pass
+
+
+# Next frame line answering seq, other output of the clock is skipped
+def read_frame(port, seq, timeout):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        line = port.readline()
+        if not line:
+            continue
+        line = line.decode(errors="replace")
+        if not timeset.is_frame(line):
+            continue
+        try:
+            fields = timeset.decode(line)
+        except ValueError:
+            continue
+        if fields[1] == str(seq):
+            return fields
+    raise TimeSetError(f"no answer to frame {seq}")
+
+
+def send(port, *fields):
+    port.write((timeset.encode(*fields) + "\r\n").encode())
+    port.flush()
+
+
+# One way link delay in us, from the fastest of pings round trips
+def measure(port, pings, seq=1):
+    best = None
+    for i in range(pings):
+        sent = time.perf_counter_ns()
+        send(port, "PING", seq + i)
+        fields = read_frame(port, seq + i, 1)
+        rtt_us = (time.perf_counter_ns() - sent) // 1000
+        if fields[0] != "PONG":
+            raise TimeSetError(f"unexpected answer {fields}")
+        delay_us = rtt_us - int(fields[2])
+        if best is None or delay_us < best:
+            best = delay_us
+    return best // 2
+
+
+# Set the clock to the start of an upcoming UTC second, returns (epoch, error_us) from the ACK
+def set_clock(port, one_way_us, lead_ms=300, seq=100):
+    lead_ns = lead_ms * 1000000
+    epoch = time.time_ns() // 1000000000 + 1
+    while epoch * 1000000000 - time.time_ns() < lead_ns:
+        epoch += 1
+    send_at = epoch * 1000000000 - lead_ns
+    # Sleep most of the way, then spin, so the SET leaves close to send_at
+    remaining = send_at - time.time_ns()
+    if remaining > 5000000:
+        time.sleep((remaining - 5000000) / 1000000000)
+    while time.time_ns() < send_at:
+        pass
+
+    in_us = (epoch * 1000000000 - time.time_ns()) // 1000 - one_way_us
+    send(port, "SET", seq, epoch, in_us)
+    fields = read_frame(port, seq, 3)
+    if fields[0] != "ACK":
+        raise TimeSetError(f"clock refused: {','.join(fields[2:])}")
+    return int(fields[2]), int(fields[3])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("port", help="serial port of the clock")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--pings", type=int, default=8, help="round trips to measure the link delay")
+    parser.add_argument("--lead-ms", type=int, default=300, help="send the SET this long before the second")
+    args = parser.parse_args()
+
+    port = serial.Serial(args.port, args.baud, timeout=0.2)
+    try:
+        port.reset_input_buffer()
+        one_way_us = measure(port, args.pings)
+        print(f"Link delay: {one_way_us}us one way")
+        epoch, error_us = set_clock(port, one_way_us, args.lead_ms)
+        t = time.gmtime(epoch)
+        print(
+            f"Clock set to {t[0]}-{t[1]:02d}-{t[2]:02d} {t[3]:02d}:{t[4]:02d}:{t[5]:02d} UTC, "
+            f"{error_us}us after the second started"
+        )
+    finally:
+        port.close()
 
-timestring = f"{current_utc.year}, {current_utc.month}, {current_utc.day}, 0, {current_utc.hour}, {current_utc.minute}, {current_utc.second}"
-print(timestring)
-ser.write(bytes(timestring, encoding="utf-8"))
-ser.write("\r\n".encode())
-print(ser.readlines())
 
-ser.close()
+if __name__ == "__main__":
+    main()
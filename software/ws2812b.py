@@ -23,12 +23,46 @@ def ws2812():
     wrap()
 
 
+# Time on the wire for one pixel: 24 bits at 800kHz
+PIXEL_US = 30
+
+# TX FIFO register of a state machine and the DREQ that paces writes to it
+PIO_BASE = (0x50200000, 0x50300000)
+PIO_TXF0 = 0x10
+DREQ_PIO_TX0 = (0, 8)
+
+
 # delay here is the reset time. You need a pause to reset the LED strip back to the initial LED
 # however, if you have quite a bit of processing to do before the next time you update the strip
 # you could put in delay=0 (or a lower delay)
+#
+# dma selects the transmit engine: True sends the frame with a DMA channel, False with a single
+# sm.put() of the whole array, None picks DMA if this MicroPython has rp2.DMA.
+# With DMA show() returns as soon as the transfer is started. sm.put() only returns once the
+# last word is in the 4 word TX FIFO, so without DMA show() blocks until all but the last 4
+# pixels are on the wire, PIXEL_US each, about 2ms for the 68 LEDs of the digits.
+# Either way use busy() or wait() to know when the frame is out and latched.
+#
+# gamma applies a gamma curve (e.g. 2.8) to every color channel, None leaves the values linear.
+#
+# pixels and shown can be passed in to make the strip a view into a bigger buffer, see ws2812b_group.
 class ws2812b:
-    def __init__(self, num_leds, state_machine, pin, delay=0.001):
-        self.pixels = array.array("I", [0 for _ in range(num_leds)])
+    def __init__(
+        self,
+        num_leds,
+        state_machine,
+        pin,
+        delay=0.001,
+        dma=None,
+        gamma=None,
+        pixels=None,
+        shown=None,
+    ):
+        if pixels is None:
+            pixels = array.array("I", [0 for _ in range(num_leds)])
+        if shown is None:
+            shown = array.array("I", [0 for _ in range(num_leds)])
+        self.pixels = pixels
         self.sm = rp2.StateMachine(
             state_machine, ws2812, freq=8000000, sideset_base=Pin(pin)
         )
@@ -36,6 +70,34 @@ class ws2812b:
         self.num_leds = num_leds
         self.delay = delay
         self.brightnessvalue = 255
+        self.gammavalue = gamma
+        # Channel value -> output value with brightness and gamma applied, see build_lut()
+        self.lut = bytearray(256)
+        self.build_lut()
+        # Copy of the last frame pushed to the strip, used to skip redundant shows.
+        # This is also what the DMA reads from, so pixels can be changed during a transfer.
+        self.shown = shown
+        # Make sure the first show_if_changed() always sends
+        self.shown[0] = 0xFFFFFFFF
+        # ticks_us when the last frame, including the reset pause, is out on the strip
+        self.done_at = time.ticks_us()
+
+        if dma is None:
+            dma = hasattr(rp2, "DMA")
+        self.dma = None
+        if dma:
+            pio, sm_num = state_machine // 4, state_machine % 4
+            self.dma = rp2.DMA()
+            self.dma_write = PIO_BASE[pio] + PIO_TXF0 + 4 * sm_num
+            # The DMA can't shift, so pixels are stored green/red/blue from the low byte up and
+            # the DMA byte swaps them into the 0xGGRRBB00 word the PIO program shifts out
+            self.dma_ctrl = self.dma.pack_ctrl(
+                size=2,
+                inc_read=True,
+                inc_write=False,
+                treq_sel=DREQ_PIO_TX0[pio] + sm_num,
+                bswap=True,
+            )
 
     # Set the overal value to adjust brightness when updating leds
     def brightness(self, brightness=None):
@@ -46,7 +108,25 @@ class ws2812b:
                 brightness = 1
         if brightness > 255:
             brightness = 255
-        self.brightnessvalue = brightness
+        if brightness != self.brightnessvalue:
+            self.brightnessvalue = brightness
+            self.build_lut()
+
+    # Set the gamma curve applied to every channel, None for linear
+    def set_gamma(self, gamma):
+        self.gammavalue = gamma
+        self.build_lut()
+
+    # Precompute brightness and gamma for every channel value, so packing a color is
+    # three table lookups instead of float math. Only rebuilt when either changes.
+    def build_lut(self):
+        brightness = self.brightnessvalue
+        gamma = self.gammavalue
+        for i in range(256):
+            level = i
+            if gamma is not None:
+                level = int((i / 255) ** gamma * 255 + 0.5)
+            self.lut[i] = (level * brightness + 127) // 255
 
     # Create a gradient with two RGB colors between "pixel1" and "pixel2" (inclusive)
     def set_pixel_line_gradient(
@@ -65,47 +145,227 @@ class ws2812b:
 
         right_pixel = max(pixel1, pixel2)
         left_pixel = min(pixel1, pixel2)
+        span = right_pixel - left_pixel
 
-        for i in range(right_pixel - left_pixel + 1):
-            fraction = i / (right_pixel - left_pixel)
-            red = round((right_red - left_red) * fraction + left_red)
-            green = round((right_green - left_green) * fraction + left_green)
-            blue = round((right_blue - left_blue) * fraction + left_blue)
+        # 16.16 fixed point, so there are no floats to allocate per pixel
+        red = left_red << 16
+        green = left_green << 16
+        blue = left_blue << 16
+        red_step = ((right_red - left_red) << 16) // span
+        green_step = ((right_green - left_green) << 16) // span
+        blue_step = ((right_blue - left_blue) << 16) // span
 
-            self.set_pixel(left_pixel + i, red, green, blue)
+        for i in range(span + 1):
+            self.set_pixel(
+                left_pixel + i,
+                (red + 0x8000) >> 16,
+                (green + 0x8000) >> 16,
+                (blue + 0x8000) >> 16,
+            )
+            red += red_step
+            green += green_step
+            blue += blue_step
 
     # Set an array of pixels starting from "pixel1" to "pixel2" to the desired color.
     def set_pixel_line(self, pixel1, pixel2, red, green, blue):
         for i in range(pixel1, pixel2 + 1):
             self.set_pixel(i, red, green, blue)
 
-    def set_pixel(self, pixel_num, red, green, blue):
+    # Pack a color into the pixel format, with the brightness applied
+    def pack(self, red, green, blue):
         # Adjust color values with brightnesslevel
-        blue = round(blue * (self.brightness() / 255))
-        red = round(red * (self.brightness() / 255))
-        green = round(green * (self.brightness() / 255))
+        lut = self.lut
+        if self.dma is not None:
+            return lut[green] | lut[red] << 8 | lut[blue] << 16
+        return lut[blue] | lut[red] << 8 | lut[green] << 16
 
-        self.pixels[pixel_num] = blue | red << 8 | green << 16
+    def set_pixel(self, pixel_num, red, green, blue):
+        self.pixels[pixel_num] = self.pack(red, green, blue)
 
     # rotate x pixels to the left
+    # Works in place, so it doesn't allocate and the views of a ws2812b_group stay valid
     def rotate_left(self, num_of_pixels):
         if num_of_pixels == None:
             num_of_pixels = 1
-        self.pixels = self.pixels[num_of_pixels:] + self.pixels[:num_of_pixels]
+        n = self.num_leds
+        k = num_of_pixels % n
+        if k == 0:
+            return
+
+        # The rotation falls apart into gcd(n, k) cycles, walk each one so every pixel moves once
+        cycles, b = n, k
+        while b:
+            cycles, b = b, cycles % b
+        pixels = self.pixels
+        for start in range(cycles):
+            first = pixels[start]
+            i = start
+            while True:
+                j = i + k
+                if j >= n:
+                    j -= n
+                if j == start:
+                    break
+                pixels[i] = pixels[j]
+                i = j
+            pixels[i] = first
 
     # rotate x pixels to the right
     def rotate_right(self, num_of_pixels):
         if num_of_pixels == None:
             num_of_pixels = 1
-        num_of_pixels = -1 * num_of_pixels
-        self.pixels = self.pixels[num_of_pixels:] + self.pixels[:num_of_pixels]
+        self.rotate_left(-1 * num_of_pixels)
+
+    # True while the last frame is still going out or the strip hasn't latched it yet
+    def busy(self):
+        if self.dma is not None and self.dma.active():
+            return True
+        return time.ticks_diff(self.done_at, time.ticks_us()) > 0
+
+    # Awaitable version of busy(), for use from asyncio tasks
+    async def wait(self):
+        import asyncio
+
+        while self.busy():
+            await asyncio.sleep(0)
+
+    # Start sending the shown buffer with the DMA, returns immediately
+    def start_dma(self):
+        self.dma.config(
+            read=self.shown,
+            write=self.dma_write,
+            count=self.num_leds,
+            ctrl=self.dma_ctrl,
+            trigger=True,
+        )
+
+    # Remember when the frame that was just started is out on the strip and latched
+    def sent(self):
+        self.done_at = time.ticks_add(
+            time.ticks_us(), self.num_leds * PIXEL_US + int(self.delay * 1000000)
+        )
 
     def show(self):
-        for i in range(self.num_leds):
-            self.sm.put(self.pixels[i], 8)
-        time.sleep(self.delay)
+        # Don't overwrite a frame that is still being sent or latched
+        while self.busy():
+            pass
+
+        self.shown[:] = self.pixels
+        if self.dma is not None:
+            self.start_dma()
+        else:
+            # Blocks until all but the last 4 words are in the TX FIFO
+            self.sm.put(self.shown, 8)
+        self.sent()
+
+    # Only push the buffer if it differs from the last frame sent, returns True if it did
+    def show_if_changed(self):
+        if self.pixels == self.shown:
+            return False
+        self.show()
+        return True
 
     def fill(self, red, green, blue):
+        color = self.pack(red, green, blue)
+        pixels = self.pixels
         for i in range(self.num_leds):
-            self.set_pixel(i, red, green, blue)
-        time.sleep(self.delay)
+            pixels[i] = color
+
+
+# Several strips, each on its own state machine, sharing one contiguous pixel buffer.
+# strips is a list of (name, num_leds, state_machine, pin), every strip is a ws2812b
+# whose pixels are a view into the shared buffer and can be looked up by name:
+#
+#   strips = ws2812b_group((("ring", 60, 0, 0), ("digits", 68, 1, 1)))
+#   strips["digits"].set_pixel(0, 10, 0, 0)
+#   strips.show()
+#
+# show() commits all strips in one call, so they go out at the same time: with DMA every
+# strip gets its own channel and show() returns right away, without DMA the pushes are
+# interleaved FIFO sized chunk by chunk and show() blocks while they go out, see ws2812b.
+# show_us is the time the last commit took, wire_us how long until every strip had its frame.
+class ws2812b_group:
+    # Words per put() when interleaving, the depth of a TX FIFO
+    chunk = 4
+
+    def __init__(self, strips, delay=0.001, dma=None, gamma=None):
+        total = 0
+        for strip in strips:
+            total += strip[1]
+        self.pixels = array.array("I", [0 for _ in range(total)])
+        self.shown = array.array("I", [0 for _ in range(total)])
+        pixels = memoryview(self.pixels)
+        shown = memoryview(self.shown)
+
+        self.strips = {}
+        self.order = []
+        start = 0
+        for name, num_leds, state_machine, pin in strips:
+            end = start + num_leds
+            strip = ws2812b(
+                num_leds,
+                state_machine,
+                pin,
+                delay,
+                dma,
+                gamma,
+                pixels[start:end],
+                shown[start:end],
+            )
+            self.strips[name] = strip
+            self.order.append(strip)
+            start = end
+        self.dma = self.order[0].dma is not None
+
+        # (state machine, words) in the order they are pushed when interleaving
+        self.chunks = []
+        longest = max(strip.num_leds for strip in self.order)
+        for i in range(0, longest, self.chunk):
+            for strip in self.order:
+                if i < strip.num_leds:
+                    self.chunks.append((strip.sm, strip.shown[i : i + self.chunk]))
+
+        self.show_us = 0
+        self.wire_us = 0
+
+    def __getitem__(self, name):
+        return self.strips[name]
+
+    def busy(self):
+        for strip in self.order:
+            if strip.busy():
+                return True
+        return False
+
+    async def wait(self):
+        for strip in self.order:
+            await strip.wait()
+
+    def show(self):
+        start = time.ticks_us()
+        while self.busy():
+            pass
+
+        self.shown[:] = self.pixels
+        if self.dma:
+            for strip in self.order:
+                strip.start_dma()
+        else:
+            # Blocks until the longest strip is all but its last chunk on the wire
+            for sm, words in self.chunks:
+                sm.put(words, 8)
+
+        done_at = start
+        for strip in self.order:
+            strip.sent()
+            if time.ticks_diff(strip.done_at, done_at) > 0:
+                done_at = strip.done_at
+        self.show_us = time.ticks_diff(time.ticks_us(), start)
+        self.wire_us = time.ticks_diff(done_at, start)
+
+    # Only commit if any strip differs from the last frame sent, returns True if it did
+    def show_if_changed(self):
+        if self.pixels == self.shown:
+            return False
+        self.show()
+        return True